@@ -1,14 +1,40 @@
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from app.config import settings
+from app.forms.user_form import DoneTaskForm, ForwardTaskForm
 from app.handlers import other_handlers, done_handlers, forward_handlers
+from app.middlewares.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from app.middlewares.update_context import UpdateContextMiddleware
+from app.middlewares.throttling import ThrottlingMiddleware, MemoryThrottleBackend, RedisThrottleBackend
+from app.services.fsm_storage import create_fsm_storage
+from app.services.redis_data import r
+from app.services.sender import send_scheduler
 
-storage = MemoryStorage()  # Подключаем RedisStorage к боту
+storage, events_isolation = create_fsm_storage()
 
-bot = Bot(token=settings.bot_token, parse_mode='HTML')
-dp = Dispatcher(bot=bot, storage=storage)
+session = AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_url)) \
+    if settings.telegram_api_url else None
 
-# dp.update.middleware(ThrottlingMiddleware(rate_limit=2.0))
+bot = Bot(token=settings.bot_token, parse_mode='HTML', session=session)
+bot.session.middleware(send_scheduler)  # Лимиты Telegram и повтор на RetryAfter для всех запросов
+dp = Dispatcher(bot=bot, storage=storage, events_isolation=events_isolation)
+
+if settings.throttle_backend == 'redis':
+    throttle_backend = RedisThrottleBackend(r, settings.throttle_rate, settings.throttle_burst)
+else:
+    throttle_backend = MemoryThrottleBackend(settings.throttle_rate, settings.throttle_burst,
+                                             max_keys=settings.throttle_max_keys)
+# Комментарий к задаче не отбрасывается ограничением частоты
+throttling = ThrottlingMiddleware(throttle_backend, duplicate_window=settings.throttle_duplicate_window,
+                                  exempt_states=(DoneTaskForm.worker_comment.state, ForwardTaskForm.comment.state))
+dp.update.outer_middleware(UpdateContextMiddleware())
+dp.update.outer_middleware(UpdateMetricsMiddleware())
+dp.message.outer_middleware(throttling)
+dp.callback_query.outer_middleware(throttling)
+handler_metrics = HandlerMetricsMiddleware()
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
 
 # Регистрируем обработчики
 
@@ -23,9 +23,77 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_username: Optional[str] = os.getenv('REDIS_USERNAME')
     redis_password: Optional[str] = os.getenv('REDIS_PASSWORD')
+    redis_max_connections: int = 50
+    redis_task_ttl: int = 180
+    task_cache_size: int = 1024
+    task_cache_ttl: int = 60
+    reference_refresh_interval: int = 600
+    identity_cache_size: int = 10000
+    identity_cache_ttl: int = 600
+    census_token_ttl: int = 3600
+    reference_load_timeout: float = 10.0
+    reference_max_age: int = 86400
+    api_timeout: float = 30.0
+    api_timeouts: dict[str, float] = {}
+    api_max_connections: int = 100
+    api_max_keepalive_connections: int = 20
+    api_keepalive_expiry: float = 30.0
+    telegram_global_rate: float = 30.0
+    telegram_chat_rate: float = 1.0
+    telegram_chat_burst: float = 3.0
+    telegram_max_retries: int = 3
+    send_drain_timeout: float = 10.0
+    completion_step_attempts: int = 3
+    completion_retry_delay: float = 0.5
+    completion_state_ttl: int = 3600
+    outbox_enabled: bool = True  # False - запись в 1С внутри хэндлера, пользователь ждёт ответа API
+    outbox_max_attempts: int = 5
+    outbox_retry_delay: float = 5.0
+    outbox_poll_interval: float = 0.2
+    outbox_claim_idle: float = 60.0  # не меньше худшего времени записи, см. TaskWritePipeline.max_duration
+    outbox_lease: float = 30.0  # аренда записей чата потребителем, продлевается каждые lease/3 секунд
+    fsm_storage: str = "redis"  # redis - общее для всех воркеров, memory - только для одного процесса
+    fsm_state_ttl: int = 86400
+    fsm_data_ttl: int = 86400
+    telegram_api_url: str = ""  # пусто - api.telegram.org; локальный Bot API сервер или заглушка
+    throttle_backend: str = "memory"  # memory - счётчики процесса, redis - общие для всех воркеров
+    throttle_rate: float = 1.0
+    throttle_burst: float = 5.0
+    throttle_duplicate_window: float = 1.0
+    throttle_max_keys: int = 10000
+    webhook_mode: str = "sync"  # sync - обработка внутри запроса webhook, queue - через очередь апдейтов
+    update_workers: int = 8
+    update_queue_size: int = 1000
+    update_put_timeout: float = 1.0
+    update_drain_timeout: float = 10.0
+    startup_mode: str = "diff"  # diff - webhook и меню меняются, только если отличаются; full - всегда
+    webhook_setup_attempts: int = 5  # попытки установить webhook при запуске до отказа
+    webhook_setup_retry_delay: float = 1.0  # пауза после первой неудачи, дальше удваивается
+    delete_webhook_on_shutdown: bool = False  # False - Telegram копит апдейты до запуска нового процесса
+    api_warm_connections: int = 4  # соединения, открываемые при запуске
+    redis_warm_connections: int = 4
+    telegram_warm_connections: int = 2
+    loop_watchdog_enabled: bool = True
+    loop_lag_interval: float = 0.1  # период замера задержки event loop, секунды
+    loop_lag_threshold: float = 0.25  # блокировка дольше порога логируется со стеком
+    log_queue_size: int = 10000  # записи сверх очереди отбрасываются, event loop не ждёт
+    log_max_arg_length: int = 2000  # длинные аргументы сообщений (данные state, ответы API) обрезаются
+    log_info_sample_rate: float = 1.0  # доля сохраняемых INFO; WARNING и выше - всегда
+    log_max_bytes: int = 50 * 1024 * 1024  # размер файла лога до ротации
+    log_backup_count: int = 5
+    record_updates_path: str = ""  # файл для записи обезличенных апдейтов; пусто - запись выключена
+    record_salt: str = ""  # соль для обезличивания id; пусто - производная от токена бота
+    task_list_mode: str = "cards"  # cards - карточка на задачу, digest - одно сообщение со страницами
+    digest_page_size: int = 5
+    task_card_cache_size: int = 4096  # готовые карточки задач по (номер, вариант, edit_date)
+    task_card_cache_ttl: int = 3600
+    keyboard_cache_size: int = 256  # клавиатур выбора на каждый вид (результаты, адресаты и т.п.)
+    digest_cache_ttl: int = 600
     soft_collection_user_code: str = "SoftCollect"
     constant_comment_id: int = 2
     delete_message_timer: int = 2
+    forward_message_timer: int = 5
+    deferred_poll_interval: float = 0.5
 
     class Config:
         env_file = ".env"
@@ -44,7 +112,22 @@ API_METHODS = {
     'supervisors': 'supervisors/',
     'auth': 'token-auth/',
     'worker_detail': 'workers/',
-    'supervisor_detail': 'supervisors/'
+    'supervisor_detail': 'supervisors/',
+    'tasks_f': 'tasks_f/',
+    'all-tasks': 'all-tasks/',
+    'worker_comment': 'worker_comment/',
+    'author_comment': 'author_comment/',
+}
+
+# Таймауты запросов по ключам API_METHODS, секунды; переопределяются через API_TIMEOUTS в .env
+API_TIMEOUTS = {
+    'tasks_f': 15.0,
+    'all-tasks': 10.0,
+    'workers_f': 10.0,
+    'worker_detail': 10.0,
+    'partner-worker_f': 10.0,
+    'result-data_f': 10.0,
+    'result-data': 10.0,
 }
 
 TASK_GROUP = {
@@ -57,9 +140,6 @@ CENSUS = '000000004'
 
 DEBIT = '000000002'
 
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
 LOGGING_CONFIG = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -68,6 +148,9 @@ LOGGING_CONFIG = {
             'format': '%(filename)s:%(lineno)d #%(levelname)-8s '
                       '[%(asctime)s] - %(name)s - %(message)s'
         },
+        'json': {
+            '()': 'app.services.log_handlers.JsonFormatter',
+        },
         'my_verbose': {
             'format': 'TASK_BOT - %(filename)s:%(lineno)d - <b>%(levelname)-8s</b> - '
                       '<i> [%(asctime)s]</i> - %(message)s'
@@ -79,20 +162,29 @@ LOGGING_CONFIG = {
             'formatter': 'verbose',
         },
         'info_file_handler': {
-            'class': 'logging.FileHandler',
-            'formatter': 'verbose',
-            'filename': 'logs/info.log'
+            'class': 'logging.handlers.RotatingFileHandler',
+            'formatter': 'json',
+            'filename': 'logs/info.{pid}.jsonl',
+            'maxBytes': settings.log_max_bytes,
+            'backupCount': settings.log_backup_count,
+            'encoding': 'utf-8',
         },
         'error_file_handler': {
-            'class': 'logging.FileHandler',
-            'formatter': 'verbose',
-            'filename': 'logs/error.log',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'formatter': 'json',
+            'filename': 'logs/error.{pid}.jsonl',
+            'maxBytes': settings.log_max_bytes,
+            'backupCount': settings.log_backup_count,
+            'encoding': 'utf-8',
             'level': logging.ERROR,
         },
         'telegram_warning': {
             'class': 'app.services.log_handlers.SafeTelegramLogsHandler',
             'formatter': 'my_verbose',
-            'level': 'ERROR'
+            'level': 'ERROR',
+            'queue_size': 1000,
+            'group_window': 60.0,
+            'min_interval': 1.0,
         },
     },
     'loggers': {
@@ -139,6 +231,29 @@ LOGGING_CONFIG = {
     }
 }
 
-logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger('bot')
-logger.info("Логгер успешно настроен!")
\ No newline at end of file
+log_listener = None
+
+
+def setup_logging():
+    """Применение LOGGING_CONFIG и запуск потока логов.
+
+    Вызывается точкой входа (app.main), а не при импорте: скрипты и бенчмарки,
+    импортирующие настройки, не открывают файлы логов и не запускают потоки.
+    """
+    global log_listener
+    if log_listener is not None:
+        return log_listener
+    from app.services.log_handlers import install_queue_logging
+
+    os.makedirs('logs', exist_ok=True)
+    # Каждый процесс (воркер uvicorn) пишет и ротирует свои файлы: общий файл
+    # RotatingFileHandler нескольких процессов ротируют наперегонки и теряют строки
+    for name in ('info_file_handler', 'error_file_handler'):
+        handler = LOGGING_CONFIG['handlers'][name]
+        handler['filename'] = handler['filename'].format(pid=os.getpid())
+    logging.config.dictConfig(LOGGING_CONFIG)
+    log_listener = install_queue_logging(LOGGING_CONFIG['loggers'], settings.log_queue_size,
+                                         settings.log_max_arg_length, settings.log_info_sample_rate)
+    logger.info("Логгер успешно настроен!")
+    return log_listener
\ No newline at end of file
@@ -1,405 +1,300 @@
 import logging
-import json
 import asyncio
-import httpx
-from app.config import settings, API_METHODS
-from app.services.utils import comparison
-from app.services.redis_data import save_to_redis, get_on_redis
+from app.config import settings, API_METHODS, TASK_GROUP, CENSUS, DEBIT
+from app.services.api_client import api_client
+from app.services.utils import comparison, token_generator, run_concurrently
+from app.services.cache import AsyncTTLCache
+from app.services.reference_cache import ReferenceCache
+from app.services.redis_data import save_to_redis, save_many_to_redis, redis_clear_many, get_on_redis
 
 logger = logging.getLogger(__name__)
 
-http_client = None
-
-async def get_http_client():
-    """Получение глобального HTTP клиента"""
-    global http_client
-    if http_client is None or http_client.is_closed:
-        http_client = httpx.AsyncClient(
-            timeout=30.0,
-            limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
-        )
-    return http_client
-
-async def close_http_client():
-    """Закрытие глобального HTTP клиента"""
-    global http_client
-    if http_client and not http_client.is_closed:
-        await http_client.aclose()
-        http_client = None
-
-def get_token():
-    return settings.api_token
-
 
 async def get_workers_number(worker_number):
     """Получение информации о работнике по номеру"""
-    client = await get_http_client()
     try:
-        r = await client.get(
-            url=f"{settings.api_base_url}{API_METHODS['worker_detail']}{worker_number}/",
-            headers={'Authorization': f"Token {get_token()}"}
-        )
-        logger.info(f"GET запрос {API_METHODS['workers']}{worker_number} - {r.status_code}")
+        r = await api_client.get('worker_detail', f"{worker_number}/")
+        logger.info("GET запрос %s%s - %s", API_METHODS['workers'], worker_number, r.status_code)
         return r
     except Exception as e:
-        logger.error(f"Ошибка при получении данных работника {worker_number}: {e}")
+        logger.error("Ошибка при получении данных работника %s: %s", worker_number, e)
         raise
 
 
 async def get_worker_f_chat_id(author_code):
     """Получение работника по chat_id"""
-    client = await get_http_client()
     try:
-        r = await client.get(
-            url=f"{settings.api_base_url}{API_METHODS['workers_f']}?chat_id={author_code}",
-            headers={'Authorization': f"Token {get_token()}"}
-        )
-        logger.info(f"GET запрос {API_METHODS['workers_f']}?chat_id={author_code} - {r.status_code}")
+        r = await api_client.get('workers_f', params={'chat_id': author_code})
+        logger.info("GET запрос %s?chat_id=%s - %s", API_METHODS['workers_f'], author_code, r.status_code)
         return r
     except Exception as e:
-        logger.error(f"Ошибка при получении работника по chat_id {author_code}: {e}")
+        logger.error("Ошибка при получении работника по chat_id %s: %s", author_code, e)
         raise
 
 
+identity_cache = AsyncTTLCache(maxsize=settings.identity_cache_size, ttl=settings.identity_cache_ttl)
+census_token_cache = AsyncTTLCache(maxsize=settings.identity_cache_size, ttl=settings.census_token_ttl)
+
+
+async def _load_worker_identity(chat_id):
+    r = await get_worker_f_chat_id(chat_id)
+    r.raise_for_status()
+    workers = r.json()
+    return workers[0] if workers else None
+
+
+async def get_worker_identity(chat_id):
+    """Работник по chat_id из кэша процесса; None - пользователь не зарегистрирован (не кэшируется)"""
+    return await identity_cache.get_or_load(str(chat_id), _load_worker_identity)
+
+
+async def _load_census_token(chat_id):
+    worker = await get_worker_identity(chat_id)
+    return token_generator(worker) if worker is not None else None
+
+
+async def get_census_token(chat_id):
+    """Подписанный токен сенсуса; кэшируется отдельно от работника со своим TTL"""
+    return await census_token_cache.get_or_load(str(chat_id), _load_census_token)
+
+
+def invalidate_worker_identity(*chat_ids):
+    for chat_id in chat_ids:
+        if chat_id:
+            identity_cache.invalidate(str(chat_id))
+            census_token_cache.invalidate(str(chat_id))
+
+
 async def get_trades_tasks_list(trade_id, group_number):
     """Получение списка задач для торговца"""
     try:
-        worker_req = await get_worker_f_chat_id(trade_id)
-        
-        if len(worker_req.json()) > 0:
-            if worker_req.status_code == 200:
-                logger.info(f"Результат GET запрос метод worker_f/ с аргументами chat_id={trade_id} - статус - "
-                            f"{worker_req.status_code}")
-            else:
-                logger.warning(f"Результат GET запрос метод worker_f/ с аргументами chat_id={trade_id} - статус - "
-                               f"{worker_req.status_code}")
-            
-            logger.info(f"GET запрос метод tasks_f/ с аргументами worker={worker_req.json()[0]['code']}&status=Новая")
-
-            client = await get_http_client()
-            r = await client.get(
-                url=f"{settings.api_base_url}tasks_f/?worker={worker_req.json()[0]['code']}"
-                    f"&status=Новая&base__group={group_number}",
-                headers={'Authorization': f"Token {get_token()}"}
-            )
+        worker = await get_worker_identity(trade_id)
+
+        if worker is not None:
+            logger.info("GET запрос метод tasks_f/ с аргументами worker=%s&status=Новая", worker['code'])
+
+            r = await api_client.get('tasks_f', params={
+                'worker': worker['code'],
+                'status': "Новая",
+                'base__group': group_number,
+            })
 
             if r.status_code == 200:
-                logger.info(f"Результат GET запрос метод tasks_f/ с аргументами worker={worker_req.json()[0]['code']}"
-                            f"&status=Новая - статус - {r.status_code}")
+                logger.info("Результат GET запрос метод tasks_f/ с аргументами worker=%s"
+                            "&status=Новая - статус - %s", worker['code'], r.status_code)
+                await prefetch_task_details(r.json())
             else:
-                logger.warning(f"Результат GET запрос метод tasks_f/ с аргументами worker={worker_req.json()[0]['code']}"
-                               f"&status=Новая - статус - {r.status_code}")
+                logger.warning("Результат GET запрос метод tasks_f/ с аргументами worker=%s"
+                               "&status=Новая - статус - %s", worker['code'], r.status_code)
             return {'status': True, 'text': r.json()}
         else:
-            logger.error(f"'status': False, 'text': 'Вы не зарегистрированы в системе'")
+            logger.error("'status': False, 'text': 'Вы не зарегистрированы в системе'")
             return {'status': False, 'text': "Вы не зарегистрированы в системе"}
     except Exception as e:
-        logger.error(f"Ошибка при получении списка задач для {trade_id}: {e}")
+        logger.error("Ошибка при получении списка задач для %s: %s", trade_id, e)
         return {'status': False, 'text': "Ошибка при получении данных"}
 
 
-async def get_task_detail(number):
-    """Получение детальной информации о задаче"""
-    if get_on_redis(number) is not None:
-        return get_on_redis(number)
-    else:
-        try:
-            logger.info("GET запрос метод all-tasks")
-            client = await get_http_client()
-            r = await client.get(
-                url=f"{settings.api_base_url}all-tasks/{number}/",
-                headers={'Authorization': f"Token {get_token()}"}
-            )
-            
-            if r.status_code == 200:
-                save_to_redis(number, r.json())
-                logger.info(f"Результат GET запроса метод all-tasks - {r.status_code}")
-                return get_on_redis(number)
-            else:
-                logger.warning(f"Результат GET запроса метод all-tasks - {r.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"Ошибка при получении задачи {number}: {e}")
-            return None
+# Группы задач, списки которых сохраняются в Redis для постраничной сводки
+DIGEST_GROUPS = (DEBIT, CENSUS)
+
+
+def tasks_list_key(trade_id, group_number) -> str:
+    return f"tasks_list:{trade_id}:{group_number}"
+
+
+async def clear_tasks_lists(trade_id):
+    """Удаление сохранённых списков сводки пользователя: выполненная или переадресованная задача
+    не должна оставаться в сводке с рабочими кнопками"""
+    await redis_clear_many([tasks_list_key(trade_id, group) for group in DIGEST_GROUPS])
+
 
+async def get_cached_trades_tasks_list(trade_id, group_number, refresh: bool = False):
+    """Список задач для постраничного вывода: из Redis, при refresh или промахе - из API"""
+    key = tasks_list_key(trade_id, group_number)
+    if not refresh:
+        tasks = await get_on_redis(key)
+        if tasks is not None:
+            return {'status': True, 'text': tasks}
+    tasks_list = await get_trades_tasks_list(trade_id, group_number)
+    if tasks_list['status'] and isinstance(tasks_list['text'], list):
+        await save_to_redis(key, tasks_list['text'], ttl=settings.digest_cache_ttl)
+    return tasks_list
 
-async def post_forward_task(number, comment_id, new_worker, author):
-    """Переадресация задачи"""
+
+# Версия задачи - дата последнего изменения в 1С; более старая копия не перезаписывает новую
+TASK_VERSION_FIELD = 'edit_date'
+
+task_cache = AsyncTTLCache(maxsize=settings.task_cache_size, ttl=settings.task_cache_ttl,
+                           version=lambda task: task.get(TASK_VERSION_FIELD))
+
+
+async def prefetch_task_details(tasks: list):
+    """Запись задач из списка tasks_f/ в L1-кэш и Redis, чтобы нажатие кнопки под карточкой
+    не запрашивало all-tasks/ повторно"""
     try:
-        task_data = await get_task_detail(number)
-        if task_data is not None:
-            logger.info(f"Результат запроса в Redis - {task_data}")
-            task = {
-                'status': "Переадресована",
-                'edited': True,
-                'author_comment': int(comment_id),
-                'author': task_data['worker']['code'],
-                'worker': new_worker,
-                'worker_comment': settings.constant_comment_id,
-                'base': task_data['base']['number'],
-                'partner': task_data['partner']['code'],
-                'number': task_data['number'],
-                'name': task_data['name'],
-                'date': task_data['date'],
-                'deadline': task_data['deadline'],
-            }
-
-            client = await get_http_client()
-            r = await client.put(
-                url=f"{settings.api_base_url}tasks/",
-                data=task,
-                headers={'Authorization': f"Token {get_token()}"}
-            )
-            
-            if r.status_code == 201:
-                logger.info(f"PUT запрос метод tasks/ - data={task}- {r.status_code}")
-                return True
-            else:
-                logger.warning(f"PUT запрос метод tasks/ - data={task}- {r.status_code} - error - {r.json()}")
-                return False
-        else:
-            logger.info(f"GET запрос метод tasks/")
-            return False
+        fresh = {task['number']: task for task in tasks if task_cache.put(task['number'], task)}
+        saved = await save_many_to_redis(fresh, version_field=TASK_VERSION_FIELD)
+        logger.info("Задачи из списка записаны в кэш: %s, в Redis - %s", len(fresh), saved)
     except Exception as e:
-        logger.error(f"Ошибка при переадресации задачи {number}: {e}")
-        return False
+        logger.warning("Не удалось записать задачи из списка в кэш: %s", e)
 
 
-async def post_add_comment(task, comment, method):
-    """Функция для добавления нового комментария, возвращает ID созданного комментария"""
+async def _load_task_detail(number):
+    """Загрузка задачи из Redis, при промахе - из API с сохранением в Redis"""
+    task = await get_on_redis(number)
+    if task is not None:
+        return task
     try:
-        worker = get_on_redis(task)
-
-        if worker is not None:
-            logger.info(f"Получение worker из редис")
-
-            if method == "worker":
-                data = {
-                    "comment": comment,
-                    "worker": worker['worker']['code']
-                }
-
-                client = await get_http_client()
-                r = await client.post(
-                    url=f"{settings.api_base_url}worker_comment/",
-                    data=json.dumps(data),
-                    headers={
-                        'Authorization': f"Token {get_token()}",
-                        "Content-Type": 'application/json'
-                    }
-                )
-
-                if r.status_code == 201:
-                    logger.info(f"POST запрос worker_comment/ - data={data} - {r.status_code}")
-                    return r.json()['id']
-                else:
-                    logger.warning(f"POST запрос worker_comment/ - data={data} - {r.status_code}")
-                    return False
-
-            elif method == "author":
-                data = {
-                    "comment": comment,
-                    "author": worker['worker']['code']
-                }
-                
-                client = await get_http_client()
-                r = await client.post(
-                    url=f"{settings.api_base_url}author_comment/",
-                    data=json.dumps(data),
-                    headers={
-                        'Authorization': f"Token {get_token()}",
-                        "Content-Type": 'application/json'
-                    }
-                )
-                
-                if r.status_code == 201:
-                    logger.info(f"POST запрос author_comment/ - data={data} - {r.status_code}")
-                    return r.json()['id']
-                else:
-                    logger.warning(f"POST запрос author_comment/ - data={data} - {r.status_code}")
-                    return False
+        logger.info("GET запрос метод all-tasks")
+        r = await api_client.get('all-tasks', f"{number}/")
+
+        if r.status_code == 200:
+            task = r.json()
+            await save_many_to_redis({number: task}, version_field=TASK_VERSION_FIELD)
+            logger.info("Результат GET запроса метод all-tasks - %s", r.status_code)
+            return task
         else:
-            logger.warning(f"Данные из Redis не получены")
-            return False
+            logger.warning("Результат GET запроса метод all-tasks - %s", r.status_code)
+            return None
     except Exception as e:
-        logger.error(f"Ошибка при добавлении комментария к задаче {task}: {e}")
-        return False
+        logger.error("Ошибка при получении задачи %s: %s", number, e)
+        return None
+
+
+async def get_task_detail(number):
+    """Получение детальной информации о задаче.
+
+    Сначала L1-кэш процесса, затем Redis и API; параллельные запросы одной
+    задачи выполняют одно чтение Redis и не более одного запроса к API.
+    """
+    return await task_cache.get_or_load(number, _load_task_detail)
+
+
+async def clear_task_detail(number, trade_id=None):
+    """Удаление задачи из L1-кэша и Redis; с trade_id - вместе со списками сводки пользователя, одной командой"""
+    task_cache.invalidate(number)
+    keys = [number]
+    if trade_id is not None:
+        keys += [tasks_list_key(trade_id, group) for group in DIGEST_GROUPS]
+    await redis_clear_many(keys)
 
 
 async def put_register(phone: str, chat_id: str):
     """Функция отправки PUT запроса к БД, с присвоением chat_id"""
     try:
         clean_phone = phone.strip('+').replace("-", "").replace("(", "").replace(")", "")
-        logger.info(f"Получен запрос на регистрацию - номер {phone}, chat_id={chat_id}")
+        logger.info("Получен запрос на регистрацию - номер %s, chat_id=%s", phone, chat_id)
 
-        client = await get_http_client()
-        t = await client.get(
-            url=f"{settings.api_base_url}worker_f/?phone={clean_phone}",
-            headers={'Authorization': f"Token {get_token()}"}
-        )
+        t = await api_client.get('workers_f', params={'phone': clean_phone})
         
         if t.status_code == 200:
-            logger.info(f"GET запрос worker_f/?phone={phone} - data={t.json()}- {t.status_code}")
+            logger.info("GET запрос worker_f/?phone=%s - data=%s- %s", phone, t.json(), t.status_code)
             worker = t.json()
             if len(worker) <= 0:
-                logger.warning(f"Пользователь с номером {phone} не найден в системе")
+                logger.warning("Пользователь с номером %s не найден в системе", phone)
                 return {'status': False,
                         'message': "Данный контакт не существует в системе, обратитесь к своему руководителю"}
             else:
+                previous_chat_id = worker[0].get('chat_id')
                 worker[0]['chat_id'] = chat_id
-                logger.info(f"Пользователю {worker} - назначен chat_id={chat_id}")
-                data = json.dumps(worker)
-                
-                update = await client.put(
-                    url=f"{settings.api_base_url}workers/",
-                    data=data,
-                    headers={
-                        'Authorization': f"Token {get_token()}",
-                        "Content-Type": 'application/json'
-                    }
-                )
+                logger.info("Пользователю %s - назначен chat_id=%s", worker, chat_id)
+                update = await api_client.put('workers', json=worker)
                 
                 if update.status_code == 201:
-                    logger.info(f"PUT запрос workers/ - data={data} - {update.status_code}")
+                    logger.info("PUT запрос workers/ - data=%s - %s", worker, update.status_code)
+                    invalidate_worker_identity(chat_id, previous_chat_id)
                     return {'status': True, 'message': "Регистрация прошла успешно"}
                 else:
-                    logger.warning(f"PUT запрос workers/ - data={worker} - {update.status_code}")
+                    logger.warning("PUT запрос workers/ - data=%s - %s", worker, update.status_code)
                     return {'status': False, 'message': "Техническая ошибка. Обратитесь в тех.поддержку"}
         else:
-            logger.warning(f"GET запрос worker_f/?phone={phone} - data={t.json()}- {t.status_code}")
+            logger.warning("GET запрос worker_f/?phone=%s - data=%s- %s", phone, t.json(), t.status_code)
             return {'status': False, 'message': "Техническая ошибка. Обратитесь в тех.поддержку"}
     except Exception as e:
-        logger.error(f"Ошибка при регистрации пользователя {phone}: {e}")
+        logger.error("Ошибка при регистрации пользователя %s: %s", phone, e)
         return {'status': False, 'message': "Техническая ошибка. Обратитесь в тех.поддержку"}
 
 
-async def get_forward_supervisor_controller(worker: dict, author: str) -> dict:
+async def _fetch_controller(_=None):
+    r = await api_client.get('workers_f', params={'controller': 'true'})
+    logger.info("GET запрос%s?controller=true - %s", API_METHODS['workers_f'], r.status_code)
+    r.raise_for_status()
+    return r.json()[0]
+
+
+async def _fetch_result_list(group):
+    r = await api_client.get('result-data_f', params={'group': group})
+    logger.info("GET запрос %s  - 'group='%s - %s", API_METHODS['result-data_f'], group, r.status_code)
+    r.raise_for_status()
+    return r.json()
+
+
+async def _fetch_result_data_detail(result_id):
+    r = await api_client.get('result-data', f"{result_id}/")
+    logger.info("GET запрос %s - с атрибутами %s - %s", API_METHODS['result-data'], result_id, r.status_code)
+    r.raise_for_status()
+    return r.json()
+
+
+reference_cache = ReferenceCache(
+    refresh_interval=settings.reference_refresh_interval,
+    load_timeout=settings.reference_load_timeout,
+    max_age=settings.reference_max_age,
+)
+reference_cache.register('controller', _fetch_controller)
+reference_cache.register('result_list', _fetch_result_list)
+reference_cache.register('result_data', _fetch_result_data_detail)
 
-    async with httpx.AsyncClient() as async_requests:
-        controller_res = await async_requests.get(url=f"{settings.api_base_url}{API_METHODS['workers_f']}?controller=true",
-                                                  headers={'Authorization': f"Token {get_token()}"})
 
-    logger.info(f"GET запрос{API_METHODS['workers_f']}?controller=true - {controller_res.status_code}")
-    controller = controller_res.json()[0]
+async def warm_reference_cache():
+    """Прогрев справочников: контролёр, списки результатов по группам задач и детали этих результатов"""
+    await reference_cache.warm([('controller', None)] + [('result_list', group) for group in TASK_GROUP])
+    result_ids = set()
+    for group in TASK_GROUP:
+        for result in reference_cache.peek('result_list', group) or []:
+            result_ids.add(str(result['code']))
+    loaded = await reference_cache.warm([('result_data', result_id) for result_id in result_ids])
+    logger.info("Справочники прогреты: %s, деталей результатов - %s", reference_cache.stats(), loaded)
 
-    if worker.get('partner') is not None:
-        worker_data = await get_workers_number(worker['partner'])
-        worker_partner = worker_data.json()
-    else:
-        worker_partner = None
+
+async def _get_worker_partner(worker: dict):
+    if worker.get('partner') is None:
+        return None
+    worker_data = await get_workers_number(worker['partner'])
+    worker_data.raise_for_status()
+    return worker_data.json()
+
+
+async def get_forward_supervisor_controller(worker: dict, author: str) -> dict:
+    """Список адресатов переадресации; контролёр и партнёр работника запрашиваются параллельно"""
+    try:
+        controller, worker_partner = await run_concurrently(reference_cache.get('controller'),
+                                                            _get_worker_partner(worker))
+    except Exception as e:
+        logger.error("Ошибка при получении адресатов переадресации для %s: %r", worker.get('code'), e)
+        return {'status': False, 'result': []}
 
     result_list = comparison(author_list=author, controller_list=controller, supervisor_list=worker['supervisor'],
                              worker_list=worker, partner_list=worker_partner, head_list=worker['supervisor']['head'])
 
-    logger.info(f"Создан лист переадресаций {result_list}")
+    logger.info("Создан лист переадресаций %s", result_list)
 
     return {'status': True, 'result': result_list}
 
 
-async def get_partner_worker_list(partner):
-    async with httpx.AsyncClient() as async_requests:
-        r = await async_requests.get(url=f"{settings.api_base_url}{API_METHODS['partner-worker_f']}?partner={partner}",
-                                     headers={'Authorization': f"Token {get_token()}"})
-    logger.info(f"GET запрос {API_METHODS['partner-worker_f']} - {r.status_code}")
-    return r.json()
-
-
 async def get_result_list(group):
-    async with httpx.AsyncClient() as async_requests:
-        r = await async_requests.get(url=f"{settings.api_base_url}{API_METHODS['result-data_f']}?group={group}",
-                                     headers={'Authorization': f"Token {get_token()}"})
-    logger.info(f"GET запрос {API_METHODS['result-data_f']}  - 'group='{group} - {r.status_code}")
-    return r.json()
+    return await reference_cache.get('result_list', group)
 
 
 # async def get_partner_worker(contact_person_id):
-#     async with httpx.AsyncClient() as async_requests:
-#         r = await async_requests.get(url=f"{API_BASE_URL}{API_METHODS['partner-worker_f']}?id={contact_person_id}",
-#                                      headers={'Authorization': f"Token {get_token()}"})
+#     r = await api_client.get('partner-worker_f', params={'id': contact_person_id})
 #     logger.info(f"GET запрос {API_METHODS['partner-worker_f']} - с атрибутами id={contact_person_id}- {r.status_code}")
 #     return r.json()
 
 
-async def get_result_detail(result_id):
-    async with httpx.AsyncClient() as async_requests:
-        r = await async_requests.get(url=f"{settings.api_base_url}{API_METHODS['result']}{result_id}/",
-                                     headers={'Authorization': f"Token {get_token()}"})
-    logger.info(f"GET запрос {API_METHODS['result']} - с атрибутами {result_id} - {r.status_code}")
-    return r.json()
-
-
 async def get_result_data_detail(result_id):
-    async with httpx.AsyncClient() as async_requests:
-        r = await async_requests.get(url=f"{settings.api_base_url}{API_METHODS['result-data']}{result_id}/",
-                                     headers={'Authorization': f"Token {get_token()}"})
-    logger.info(f"GET запрос {API_METHODS['result-data']} - с атрибутами {result_id} - {r.status_code}")
-    return r.json()
-
-
-async def get_ready_result_task(result):
-
-    async_task = get_on_redis(result['task_number'])  # Получаем задачу из Redis
-
-    task = {
-        'number': async_task['number'],
-        'name': async_task['name'],
-        'date': async_task['date'],
-        'status': async_task['status'],
-        "deadline": async_task['deadline'],
-        "edit_date": async_task['edit_date'],
-        "edited": async_task['edited'],
-        'worker': async_task['worker']['code'],
-        'partner': async_task['partner']['code'],
-        'author': async_task['author']['code'],
-        'author_comment': async_task['author_comment']['id'],
-        'worker_comment': async_task['worker_comment']['id'],
-        'base': async_task['base']['number'],
-        'result': async_task['result']
-    }
-
-    worker_comment_id = await post_add_comment(task=result['task_number'], comment=result['worker_comment'], method="worker")
-    if worker_comment_id:
-        logger.info(f"Создан комментарий по id={worker_comment_id}")
-        result_item = {
-            "type": result['task_type'],
-            "result": result['result'],
-            "contact_person": result['contact_person'],
-            "base": task['base'],
-            "task_number": result['task_number']
-        }
-        if result.get('control_date'):
-            logger.info(f"Контрольная дата установлена для результата {result_item} - {task['number']}")
-            result_item["control_date"] = result['control_date'].date()
-        else:
-            logger.info(f"Контрольная дата не установлена для результата {result_item} - {task['number']}")
-            result_item["control_date"] = None
-        async with httpx.AsyncClient() as async_requests:
-            result_re = await async_requests.post(url=f"{settings.api_base_url}{API_METHODS['result']}", data=result_item,
-                                                  headers={'Authorization': f"Token {get_token()}"})
-
-        if result_re.status_code == 201:
-            logger.info(f"POST запрос {API_METHODS['result']} с data={result_item} - "
-                        f"{result_re.status_code}")
-            result_id = result_re.json()['id']
-            task['edited'] = True,
-            task['status'] = "Выполнено",
-            task['worker_comment'] = worker_comment_id
-            task['result'] = result_id
-            async with httpx.AsyncClient() as async_requests:
-                add_ready_task = await async_requests.put(url=f"{settings.api_base_url}{API_METHODS['tasks']}", data=task,
-                                                          headers={'Authorization': f"Token {get_token()}"})
-            if add_ready_task.status_code == 201:
-                logger.info(f"PUT запрос {API_METHODS['tasks']} c data={task} - "
-                            f"{add_ready_task.status_code}")
-                return {"status": True, 'text': f"Задача {task['name']} выполнена"}
-            else:
-                logger.warning(f"PUT запрос {API_METHODS['tasks']} c data={task} - "
-                               f"{add_ready_task.status_code}")
-                return {"status": False, 'text': f"Статус {add_ready_task.status_code}"}
-
-    else:
-        logger.warning(f"Комментарий не создан {task['number']}")
-        return {"status": False, 'text': "Комментарий не создан"}
+    return await reference_cache.get('result_data', result_id)
 
 
 if __name__ == '__main__':
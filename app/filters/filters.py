@@ -1,4 +1,7 @@
+from typing import Callable, Optional, Type, Union
+
 from aiogram.filters import BaseFilter
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import CallbackQuery, Message
 
 from app.lexicon.lexicon import LEXICON_COMMANDS
@@ -16,4 +19,36 @@ class IsDelBookmarkCallbackData(BaseFilter):
 
 
 def menu_commands_filter(message: Message) -> bool:
-    return message.text not in LEXICON_COMMANDS.keys()
\ No newline at end of file
+    return message.text not in LEXICON_COMMANDS.keys()
+
+
+class CallbackRoute(BaseFilter):
+    """Разбор callback_data фабрики CallbackData с поддержкой прежнего формата.
+
+    Данные нового вида ("d:<номер>") разбираются unpack, прежнего ("ok_<номер>")
+    - factory.from_legacy по остатку после legacy-префикса. Результат
+    передаётся в хэндлер аргументом callback_data. По prefixes хэндлер
+    индексирует CallbackDispatchRouter.
+    """
+
+    def __init__(self, factory: Type[CallbackData], legacy: Optional[str] = None,
+                 rule: Optional[Callable[[CallbackData], bool]] = None):
+        self.factory = factory
+        self.legacy = legacy
+        self.rule = rule
+        self.prefixes = (f"{factory.__prefix__}{factory.__separator__}",) + ((legacy,) if legacy else ())
+
+    async def __call__(self, callback: CallbackQuery) -> Union[bool, dict]:
+        data = callback.data or ''
+        try:
+            if data.startswith(self.prefixes[0]):
+                callback_data = self.factory.unpack(data)
+            elif self.legacy and data.startswith(self.legacy):
+                callback_data = self.factory.from_legacy(data[len(self.legacy):])
+            else:
+                return False
+        except (TypeError, ValueError):
+            return False
+        if self.rule is not None and not self.rule(callback_data):
+            return False
+        return {'callback_data': callback_data}
@@ -1,32 +1,36 @@
-import asyncio
 import logging
 
 from aiogram import Router
-from aiogram.filters import Text, StateFilter
+from aiogram.filters import StateFilter
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.state import default_state
 from aiogram.fsm.context import FSMContext
 from aiogram3_calendar import simple_cal_callback
 from aiogram.exceptions import TelegramBadRequest
 
-from app.filters.filters import menu_commands_filter
+from app.filters.filters import menu_commands_filter, CallbackRoute
 from app.keyboards.calendar import MySimpleCalendar
+from app.keyboards.callbacks import TaskDone, ContactType, ContactPerson, ResultType
 
 from app.database.database import get_task_detail, get_result_list, \
-     get_result_data_detail, get_ready_result_task
+     get_result_data_detail, clear_task_detail, clear_tasks_lists
 
-from app.services.redis_data import redis_clear
-from app.keyboards.trades_keyboards import create_types_done_inline_kb, create_result_types_done_inline_kb, \
-     create_contact_person_done_inline_kb
+from app.keyboards.trades_keyboards import create_result_types_done_inline_kb, \
+     create_contact_person_done_inline_kb, is_digest_markup
 
 from app.lexicon import lexicon
 from app.forms.user_form import DoneTaskForm
-from app.services.utils import clear_date
+from app.services.completion import task_writes, new_flow_id
+from app.services.outbox import outbox
+from app.services.deferred import deferred_actions
+from app.services.callback_dispatch import CallbackDispatchRouter
+from app.services.task_cards import task_cards, DONE_PROMPT, RESULT_PROMPT
+from app.services.utils import run_concurrently
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-router: Router = Router()
+router: Router = CallbackDispatchRouter()
 
 
 async def validate_task_state(state: FSMContext, required_fields: list = None) -> tuple[bool, dict]:
@@ -48,7 +52,7 @@ async def validate_task_state(state: FSMContext, required_fields: list = None) -
         is_valid = all(field in state_data and state_data[field] is not None for field in required_fields)
         return is_valid, state_data
     except Exception as e:
-        logger.error(f"Ошибка при валидации состояния: {e}")
+        logger.error("Ошибка при валидации состояния: %s", e)
         return False, {}
 
 
@@ -62,11 +66,11 @@ async def safe_delete_message(message, context: str = ""):
     """
     try:
         await message.delete()
-        logger.info(f"Сообщение {context} удалено успешно")
+        logger.info("Сообщение %s удалено успешно", context)
     except TelegramBadRequest as e:
-        logger.warning(f"Не удалось удалить сообщение {context}: {e}")
+        logger.warning("Не удалось удалить сообщение %s: %s", context, e)
     except Exception as e:
-        logger.error(f"Неожиданная ошибка при удалении сообщения {context}: {e}")
+        logger.error("Неожиданная ошибка при удалении сообщения %s: %s", context, e)
 
 
 @router.message(StateFilter(DoneTaskForm.worker_comment), menu_commands_filter)
@@ -76,8 +80,8 @@ async def add_ok_task_comment(message: Message, state: FSMContext):
     # Валидация состояния
     is_valid, task_data = await validate_task_state(state, ['task_number'])
     if not is_valid:
-        logger.error(f"Некорректное состояние при добавлении комментария. "
-                    f"Данные: {task_data}. Пользователь: {message.from_user.id}")
+        logger.error("Некорректное состояние при добавлении комментария. "
+                    "Данные: %s. Пользователь: %s", task_data, message.from_user.id)
         await message.answer("Ошибка: данные задачи не найдены. Пожалуйста, начните процесс заново.")
         await state.clear()
         return
@@ -87,111 +91,112 @@ async def add_ok_task_comment(message: Message, state: FSMContext):
     # Безопасное удаление сообщения пользователя
     await safe_delete_message(message, f"пользователя {message.from_user.id}")
 
-    logger.info(f"Комментарий к задаче {task_data['task_number']} - {message.from_user.id} - "
-                f"{message.from_user.username}")
+    logger.info("Комментарий к задаче %s - %s - "
+                "%s", task_data['task_number'], message.from_user.id, message.from_user.username)
     
     # Получаем обновленные данные после добавления комментария
     updated_task_data = await state.get_data()
 
     try:
-        res = await get_ready_result_task(updated_task_data)
+        task = await get_task_detail(task_data['task_number']) if settings.outbox_enabled else None
+        if task is not None and await outbox.enqueue('complete', message.chat.id,
+                                                     {**updated_task_data, 'task_name': task['name'],
+                                                      'trade_id': message.from_user.id}):
+            # Запись в 1С выполнит фоновый потребитель, об ошибке он сообщит сам
+            await state.clear()
+            await clear_tasks_lists(message.from_user.id)
+            await message.answer(text=f"Задача {task['name']} принята, результат будет сохранён в 1С")
+            logger.info("Выполнение задачи %s записано в outbox - "
+                        "%s - %s", task_data['task_number'], message.from_user.id, message.from_user.username)
+            return
+
+        res = await task_writes.complete(updated_task_data)
 
         if res['status']:
-            logger.info(f"{res['text']} - {message.from_user.id} - {message.from_user.username}")
+            logger.info("%s - %s - %s", res['text'], message.from_user.id, message.from_user.username)
             await state.clear()
-            redis_clear(task_data['task_number'])
+            await clear_task_detail(task_data['task_number'], message.from_user.id)
             await message.answer(text=res['text'])
+            logger.info("Состояние очищено по задаче %s - "
+                        "%s - %s", task_data['task_number'], message.from_user.id, message.from_user.username)
         else:
-            logger.warning(f"{res['text']} - {message.from_user.id} - {message.from_user.username}")
+            # Состояние сохраняем: повторный комментарий продолжит с упавшего шага
+            logger.warning("%s - %s - %s", res['text'], message.from_user.id, message.from_user.username)
             await message.answer(text=res['text'])
-            # Очищаем состояние даже при неуспешном результате
-            await state.clear()
-            redis_clear(task_data['task_number'])
-
-        logger.info(f"Состояние очищено по задаче {task_data['task_number']} - "
-                    f"{message.from_user.id} - {message.from_user.username}")
         
     except Exception as e:
-        logger.error(f"Ошибка при обработке задачи {task_data.get('task_number', 'unknown')}: {e}. "
-                    f"Данные состояния: {updated_task_data}")
+        logger.error("Ошибка при обработке задачи %s: %s. "
+                    "Данные состояния: %s", task_data.get('task_number', 'unknown'), e, updated_task_data)
         await message.answer(text="Произошла ошибка при обработке задачи. Обратитесь в техподдержку.")
         # Очищаем состояние при ошибке
         await state.clear()
         if 'task_number' in task_data:
-            redis_clear(task_data['task_number'])
+            await clear_task_detail(task_data['task_number'], message.from_user.id)
 
 
-@router.callback_query(Text(startswith='ok'), StateFilter(default_state))
-async def process_forward_press(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackRoute(TaskDone, legacy=lexicon.TASK_KEYS['done']['callback_data']),
+                       StateFilter(default_state))
+async def process_forward_press(callback: CallbackQuery, callback_data: TaskDone, state: FSMContext):
     """При нажатии на кнопку 'Выполнено'"""
     
     try:
-        task_number = callback.data.split("_")[1]
-        logger.info(f"Получен положительный ответ к задаче {task_number} для {callback.from_user.username} - "
-                    f"{callback.from_user.id}")
+        task_number = callback_data.number
+        logger.info("Получен положительный ответ к задаче %s для %s - "
+                    "%s", task_number, callback.from_user.username, callback.from_user.id)
         
-        # Устанавливаем данные в состояние
-        await state.update_data(task_number=task_number)
-        await state.set_state(DoneTaskForm.task_number)
-        
-        # Логируем установленные данные
-        state_data = await state.get_data()
-        logger.info(f"Записаны данные в state: {state_data}")
+        # Состояние записываем параллельно с получением задачи
+        state_data, _, task = await run_concurrently(state.update_data(task_number=task_number,
+                                                                       flow_id=new_flow_id()),
+                                                     state.set_state(DoneTaskForm.task_number),
+                                                     get_task_detail(task_number))
+        logger.info("Записаны данные в state: %s", state_data)
 
-        # Получаем детали задачи
-        task = await get_task_detail(task_number)
         if not task:
-            logger.error(f"Задача {task_number} не найдена в базе данных")
+            logger.error("Задача %s не найдена в базе данных", task_number)
             await callback.message.answer("Ошибка: задача не найдена. Обратитесь в техподдержку.")
             await state.clear()
             return
 
-        date = clear_date(task['date'])
-        text = f"""Укажите какое действие было сделано к задаче от {date}
-
-"{task['name']}"
-"""
-        await callback.message.answer(text=text, reply_markup=create_types_done_inline_kb(1, lexicon.TYPES))
+        text, keyboard = task_cards.render(task, DONE_PROMPT)
+        await callback.message.answer(text=text, reply_markup=keyboard)
 
-        # Безопасное удаление callback сообщения
-        await safe_delete_message(callback.message, f"ok по задаче {task['name']}")
+        # Безопасное удаление callback сообщения; сводку задач оставляем
+        if not is_digest_markup(callback.message.reply_markup):
+            await safe_delete_message(callback.message, f"ok по задаче {task['name']}")
 
-        logger.info(f"Создана клавиатура с 'contacts' для задачи {task_number}")
+        logger.info("Создана клавиатура с 'contacts' для задачи %s", task_number)
         
-    except IndexError:
-        logger.error(f"Некорректный формат callback_data: {callback.data}")
-        await callback.message.answer("Ошибка: некорректные данные. Попробуйте еще раз.")
     except Exception as e:
-        logger.error(f"Ошибка при обработке кнопки 'Выполнено' для задачи {callback.data}: {e}")
+        logger.error("Ошибка при обработке кнопки 'Выполнено' для задачи %s: %s", callback.data, e)
         await callback.message.answer("Произошла ошибка. Попробуйте позже.")
         await state.clear()
 
 
-@router.callback_query(Text(text=[f"contact_{x}" for x in lexicon.TYPES.keys()]))
-async def process_contact_press(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackRoute(ContactType, legacy='contact_', rule=lambda data: data.type in lexicon.TYPES))
+async def process_contact_press(callback: CallbackQuery, callback_data: ContactType, state: FSMContext):
     """При нажатии на клавиатуру действий"""
 
     try:
-        task_type = callback.data.split('_')[1]
+        task_type = callback_data.type
         await state.update_data(task_type=task_type)
         await state.set_state(DoneTaskForm.task_type)
         
         # Валидация состояния
         is_valid, task_data = await validate_task_state(state, ['task_number'])
         if not is_valid:
-            logger.error(f"Некорректное состояние при обработке контакта. "
-                        f"Данные: {task_data}. Пользователь: {callback.from_user.id}")
+            logger.error("Некорректное состояние при обработке контакта. "
+                        "Данные: %s. Пользователь: %s", task_data, callback.from_user.id)
             await callback.message.answer("Ошибка: данные задачи не найдены. Начните процесс заново.")
             await state.clear()
             return
 
-        logger.info(f"Получен тип контакта - {task_type} - к задаче {task_data['task_number']}")
-        logger.info(f"Записаны данные в state: {await state.get_data()}")
+        logger.info("Получен тип контакта - %s - к задаче %s", task_type, task_data['task_number'])
+        logger.info("Записаны данные в state: %s", await state.get_data())
 
         # Получаем детали задачи
         task = await get_task_detail(task_data['task_number'])
         if not task:
-            logger.error(f"Задача {task_data['task_number']} не найдена при обработке контакта")
+            logger.error("Задача %s не найдена при обработке контакта", task_data['task_number'])
             await callback.message.answer("Ошибка: задача не найдена. Обратитесь в техподдержку.")
             await state.clear()
             return
@@ -207,61 +212,54 @@ async def process_contact_press(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer(text=text,
                                       reply_markup=create_contact_person_done_inline_kb(1, partner_workers))
 
-        await asyncio.sleep(settings.delete_message_timer)
-        await safe_delete_message(callback.message, f"contact по задаче {task_data['task_number']}")
+        await deferred_actions.schedule_delete(callback.message, settings.delete_message_timer)
         
-    except IndexError:
-        logger.error(f"Некорректный формат callback_data при обработке контакта: {callback.data}")
-        await callback.message.answer("Ошибка: некорректные данные контакта.")
     except Exception as e:
-        logger.error(f"Ошибка при обработке выбора контакта: {e}. "
-                    f"Callback data: {callback.data}")
+        logger.error("Ошибка при обработке выбора контакта: %s. "
+                    "Callback data: %s", e, callback.data)
         await callback.message.answer("Произошла ошибка при выборе контакта. Попробуйте еще раз.")
 
 
-@router.callback_query(Text(startswith="person"))
-async def process_person_press(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackRoute(ContactPerson, legacy='person_'))
+async def process_person_press(callback: CallbackQuery, callback_data: ContactPerson, state: FSMContext):
     """Обработка выбора контактного лица"""
     
     try:
-        person_id = callback.data.split('_')[1]
+        person_id = callback_data.code
         
         # Валидация состояния
         is_valid, task_data = await validate_task_state(state, ['task_number'])
         if not is_valid:
-            logger.error(f"Некорректное состояние при выборе персоны. "
-                        f"Данные: {task_data}. Пользователь: {callback.from_user.id}")
+            logger.error("Некорректное состояние при выборе персоны. "
+                        "Данные: %s. Пользователь: %s", task_data, callback.from_user.id)
             await callback.message.answer("Ошибка: данные задачи не найдены. Начните процесс заново.")
             await state.clear()
             return
 
-        # Получаем детали задачи
-        task = await get_task_detail(task_data['task_number'])
+        # Задача и запись контактного лица независимы, выполняем параллельно
+        task, state_data = await run_concurrently(get_task_detail(task_data['task_number']),
+                                                  state.update_data(contact_person=person_id))
         if not task:
-            logger.error(f"Задача {task_data['task_number']} не найдена при выборе персоны")
+            logger.error("Задача %s не найдена при выборе персоны", task_data['task_number'])
             await callback.message.answer("Ошибка: задача не найдена. Обратитесь в техподдержку.")
             await state.clear()
             return
 
-        await state.update_data(contact_person=person_id)
-        logger.info(f"Получено контактное лицо - {person_id} - к задаче {task['name']}")
-        logger.info(f"Записаны данные в state: {await state.get_data()}")
+        logger.info("Получено контактное лицо - %s - к задаче %s", person_id, task['name'])
+        logger.info("Записаны данные в state: %s", state_data)
         
-        date = clear_date(task['date'])
-        text = f"""Выберите результат действия к задаче {task['name']} от {date}
-
-"""
+        text, _ = task_cards.render(task, RESULT_PROMPT)
 
         # Получаем список результатов
         group = task.get('base', {}).get('group')
         if not group:
-            logger.error(f"Не найдена группа для задачи {task_data['task_number']}")
+            logger.error("Не найдена группа для задачи %s", task_data['task_number'])
             await callback.message.answer("Ошибка: некорректные данные задачи.")
             return
 
         result_list = await get_result_list(group)
         if not result_list:
-            logger.warning(f"Пустой список результатов для группы {group}")
+            logger.warning("Пустой список результатов для группы %s", group)
             await callback.message.answer("Ошибка: не найдены доступные результаты для данной задачи.")
             return
 
@@ -270,58 +268,50 @@ async def process_person_press(callback: CallbackQuery, state: FSMContext):
             reply_markup=create_result_types_done_inline_kb(1, result_list)
         )
 
-        await asyncio.sleep(settings.delete_message_timer)
-        await safe_delete_message(callback.message, f"person по задаче {task_data['task_number']}")
+        await deferred_actions.schedule_delete(callback.message, settings.delete_message_timer)
         
-    except IndexError:
-        logger.error(f"Некорректный формат callback_data при выборе персоны: {callback.data}")
-        await callback.message.answer("Ошибка: некорректные данные персоны.")
     except Exception as e:
-        logger.error(f"Ошибка при обработке выбора персоны: {e}. "
-                    f"Callback data: {callback.data}")
+        logger.error("Ошибка при обработке выбора персоны: %s. "
+                    "Callback data: %s", e, callback.data)
         await callback.message.answer("Произошла ошибка при выборе контактного лица. Попробуйте еще раз.")
 
 
-@router.callback_query(Text(startswith="result"))
-async def process_result_press(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(CallbackRoute(ResultType, legacy='result_'))
+async def process_result_press(callback: CallbackQuery, callback_data: ResultType, state: FSMContext):
     """Обработка выбора результата"""
     
     try:
-        result_id = callback.data.split('_')[1]
+        result_id = callback_data.code
         
         # Валидация состояния
         is_valid, task_data = await validate_task_state(state, ['task_number'])
         if not is_valid:
-            logger.error(f"Некорректное состояние при обработке результата. "
-                        f"Данные: {task_data}. Пользователь: {callback.from_user.id}")
+            logger.error("Некорректное состояние при обработке результата. "
+                        "Данные: %s. Пользователь: %s", task_data, callback.from_user.id)
             await callback.message.answer("Ошибка: данные задачи не найдены. Начните процесс заново.")
             await state.clear()
             return
 
-        # Получаем данные результата
-        result_data = await get_result_data_detail(result_id)
+        # Результат и задача независимы, получаем параллельно
+        result_data, tasks_data = await run_concurrently(get_result_data_detail(result_id),
+                                                         get_task_detail(task_data['task_number']))
         if not result_data:
-            logger.error(f"Результат {result_id} не найден")
+            logger.error("Результат %s не найден", result_id)
             await callback.message.answer("Ошибка: выбранный результат не найден.")
             return
 
-        await state.update_data(result=result_data['name'])
-        
-        # Получаем обновленные данные состояния
-        updated_task_data = await state.get_data()
-        
-        # Получаем детали задачи
-        tasks_data = await get_task_detail(task_data['task_number'])
+        updated_task_data = await state.update_data(result=result_data['name'])
+
         if not tasks_data:
-            logger.error(f"Задача {task_data['task_number']} не найдена при обработке результата")
+            logger.error("Задача %s не найдена при обработке результата", task_data['task_number'])
             await callback.message.answer("Ошибка: задача не найдена. Обратитесь в техподдержку.")
             await state.clear()
             return
 
-        logger.info(f"Получен результат - {result_data['name']} - к задаче {task_data['task_number']} - "
-                    f"{callback.from_user.id} - {callback.from_user.username}")
-        logger.info(f"Записаны данные в state: {updated_task_data} - "
-                    f"{callback.from_user.id} - {callback.from_user.username}")
+        logger.info("Получен результат - %s - к задаче %s - %s - %s", result_data['name'], task_data['task_number'],
+                    callback.from_user.id, callback.from_user.username)
+        logger.info("Записаны данные в state: %s - "
+                    "%s - %s", updated_task_data, callback.from_user.id, callback.from_user.username)
 
         if result_data.get('control_data'):
             text = """Установите контрольную дату:
@@ -329,19 +319,15 @@ async def process_result_press(callback: CallbackQuery, state: FSMContext):
             await callback.message.answer(
                 text=text,
                 reply_markup=await MySimpleCalendar().start_calendar())
-            logger.info(f"Открыта клавиатура календаря для задачи {task_data['task_number']}")
+            logger.info("Открыта клавиатура календаря для задачи %s", task_data['task_number'])
             
-            await asyncio.sleep(settings.delete_message_timer)
-            await safe_delete_message(callback.message, f"result по задаче {task_data['task_number']}")
+            await deferred_actions.schedule_delete(callback.message, settings.delete_message_timer)
         else:
             await callback.message.answer(text=f"Укажите комментарий к задаче {tasks_data['name']}")
             await safe_delete_message(callback.message, f"result callback по задаче {task_data['task_number']}")
             await state.set_state(DoneTaskForm.worker_comment)
-            logger.info(f"Переход к состоянию комментария для задачи {task_data['task_number']}")
+            logger.info("Переход к состоянию комментария для задачи %s", task_data['task_number'])
             
-    except IndexError:
-        logger.error(f"Некорректный формат callback_data при обработке результата: {callback.data}")
-        await callback.message.answer("Ошибка: некорректные данные результата.")
     except Exception as e:
         # Получаем данные состояния для подробного логирования
         try:
@@ -349,9 +335,9 @@ async def process_result_press(callback: CallbackQuery, state: FSMContext):
         except:
             state_data = "Не удалось получить данные состояния"
             
-        logger.error(f"Ошибка при обработке результата: {e}. "
-                    f"Данные состояния: {state_data}. "
-                    f"Callback data: {callback.data}")
+        logger.error("Ошибка при обработке результата: %s. "
+                    "Данные состояния: %s. "
+                    "Callback data: %s", e, state_data, callback.data)
         await callback.message.answer("Произошла ошибка при обработке результата. Попробуйте еще раз.")
 
 
@@ -363,15 +349,15 @@ async def process_simple_calendar(callback: CallbackQuery, callback_data: dict,
         # Валидация состояния
         is_valid, task_data = await validate_task_state(state, ['task_number'])
         if not is_valid:
-            logger.error(f"Некорректное состояние при обработке календаря. "
-                        f"Данные: {task_data}. Пользователь: {callback.from_user.id}")
+            logger.error("Некорректное состояние при обработке календаря. "
+                        "Данные: %s. Пользователь: %s", task_data, callback.from_user.id)
             await callback.message.answer("Ошибка: данные задачи не найдены. Начните процесс заново.")
             await state.clear()
             return
 
         selected, date = await MySimpleCalendar().my_process_selection(callback, callback_data)
-        logger.info(f"Обработка календаря - дата: {date} - {callback.from_user.id} - "
-                    f"{callback.from_user.username}")
+        logger.info("Обработка календаря - дата: %s - %s - "
+                    "%s", date, callback.from_user.id, callback.from_user.username)
         
         if selected:
             await state.update_data(control_date=date)
@@ -382,21 +368,20 @@ async def process_simple_calendar(callback: CallbackQuery, callback_data: dict,
             # Получаем детали задачи
             tasks_data = await get_task_detail(task_data['task_number'])
             if not tasks_data:
-                logger.error(f"Задача {task_data['task_number']} не найдена при установке даты")
+                logger.error("Задача %s не найдена при установке даты", task_data['task_number'])
                 await callback.message.answer("Ошибка: задача не найдена. Обратитесь в техподдержку.")
                 await state.clear()
                 return
 
-            logger.info(f"Установлена контрольная дата {date} для задачи {task_data['task_number']} - "
-                       f"{callback.from_user.id} - {callback.from_user.username}")
+            logger.info("Установлена контрольная дата %s для задачи %s - "
+                       "%s - %s", date, task_data['task_number'], callback.from_user.id, callback.from_user.username)
 
             await callback.message.answer(
                 text=f"Укажите комментарий к задаче {tasks_data['name']}\n"
             )
             await state.set_state(DoneTaskForm.worker_comment)
             
-            await asyncio.sleep(settings.delete_message_timer)
-            await safe_delete_message(callback.message, f"календарь по задаче {task_data['task_number']}")
+            await deferred_actions.schedule_delete(callback.message, settings.delete_message_timer)
             
     except Exception as e:
         # Получаем данные состояния для подробного логирования
@@ -405,7 +390,7 @@ async def process_simple_calendar(callback: CallbackQuery, callback_data: dict,
         except:
             state_data = "Не удалось получить данные состояния"
             
-        logger.error(f"Ошибка при обработке календаря: {e}. "
-                    f"Данные состояния: {state_data}. "
-                    f"Callback data: {callback_data}")
+        logger.error("Ошибка при обработке календаря: %s. "
+                    "Данные состояния: %s. "
+                    "Callback data: %s", e, state_data, callback_data)
         await callback.message.answer("Произошла ошибка при выборе даты. Попробуйте еще раз.")
@@ -1,81 +1,82 @@
-import asyncio
 import logging
 
 from aiogram import Router
-from aiogram.filters import Text, StateFilter, Command
+from aiogram.filters import StateFilter, Command
 from aiogram.fsm.state import default_state
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message
 
-from app.database.database import get_task_detail, get_forward_supervisor_controller, post_add_comment, post_forward_task
+from app.database.database import get_task_detail, get_forward_supervisor_controller, clear_task_detail, \
+     clear_tasks_lists
+from app.filters.filters import CallbackRoute
 from app.forms.user_form import ForwardTaskForm
-from app.keyboards.trades_keyboards import create_trades_forward_inline_kb
-from app.services.redis_data import redis_clear
-from app.services.utils import clear_date
-from app.config import CENSUS
+from app.keyboards.callbacks import TaskForward, ForwardTo
+from app.keyboards.trades_keyboards import create_trades_forward_inline_kb, is_digest_markup
+from app.lexicon.lexicon import TASK_KEYS
+from app.services.callback_dispatch import CallbackDispatchRouter
+from app.services.task_cards import task_cards, FORWARD_CARD
+from app.services.utils import run_concurrently
+from app.services.completion import task_writes, new_flow_id
+from app.services.deferred import deferred_actions
+from app.services.outbox import outbox
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-router: Router = Router()
+router: Router = CallbackDispatchRouter()
 
 
-@router.callback_query(Text(startswith='first_forward'), StateFilter(default_state))
-async def process_forward_press(callback: CallbackQuery, state: FSMContext):
-    task_number = callback.data.split("_")[2]
-    logger.info(f"Получен ответ на переадресацию задачи {task_number} от {callback.message.from_user.id} - "
-                f"{callback.from_user.username}")
+@router.callback_query(CallbackRoute(TaskForward, legacy=TASK_KEYS['forward']['callback_data']),
+                       StateFilter(default_state))
+async def process_forward_press(callback: CallbackQuery, callback_data: TaskForward, state: FSMContext):
+    task_number = callback_data.number
+    logger.info("Получен ответ на переадресацию задачи %s от %s - "
+                "%s", task_number, callback.message.from_user.id, callback.from_user.username)
 
-    await state.update_data(task_number=task_number)
+    state_data, task = await run_concurrently(state.update_data(task_number=task_number,
+                                                                flow_id=new_flow_id()),
+                                              get_task_detail(task_number))
 
     logger.info(
-        f"Записаны данные в state {await state.get_data()} - {callback.from_user.id} - {callback.from_user.username}")
-
-    task = await get_task_detail(task_number)
-    date = clear_date(task['date'])
-    deadline = clear_date(task['deadline'])
-    author_comment = task['author_comment']['comment']
-
-    if task['base']['group'] == CENSUS:
-        author_comment = author_comment.split('_')[0]
-
-    text = f"Переадресовать задачу от " \
-           f"{date}\n\n" \
-           f"'{task['name']}'\n\n" \
-           f"<b>Исполнить до:</b>\n" \
-           f"{deadline}\n" \
-           f"<b>Автор:</b>\n" \
-           f"{task['author']['name']}\n" \
-           f"<b>Контрагент:</b>\n" \
-           f"{task['partner']['name']}\n" \
-           f"<b>Основание:</b>\n" \
-           f"{task['base']['name']}\n" \
-           f"<b>Комментарий автора:</b>\n" \
-           f"{author_comment}"
+        "Записаны данные в state %s - %s - %s", state_data, callback.from_user.id, callback.from_user.username)
+
+    text, _ = task_cards.render(task, FORWARD_CARD)
 
     trades_data = await get_forward_supervisor_controller(task['worker'], task['author'])
+    # Сводку задач не редактируем, а отвечаем отдельным сообщением
+    is_digest = is_digest_markup(callback.message.reply_markup)
+    forward_message = None if is_digest else callback.message
     if trades_data['status']:
-        await callback.message.edit_text(
-            text=text,
-            reply_markup=create_trades_forward_inline_kb(1, trades_data['result']))
+        if is_digest:
+            forward_message = await callback.message.answer(
+                text=text,
+                reply_markup=create_trades_forward_inline_kb(1, trades_data['result']))
+        else:
+            await callback.message.edit_text(
+                text=text,
+                reply_markup=create_trades_forward_inline_kb(1, trades_data['result']))
+    else:
+        forward_message = None
+        await callback.message.answer("Не удалось получить список адресатов. Попробуйте позже.")
 
-    await asyncio.sleep(5)
-    await callback.message.delete()
-    logger.info(f"Сообщение_first по задаче {task['number']} удалено")
+    if forward_message is not None:
+        await deferred_actions.schedule_delete(forward_message, settings.forward_message_timer)
+    logger.info("Сообщение_first по задаче %s поставлено на удаление", task['number'])
 
 
-@router.callback_query(Text(startswith='second_forward'), StateFilter(default_state))
-async def process_forward_press(callback: CallbackQuery, state: FSMContext):
-    author_number = callback.data.split("_")[2]
+@router.callback_query(CallbackRoute(ForwardTo, legacy='second_forward_'), StateFilter(default_state))
+async def process_forward_press(callback: CallbackQuery, callback_data: ForwardTo, state: FSMContext):
+    author_number = callback_data.code
     await state.update_data(next_user_id=author_number)
     task = await state.get_data()
-    logger.info(f"Получен номер {author_number} адресуемого по задаче {task['task_number']} от "
-                f"{callback.message.from_user.id} - "
-                f"{callback.from_user.username}")
+    logger.info("Получен номер %s адресуемого по задаче %s от "
+                "%s - "
+                "%s", author_number, task['task_number'], callback.message.from_user.id, callback.from_user.username)
     data = await state.get_data()
-    logger.info(f"Записаны данные {task} от {callback.message.from_user.id} - "
-                f"{callback.from_user.username}")
+    logger.info("Записаны данные %s от %s - "
+                "%s", task, callback.message.from_user.id, callback.from_user.username)
     task = await get_task_detail(data['task_number'])
-    date = clear_date(task['date'])
+    date = task_cards.view(task).date
 
     text = f"""
          Укажите комментарий к задаче от {date}\n\n"{task['name']}"\n ⬇️⬇️⬇️
@@ -87,44 +88,29 @@ async def process_forward_press(callback: CallbackQuery, state: FSMContext):
 
 @router.message(StateFilter(ForwardTaskForm.comment))
 async def add_forward_comment(message: Message, state: FSMContext):
-    data = await state.get_data()
-
-    task_number = data.get('task_number')
-    task = await get_task_detail(task_number)
-    task_base = task.get('base')
-
-    if task_base.get('group') == CENSUS:
-        census_comment = task.get('author_comment')
-        census_url = census_comment.get('comment').split("_")[1]
-        comment_id = await post_add_comment(task=data['task_number'], comment=f"{message.text}_{census_url}",
-                                            method='author')
-    else:
-        comment_id = await post_add_comment(task=data['task_number'], comment=message.text, method='author')
-
-    await state.update_data(comment=message.text)
-    await state.update_data(comment_id=comment_id)
-    data = await state.get_data()
-    logger.info(f"Получен комментарий '{message.text}' к задаче {data['task_number']} - "
-                f"{message.from_user.id} - {message.from_user.username}")
-    logger.info(f"Записаны в state данные {data} к задаче {data['task_number']} - "
-                f"{message.from_user.id} - {message.from_user.username}")
-
+    data = await state.update_data(comment=message.text)
     task = await get_task_detail(data['task_number'])
+    logger.info("Получен комментарий '%s' к задаче %s - "
+                "%s - %s", message.text, data['task_number'], message.from_user.id, message.from_user.username)
+    await state.clear()
 
-    if await post_forward_task(number=data['task_number'], comment_id=data['comment_id'], new_worker=data['next_user_id'],
-                               author=message.from_user.id):
-        await state.clear()
-        redis_clear(data['task_number'])
-        logger.info(f"Очищены в state данные к задаче {data['task_number']} - "
-                    f"{message.from_user.id} - {message.from_user.username}")
-        logger.info(f"Задача {data['task_number']} переадресована - "
-                    f"{message.from_user.id} - {message.from_user.username}")
-        await message.answer(f"Задача {task['name']} переадресована")
+    if settings.outbox_enabled and task is not None and await outbox.enqueue(
+            'forward', message.chat.id, {**data, 'task_name': task['name'], 'trade_id': message.from_user.id}):
+        # Запись в 1С выполнит фоновый потребитель, об ошибке он сообщит сам
+        await clear_tasks_lists(message.from_user.id)
+        logger.info("Переадресация задачи %s записана в outbox - "
+                    "%s - %s", data['task_number'], message.from_user.id, message.from_user.username)
+        await message.answer(f"Задача {task['name']} принята к переадресации")
+        return
+
+    res = await task_writes.forward(data)
+    await clear_task_detail(data['task_number'], message.from_user.id)
+    if res['status']:
+        logger.info("Задача %s переадресована - "
+                    "%s - %s", data['task_number'], message.from_user.id, message.from_user.username)
+        await message.answer(res['text'])
     else:
-        redis_clear(data['task_number'])
-        await state.clear()
-        logger.warning(f"Ошибка в задаче  {task['name']} - "
-                       f"{message.from_user.id} - {message.from_user.username}")
+        logger.warning("%s - %s - %s", res['text'], message.from_user.id, message.from_user.username)
         await message.answer(f"Произошла ошибка, позвоните в тех.поддержку")
 
 
@@ -132,5 +118,5 @@ async def add_forward_comment(message: Message, state: FSMContext):
 async def reset(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(f"Система перезагружена")
-    logger.info(f"Состояние очищено {message.from_user.id}")
+    logger.info("Состояние очищено %s", message.from_user.id)
 
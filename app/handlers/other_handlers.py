@@ -1,39 +1,95 @@
-import asyncio
 import logging
+from functools import partial
 from time import sleep
 
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, ContentType, ReplyKeyboardRemove, CallbackQuery
 from aiogram.fsm.context import FSMContext
 
-from app.config import settings, TASK_GROUP, CENSUS, DEBIT
-from app.database.database import get_trades_tasks_list, put_register, get_worker_f_chat_id
-from app.keyboards.trades_keyboards import create_trades_register_inline_kb, create_new_tasks_inline_kb, \
-     create_new_tasks_inline_kb_census, create_full_census_inline_kb
+from app.config import settings, CENSUS, DEBIT
+from app.database.database import get_trades_tasks_list, put_register, get_worker_identity, \
+     get_census_token, get_cached_trades_tasks_list
+from app.filters.filters import CallbackRoute
+from app.keyboards.callbacks import DigestPage
+from app.keyboards.trades_keyboards import create_trades_register_inline_kb, create_full_census_inline_kb, \
+     create_tasks_digest_inline_kb, DIGEST_CALLBACK_PREFIX
 from app.lexicon.lexicon import LEXICON
-from app.services.utils import clear_date, del_ready_task, update_task_message_id, token_generator
+from app.services.callback_dispatch import CallbackDispatchRouter
+from app.services.sender import send_scheduler
+from app.services.task_cards import task_cards, CENSUS_CARD, DEBIT_CARD
+from app.services.utils import del_ready_task, update_task_message_id
 
 logger = logging.getLogger(__name__)
 
-router: Router = Router()
+router: Router = CallbackDispatchRouter()
+
+DIGEST_COMMENT_LIMIT = 200
+
+
+def enqueue_task_cards(message: Message, tasks: list, variant: str):
+    """Карточки задач в очередь отправки чата; каждая собирается перед своей отправкой"""
+    for task in tasks:
+        send_scheduler.enqueue(partial(_task_card_message, message, task, variant), chat_id=message.chat.id)
+
+
+def _task_card_message(message: Message, task: dict, variant: str):
+    text, keyboard = task_cards.render(task, variant)
+    return message.answer(text=text, reply_markup=keyboard)
+
+
+def render_tasks_digest(tasks: list, group: str, page: int) -> tuple:
+    """Текст и клавиатура одной страницы сводки задач"""
+    pages = max(1, -(-len(tasks) // settings.digest_page_size))
+    page = min(max(page, 0), pages - 1)
+    start = page * settings.digest_page_size
+    page_tasks = tasks[start:start + settings.digest_page_size]
+
+    blocks = [f"{LEXICON['/tasks']} {len(tasks)}"]
+    for index, task in enumerate(page_tasks, start=start + 1):
+        view = task_cards.view(task)
+        title = f"Сенсус по адресу: '{view.name}'" if group == CENSUS else f"'{view.group_name}'"
+        author_comment = view.comment
+        if len(author_comment) > DIGEST_COMMENT_LIMIT:
+            author_comment = author_comment[:DIGEST_COMMENT_LIMIT] + "…"
+        blocks.append(f"<b>{index}.</b> Задача от {view.date}\n"
+                      f"{title}\n"
+                      f"<b>Исполнить до:</b> {view.deadline}\n"
+                      f"<b>Контрагент:</b> {view.partner}\n"
+                      f"<b>Комментарий автора:</b> {author_comment}")
+
+    keyboard = create_tasks_digest_inline_kb(page_tasks, group, page, pages, start=start + 1, census=group == CENSUS)
+    return "\n\n".join(blocks), keyboard
+
+
+async def send_tasks_digest(message: Message, group: str):
+    """Список задач одним сообщением с постраничной навигацией"""
+    tasks_list = await get_cached_trades_tasks_list(message.from_user.id, group, refresh=True)
+    if not tasks_list['status']:
+        await message.answer(text=tasks_list['text'])
+    elif len(tasks_list['text']) == 0:
+        await message.answer(text="У вас нет новых задач")
+    else:
+        text, keyboard = render_tasks_digest(tasks_list['text'], group, 0)
+        await message.answer(text=text, reply_markup=keyboard)
 
 
 @router.message(CommandStart())
 async def process_start_command(message: Message):
-    logger.info(f"Поступила команда старт - {message.from_user.id} - {message.from_user.username}")
+    logger.info("Поступила команда старт - %s - %s", message.from_user.id, message.from_user.username)
     await message.answer(LEXICON[message.text])
 
 
 @router.message(Command(commands='help'))
 async def process_help_command(message: Message):
-    logger.info(f"Поступила команда help - {message.from_user.id} - {message.from_user.username}")
+    logger.info("Поступила команда help - %s - %s", message.from_user.id, message.from_user.username)
     await message.answer(LEXICON[message.text])
 
 
 @router.message(Command(commands='register'))
 async def process_register_command(message: Message, ):
-    logger.info(f"Поступила команда регистрации - {message.from_user.id} - {message.from_user.username}")
+    logger.info("Поступила команда регистрации - %s - %s", message.from_user.id, message.from_user.username)
     await message.answer(
         text='Для регистрации необходимо нажать кнопку "Передать телефон"',
         reply_markup=create_trades_register_inline_kb())
@@ -44,8 +100,12 @@ async def census_tasks_command(message: Message, state: FSMContext):
 
     await state.clear()
     logger.info(
-        f"Поступила команда tasks - {message.from_user.id} - {message.from_user.username}. "
-        f"Состояние очищено")
+        "Поступила команда tasks - %s - %s. "
+        "Состояние очищено", message.from_user.id, message.from_user.username)
+
+    if settings.task_list_mode == 'digest':
+        await send_tasks_digest(message, CENSUS)
+        return
 
     tasks_list = await get_trades_tasks_list(message.from_user.id, CENSUS)
 
@@ -53,29 +113,7 @@ async def census_tasks_command(message: Message, state: FSMContext):
     if tasks_list['status']:
         if len(tasks_list['text']) > 0:
 
-            for task in tasks_list['text']:
-                date = clear_date(task['date'])
-                deadline = clear_date(task['deadline'])
-                author_comment = task['author_comment']['comment'].split('_')[0]
-
-                text = f"Задача от " \
-                       f"{date}\n\n" \
-                       f"Сенсус по адресу: '{task['name']}'\n\n" \
-                       f"<b>Исполнить до:</b>\n" \
-                       f"{deadline}\n" \
-                       f"<b>Автор:</b>\n" \
-                       f"{task['author']['name']}\n" \
-                       f"<b>Контрагент:</b>\n" \
-                       f"{task['partner']['name']}\n" \
-                       f"<b>Основание:</b>\n" \
-                       f"{task['base']['name']}\n" \
-                       f"<b>Комментарий автора:</b>\n" \
-                       f"{author_comment}"
-
-                await asyncio.sleep(2)
-                await message.answer(
-                    text=text,
-                    reply_markup=create_new_tasks_inline_kb_census(task))
+            enqueue_task_cards(message, tasks_list['text'], CENSUS_CARD)
         else:
             await message.answer(text="У вас нет новых задач")
     else:
@@ -87,38 +125,19 @@ async def debit_command(message: Message, state: FSMContext):
 
     await state.clear()
     logger.info(
-        f"Поступила команда tasks - {message.from_user.id} - {message.from_user.username}. "
-        f"Состояние очищено")
+        "Поступила команда tasks - %s - %s. "
+        "Состояние очищено", message.from_user.id, message.from_user.username)
+
+    if settings.task_list_mode == 'digest':
+        await send_tasks_digest(message, DEBIT)
+        return
 
     tasks_list = await get_trades_tasks_list(message.from_user.id, DEBIT)
 
     if tasks_list['status']:
         if len(tasks_list['text']) > 0:
 
-            for task in tasks_list['text']:
-
-                group_name = task['base']['group']
-                date = clear_date(task['date'])
-                deadline = clear_date(task['deadline'])
-
-                text = f"Задача от " \
-                       f"{date}\n\n" \
-                       f"'{TASK_GROUP[group_name]}'\n\n" \
-                       f"<b>Исполнить до:</b>\n" \
-                       f"{deadline}\n" \
-                       f"<b>Автор:</b>\n" \
-                       f"{task['author']['name']}\n" \
-                       f"<b>Контрагент:</b>\n" \
-                       f"{task['partner']['name']}\n" \
-                       f"<b>Основание:</b>\n" \
-                       f"{task['base']['name']}\n" \
-                       f"<b>Комментарий автора:</b>\n" \
-                       f"{task['author_comment']['comment']}"
-
-                await asyncio.sleep(1)
-                await message.answer(
-                    text=text,
-                    reply_markup=create_new_tasks_inline_kb(task))
+            enqueue_task_cards(message, tasks_list['text'], DEBIT_CARD)
 
         else:
             await message.answer(text="У вас нет новых задач")
@@ -126,12 +145,29 @@ async def debit_command(message: Message, state: FSMContext):
         await message.answer(text=tasks_list['text'])
 
 
+@router.callback_query(CallbackRoute(DigestPage, legacy=DIGEST_CALLBACK_PREFIX))
+async def tasks_digest_page(callback: CallbackQuery, callback_data: DigestPage):
+    """Переход по страницам сводки задач с редактированием сообщения"""
+    group, page = callback_data.group, callback_data.page
+    tasks_list = await get_cached_trades_tasks_list(callback.from_user.id, group)
+    if not tasks_list['status'] or len(tasks_list['text']) == 0:
+        await callback.answer(text="Список задач устарел, запросите его заново")
+        return
+
+    text, keyboard = render_tasks_digest(tasks_list['text'], group, page)
+    try:
+        await callback.message.edit_text(text=text, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        logger.info("Страница сводки не изменена - %s: %s", callback.from_user.id, e)
+    await callback.answer()
+
+
 @router.callback_query()
 async def unhandled_callback(callback: CallbackQuery, state: FSMContext):
     current_state = await state.get_state()
     logger.warning(
-        f"Необработанный callback '{callback.data}' - {callback.from_user.id} - {callback.from_user.username} - "
-        f"state={current_state}")
+        "Необработанный callback '%s' - %s - %s - "
+        "state=%s", callback.data, callback.from_user.id, callback.from_user.username, current_state)
     try:
         await callback.answer()
     except Exception:
@@ -146,7 +182,7 @@ async def get_contact(message: Message):
     chat_id = message.contact.user_id
     await message.delete()
     response = await put_register(phone=phone, chat_id=chat_id)
-    logger.info(f"Передан номер телефона - {phone} - {message.from_user.id} - {message.from_user.username}")
+    logger.info("Передан номер телефона - %s - %s - %s", phone, message.from_user.id, message.from_user.username)
     if response['status']:
         return await message.reply(text=response['message'], reply_markup=ReplyKeyboardRemove())
     else:
@@ -162,10 +198,13 @@ async def get_contact(message: Message):
 
 @router.message(Command(commands='census'))
 async def ful_census_command(message: Message):
-    logger.info(f"Поступила команда заполнения Сенсуса - {message.from_user.id} - {message.from_user.username}")
-    depart_res = await get_worker_f_chat_id(message.from_user.id)
-    department = depart_res.json()[0]['department']
-    token = token_generator(depart_res.json()[0])
+    logger.info("Поступила команда заполнения Сенсуса - %s - %s", message.from_user.id, message.from_user.username)
+    worker = await get_worker_identity(message.from_user.id)
+    if worker is None:
+        await message.answer(text="Вы не зарегистрированы в системе")
+        return
+    department = worker['department']
+    token = await get_census_token(message.from_user.id)
     census_url = f"{settings.api_base_url[:-7]}census/census-template/?" \
                  f"depart={department}&" \
                  f"worker={message.from_user.id}&" \
@@ -0,0 +1,70 @@
+from aiogram.filters.callback_data import CallbackData
+
+# Короткие префиксы: callback_data ограничена 64 байтами и разбирается по префиксу
+# в CallbackDispatchRouter. Кнопки в уже отправленных сообщениях несут прежний
+# формат ("ok_<номер>" и т.п.), его разбирают from_legacy и CallbackRoute.
+
+
+class TaskDone(CallbackData, prefix='d'):
+    """Кнопка "Выполнена" у задачи"""
+    number: str
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'TaskDone':
+        return cls(number=value)
+
+
+class TaskForward(CallbackData, prefix='f'):
+    """Кнопка "Переадресовать" у задачи"""
+    number: str
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'TaskForward':
+        return cls(number=value)
+
+
+class ForwardTo(CallbackData, prefix='fw'):
+    """Выбор адресата переадресации"""
+    code: str
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'ForwardTo':
+        return cls(code=value)
+
+
+class ContactType(CallbackData, prefix='c'):
+    """Выбор типа контакта (lexicon.TYPES)"""
+    type: str
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'ContactType':
+        return cls(type=value)
+
+
+class ContactPerson(CallbackData, prefix='p'):
+    """Выбор контактного лица контрагента"""
+    code: str
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'ContactPerson':
+        return cls(code=value)
+
+
+class ResultType(CallbackData, prefix='r'):
+    """Выбор результата действия"""
+    code: str
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'ResultType':
+        return cls(code=value)
+
+
+class DigestPage(CallbackData, prefix='g'):
+    """Страница сводки задач"""
+    group: str
+    page: int
+
+    @classmethod
+    def from_legacy(cls, value: str) -> 'DigestPage':
+        group, page = value.rsplit('_', 1)
+        return cls(group=group, page=int(page))
@@ -12,3 +12,13 @@ async def set_main_menu(bot: Bot):
     ) for command,
         description in LEXICON_COMMANDS.items()]
     await bot.set_my_commands(main_menu_commands)
+
+
+async def sync_main_menu(bot: Bot) -> bool:
+    """Установка меню, только если команды в Telegram отличаются от LEXICON_COMMANDS; True - меню обновлено"""
+    current = [(command.command.lstrip('/'), command.description) for command in await bot.get_my_commands()]
+    expected = [(command.lstrip('/'), description) for command, description in LEXICON_COMMANDS.items()]
+    if current == expected:
+        return False
+    await set_main_menu(bot)
+    return True
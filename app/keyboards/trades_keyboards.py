@@ -1,10 +1,70 @@
+from functools import lru_cache
+
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
-from app.lexicon.lexicon import TASK_KEYS
+from app.config import settings
+from app.keyboards.callbacks import TaskDone, TaskForward, ForwardTo, ContactType, ContactPerson, ResultType, \
+     DigestPage
+from app.lexicon.lexicon import LEXICON, TASK_KEYS, TYPES
 # from app.services.utils import clean_census_link
 
 
-def create_trades_register_inline_kb():
+class FrozenInlineKeyboardMarkup(InlineKeyboardMarkup):
+    """Разметка из кэша клавиатур: один объект уходит во многие сообщения, поэтому изменять его нельзя"""
+
+    class Config:
+        allow_mutation = False
+
+
+def _frozen_markup(width: int, buttons: list) -> FrozenInlineKeyboardMarkup:
+    kb_builder: InlineKeyboardBuilder = InlineKeyboardBuilder()
+    kb_builder.row(*buttons, width=width)
+    return FrozenInlineKeyboardMarkup(inline_keyboard=kb_builder.export())
+
+
+# Клавиатуры выбора строятся по содержимому кнопок: ключ lru_cache - ширина и
+# кортеж (текст, код) кнопок, одинаковые наборы (справочник результатов группы,
+# адресаты переадресации) строятся и валидируются один раз.
+
+@lru_cache(maxsize=settings.keyboard_cache_size)
+def _types_done_kb(width: int, items: tuple) -> FrozenInlineKeyboardMarkup:
+    return _frozen_markup(width, [InlineKeyboardButton(text=text, callback_data=ContactType(type=code).pack())
+                                  for code, text in items])
+
+
+@lru_cache(maxsize=settings.keyboard_cache_size)
+def _result_types_done_kb(width: int, items: tuple) -> FrozenInlineKeyboardMarkup:
+    return _frozen_markup(width, [InlineKeyboardButton(text=text, callback_data=ResultType(code=code).pack())
+                                  for code, text in items])
+
+
+@lru_cache(maxsize=settings.keyboard_cache_size)
+def _contact_person_done_kb(width: int, items: tuple) -> FrozenInlineKeyboardMarkup:
+    return _frozen_markup(width, [InlineKeyboardButton(text=text, callback_data=ContactPerson(code=code).pack())
+                                  for code, text in items])
+
+
+@lru_cache(maxsize=settings.keyboard_cache_size)
+def _trades_forward_kb(width: int, items: tuple) -> FrozenInlineKeyboardMarkup:
+    return _frozen_markup(width, [InlineKeyboardButton(text=text, callback_data=ForwardTo(code=code).pack())
+                                  for code, text in items])
+
+
+def keyboard_cache_stats() -> dict:
+    builders = {
+        'types': _types_done_kb,
+        'results': _result_types_done_kb,
+        'persons': _contact_person_done_kb,
+        'forward': _trades_forward_kb,
+    }
+    stats = {'hits': {}, 'misses': {}, 'size': {}}
+    for name, builder in builders.items():
+        info = builder.cache_info()
+        stats['hits'][name], stats['misses'][name], stats['size'][name] = info.hits, info.misses, info.currsize
+    return stats
+
+
+def _build_trades_register_kb() -> ReplyKeyboardMarkup:
 
     kb_builder: ReplyKeyboardBuilder = ReplyKeyboardBuilder()
 
@@ -19,22 +79,29 @@ def create_trades_register_inline_kb():
     return keyboard
 
 
+TRADES_REGISTER_KB = _build_trades_register_kb()
+
+
+def create_trades_register_inline_kb():
+    return TRADES_REGISTER_KB
+
+
 def create_new_tasks_inline_kb(task):
 
     done_button: InlineKeyboardButton = InlineKeyboardButton(
         text=TASK_KEYS['done']['text'],
-        callback_data=f"{TASK_KEYS['done']['callback_data']}{task['number']}")
+        callback_data=TaskDone(number=task['number']).pack())
     # not_done_button: InlineKeyboardButton = InlineKeyboardButton(
     #     text=TASK_KEYS['dont']['text'],
     #     callback_data=f"{TASK_KEYS['dont']['callback_data']}{task['number']}")
     forward_button: InlineKeyboardButton = InlineKeyboardButton(
         text=TASK_KEYS['forward']['text'],
-        callback_data=f"{TASK_KEYS['forward']['callback_data']}{task['number']}")
+        callback_data=TaskForward(number=task['number']).pack())
     if task['author']['code'] == 'HardCollect':  # Если задача хардовая
-        keyboard: InlineKeyboardMarkup = InlineKeyboardMarkup(
+        keyboard: InlineKeyboardMarkup = FrozenInlineKeyboardMarkup(
             inline_keyboard=[[done_button]])  # [not_done_button][1]
     else:
-        keyboard: InlineKeyboardMarkup = InlineKeyboardMarkup(
+        keyboard: InlineKeyboardMarkup = FrozenInlineKeyboardMarkup(
             inline_keyboard=[[done_button], [forward_button]])  # [not_done_button][1]
     return keyboard
 
@@ -49,74 +116,79 @@ def create_new_tasks_inline_kb_census(task):  # Клавиатура, тольк
     )
     forward_button: InlineKeyboardButton = InlineKeyboardButton(
         text=TASK_KEYS['forward']['text'],
-        callback_data=f"{TASK_KEYS['forward']['callback_data']}{task['number']}",
+        callback_data=TaskForward(number=task['number']).pack(),
     )
-    keyboard: InlineKeyboardMarkup = InlineKeyboardMarkup(
+    keyboard: InlineKeyboardMarkup = FrozenInlineKeyboardMarkup(
         inline_keyboard=[[census_button], [forward_button]])  # [not_done_button][1], [done_button]
     return keyboard
 
 
 def create_trades_forward_inline_kb(width: int, lst: list) -> InlineKeyboardMarkup:
-
-    kb_builder: InlineKeyboardBuilder = InlineKeyboardBuilder()
-
-    buttons: list[InlineKeyboardButton] = []
-    if lst:
-        for button in range(len(lst)):
-            if lst[button] is not None:
-                buttons.append(InlineKeyboardButton(
-                    text=lst[button]['name'],
-                    callback_data=f"second_forward_{lst[button]['code']}"))
-
-    kb_builder.row(*buttons, width=width)
-    return kb_builder.as_markup()
+    return _trades_forward_kb(width, tuple((item['code'], item['name']) for item in lst or () if item is not None))
 
 
 def create_types_done_inline_kb(width: int, dct: dict) -> InlineKeyboardMarkup:
-
-    kb_builder: InlineKeyboardBuilder = InlineKeyboardBuilder()
-
-    buttons: list[InlineKeyboardButton] = []
-
-    if dct:
-        for button in dct:
-            buttons.append(InlineKeyboardButton(
-                text=dct[button],
-                callback_data=f"contact_{button}"))
-
-    kb_builder.row(*buttons, width=width)
-    return kb_builder.as_markup()
+    return _types_done_kb(width, tuple((dct or {}).items()))
 
 
 def create_result_types_done_inline_kb(width: int, dct: dict) -> InlineKeyboardMarkup:
-
-    kb_builder: InlineKeyboardBuilder = InlineKeyboardBuilder()
-
-    buttons: list[InlineKeyboardButton] = []
-
-    if dct:
-        for button in dct:
-            buttons.append(InlineKeyboardButton(
-                text=button['name'],
-                callback_data=f"result_{button['code']}"))
-
-    kb_builder.row(*buttons, width=width)
-    return kb_builder.as_markup()
+    return _result_types_done_kb(width, tuple((button['code'], button['name']) for button in dct or ()))
 
 
 def create_contact_person_done_inline_kb(width: int, dct: dict):
-    kb_builder: InlineKeyboardBuilder = InlineKeyboardBuilder()
-
-    buttons: list[InlineKeyboardButton] = []
-
-    if dct:
-        for button in dct:
-            buttons.append(InlineKeyboardButton(
-                text=button['name'],
-                callback_data=f"person_{button['code']}"))
-
-    kb_builder.row(*buttons, width=width)
-    return kb_builder.as_markup()
+    return _contact_person_done_kb(width, tuple((str(button['code']), button['name']) for button in dct or ()))
+
+
+# Клавиатура типов действий не зависит от задачи - строится при импорте
+create_types_done_inline_kb(1, TYPES)
+
+
+DIGEST_CALLBACK_PREFIX = 'digest_'  # прежний формат кнопок сводки, новые - DigestPage
+DIGEST_PREFIXES = (f"{DigestPage.__prefix__}{DigestPage.__separator__}", DIGEST_CALLBACK_PREFIX)
+
+
+def create_tasks_digest_inline_kb(tasks: list, group: str, page: int, pages: int, start: int = 1,
+                                  census: bool = False) -> InlineKeyboardMarkup:
+    """Клавиатура сводки задач: кнопки действий по каждой задаче страницы и навигация по страницам"""
+
+    rows: list[list[InlineKeyboardButton]] = []
+    for index, task in enumerate(tasks, start=start):
+        if census:
+            first_button = InlineKeyboardButton(
+                text=f"{index}. {TASK_KEYS['census']}",
+                url=task['author_comment']['comment'].split('_')[1].strip())
+        else:
+            first_button = InlineKeyboardButton(
+                text=f"{index}. {TASK_KEYS['done']['text']}",
+                callback_data=TaskDone(number=task['number']).pack())
+        row = [first_button]
+        if census or task['author']['code'] != 'HardCollect':
+            row.append(InlineKeyboardButton(
+                text=f"{index}. {TASK_KEYS['forward']['text']}",
+                callback_data=TaskForward(number=task['number']).pack()))
+        rows.append(row)
+
+    # Строка навигации есть всегда: по ней хэндлеры отличают сводку от карточки задачи
+    navigation: list[InlineKeyboardButton] = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(
+            text=LEXICON['backward'], callback_data=DigestPage(group=group, page=page - 1).pack()))
+    navigation.append(InlineKeyboardButton(
+        text=f"{page + 1}/{pages}", callback_data=DigestPage(group=group, page=page).pack()))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton(
+            text=LEXICON['forward'], callback_data=DigestPage(group=group, page=page + 1).pack()))
+    rows.append(navigation)
+
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def is_digest_markup(markup) -> bool:
+    """Является ли клавиатура сообщения сводкой задач"""
+    if not markup or not getattr(markup, 'inline_keyboard', None):
+        return False
+    return any(button.callback_data and button.callback_data.startswith(DIGEST_PREFIXES)
+               for button in markup.inline_keyboard[-1])
 
 
 def create_full_census_inline_kb(url: str):
@@ -18,6 +18,7 @@ LEXICON: dict[str, str] = {
     '/tasks': '<b>Это список новых задач:</b>',
     '/reset': '<b>Перезагрузить состояние</b>',
     '/census': '<b>Сгенерировать ссылку на сенсус</b>',
+    'throttled': 'Слишком много нажатий, подождите немного',
     }
 
 LEXICON_COMMANDS: dict[str, str] = {
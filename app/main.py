@@ -1,12 +1,15 @@
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 import logging
 from aiogram import types
-from app.bot import bot, dp
-from app.config import settings, logger
+from app.config import settings, logger, setup_logging
 from contextlib import asynccontextmanager
 import sys
 
+# Логирование настраивается точкой входа до импорта остальных модулей приложения
+log_listener = setup_logging()
+
 
 def log_unhandled_exception(exc_type, exc_value, exc_traceback):
     """Log uncaught exceptions and forward them to telegram handler."""
@@ -18,29 +21,89 @@ def log_unhandled_exception(exc_type, exc_value, exc_traceback):
 
 sys.excepthook = log_unhandled_exception
 
-from app.keyboards.main_menu import set_main_menu
-from app.database.database import close_http_client
+from app.bot import bot, dp, throttling
+from app.keyboards.trades_keyboards import keyboard_cache_stats
+from app.database.database import reference_cache, task_cache, identity_cache, \
+    census_token_cache
+from app.services.api_client import api_client
+from app.services.sender import send_scheduler
+from app.services.deferred import deferred_actions
+from app.services.outbox import outbox
+from app.services.recorder import update_recorder
+from app.services.completion import task_writes
+from app.services.task_cards import task_cards
+from app.services.metrics import registry
+from app.services.loop_watchdog import loop_watchdog
+from app.services.update_queue import update_queue, inflight_updates
+from app.services.startup import prepare
+from app.services.redis_data import close_redis
 
 logger = logging.getLogger(__name__)
 
+registry.register_stats('logging', log_listener.stats)
+registry.register_stats('loop', loop_watchdog.stats)
+registry.register_stats('api', api_client.stats)
+registry.register_stats('telegram', send_scheduler.stats)
+registry.register_stats('update_queue', update_queue.stats)
+registry.register_stats('throttling', throttling.stats)
+registry.register_stats('task_writes', task_writes.stats)
+registry.register_stats('deferred', deferred_actions.stats)
+registry.register_stats('outbox', outbox.stats)
+registry.register_stats('task_cache', task_cache.stats)
+registry.register_stats('identity_cache', identity_cache.stats)
+registry.register_stats('census_token_cache', census_token_cache.stats)
+registry.register_stats('reference_cache', reference_cache.stats)
+registry.register_stats('keyboard_cache', keyboard_cache_stats)
+registry.register_stats('task_cards', task_cards.stats)
+if update_recorder is not None:
+    registry.register_stats('recorder', update_recorder.stats)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if settings.loop_watchdog_enabled:
+        loop_watchdog.start()
     try:
-        await set_main_menu(bot)
-        print("Webhook URL:", settings.webhook_url)
-        await bot.set_webhook(settings.webhook_url, allowed_updates=["message", "callback_query"])
-        logger.info("Webhook установлен успешно")
+        await prepare(bot)
+        reference_cache.start()
+        deferred_actions.start(bot)
+        outbox.start(bot)
+        if update_recorder is not None:
+            update_recorder.start()
+        if settings.webhook_mode == 'queue':
+            update_queue.start(dp, bot)
         yield
     except Exception as e:
         logger.exception("Ошибка при запуске приложения: %s", e)
         raise
     finally:
+        # Webhook не удаляется: пока процесс перезапускается, Telegram копит апдейты
+        # и доставит их новому процессу; начатые здесь апдейты дообрабатываются
+        await inflight_updates.drain(timeout=settings.update_drain_timeout)
         try:
-            await bot.delete_webhook()
-            logger.info("Webhook удален")
+            await update_queue.stop(timeout=settings.update_drain_timeout)
         except Exception as e:
-            logger.exception("Ошибка при удалении webhook: %s", e)
+            logger.exception("Ошибка при остановке очереди апдейтов: %s", e)
+
+        await reference_cache.stop()
+        # Невыполненные отложенные действия остаются в Redis до следующего запуска
+        await deferred_actions.stop()
+        # Недоставленные записи остаются в потоке outbox и будут доставлены после перезапуска
+        await outbox.stop()
+        if update_recorder is not None:
+            await update_recorder.stop()
+
+        try:
+            await send_scheduler.drain(timeout=settings.send_drain_timeout)
+        except Exception as e:
+            logger.exception("Ошибка при отправке очереди сообщений: %s", e)
+
+        if settings.delete_webhook_on_shutdown:
+            try:
+                await bot.delete_webhook()
+                logger.info("Webhook удален")
+            except Exception as e:
+                logger.exception("Ошибка при удалении webhook: %s", e)
         
         try:
             await bot.session.close()
@@ -55,20 +118,39 @@ async def lifespan(app: FastAPI):
             logger.exception("Ошибка при закрытии storage: %s", e)
         
         try:
-            await close_http_client()
+            await api_client.close()
             logger.info("HTTP клиент закрыт")
         except Exception as e:
             logger.exception("Ошибка при закрытии HTTP клиента: %s", e)
 
+        try:
+            await close_redis()
+            logger.info("Redis клиент закрыт")
+        except Exception as e:
+            logger.exception("Ошибка при закрытии Redis клиента: %s", e)
+
+        await loop_watchdog.stop()
+
 app = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None)
 
 
 @app.post(settings.webhook_path)
 async def webhook(request: Request):
+    if not inflight_updates.accepting:
+        # Процесс останавливается: Telegram повторит доставку следующему
+        return JSONResponse({"status": "shutting down"}, status_code=503)
     try:
         update_data = await request.json()
+        if update_recorder is not None:
+            update_recorder.record(update_data)
         update = types.Update(**update_data)
-        await dp.feed_webhook_update(bot=bot, update=update)
+        if settings.webhook_mode == 'queue':
+            if not await update_queue.put(update):
+                # Telegram повторит доставку позже
+                return JSONResponse({"status": "busy"}, status_code=503)
+            return {"status": "ok"}
+        with inflight_updates.track():
+            await dp.feed_webhook_update(bot=bot, update=update)
         return {"status": "ok"}
     except Exception as e:
         logger.exception("Ошибка при обработке webhook: %s", e)
@@ -78,7 +160,14 @@ async def webhook(request: Request):
 @app.get("/health")
 async def health_check():
     """Простая проверка состояния приложения"""
-    return {"status": "healthy", "service": "telegram_bot"}
+    return {"status": "healthy", "service": "telegram_bot", "update_queue": update_queue.stats(),
+            "outbox": outbox.stats()}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики процесса в формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,54 @@
+import time
+
+from aiogram import BaseMiddleware
+
+from app.services.metrics import HANDLER_ERRORS, HANDLER_SECONDS, UPDATE_SECONDS, UPDATES_IN_FLIGHT
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Число апдейтов в обработке и полное время обработки по типу события.
+
+    Подключается outer-middleware на dp.update, поэтому учитывает и апдейты,
+    отброшенные ограничением частоты или не нашедшие хэндлера.
+    """
+
+    async def __call__(self, handler, event, data):
+        UPDATES_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATES_IN_FLIGHT.dec()
+            UPDATE_SECONDS.observe(time.perf_counter() - started, event.event_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы хэндлера по роутеру (модулю) и имени функции.
+
+    Подключается inner-middleware на message и callback_query диспетчера и
+    срабатывает только для хэндлера, прошедшего фильтры.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._labels: dict = {}
+
+    def _handler_labels(self, callback) -> tuple:
+        labels = self._labels.get(callback)
+        if labels is None:
+            labels = self._labels[callback] = (callback.__module__.rsplit('.', 1)[-1], callback.__name__)
+        return labels
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get('handler')
+        if handler_object is None:
+            return await handler(event, data)
+        labels = self._handler_labels(handler_object.callback)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(*labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, *labels)
@@ -1,19 +1,155 @@
+import logging
+import time
+from collections import OrderedDict
+
 from aiogram import BaseMiddleware
-from aiogram.types import Message
-import asyncio
+from aiogram.types import CallbackQuery, Message
+
+from app.lexicon.lexicon import LEXICON
+
+logger = logging.getLogger(__name__)
+
+# Token bucket в одном атомарном вызове: KEYS[1] - ключ пользователя,
+# ARGV - rate (токенов/с), burst, now (с), cost. Ключ живёт, пока bucket
+# не наполнится, поэтому неактивные пользователи удаляются сами.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return allowed
+"""
+
+
+def take_token(tokens: float, ts: float, now: float, rate: float, burst: float, cost: float = 1.0):
+    """То же, что TOKEN_BUCKET_SCRIPT: возвращает (allowed, tokens)"""
+    tokens = min(burst, tokens + max(0.0, now - ts) * rate)
+    if tokens >= cost:
+        return True, tokens - cost
+    return False, tokens
+
+
+class MemoryThrottleBackend:
+    """Счётчики в памяти процесса; хранится не больше max_keys пользователей,
+    полностью восстановившиеся bucket'ы удаляются"""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+        self._recent: OrderedDict = OrderedDict()
+
+    def _evict(self, now: float):
+        idle = self.burst / self.rate
+        while self._buckets:
+            key, (tokens, ts) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - ts < idle:
+                break
+            self._buckets.popitem(last=False)
+        while self._recent:
+            key, expires_at = next(iter(self._recent.items()))
+            if len(self._recent) <= self.max_keys and expires_at > now:
+                break
+            self._recent.popitem(last=False)
+
+    async def allow(self, key: str) -> bool:
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(key, (self.burst, now))
+        allowed, tokens = take_token(tokens, ts, now, self.rate, self.burst)
+        self._buckets[key] = (tokens, now)
+        self._evict(now)
+        return allowed
+
+    async def first_seen(self, key: str, window: float) -> bool:
+        """True, если ключ не встречался последние window секунд"""
+        now = time.monotonic()
+        expires_at = self._recent.pop(key, None)
+        self._recent[key] = now + window
+        self._evict(now)
+        return expires_at is None or expires_at <= now
+
+
+class RedisThrottleBackend:
+    """Счётчики в Redis, общие для всех воркеров"""
+
+    def __init__(self, redis, rate: float, burst: float, prefix: str = 'throttle'):
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._take = redis.register_script(TOKEN_BUCKET_SCRIPT)
+        self.redis = redis
+
+    async def allow(self, key: str) -> bool:
+        allowed = await self._take(keys=[f"{self.prefix}:{key}"], args=[self.rate, self.burst, time.time(), 1])
+        return bool(allowed)
+
+    async def first_seen(self, key: str, window: float) -> bool:
+        return bool(await self.redis.set(f"{self.prefix}:seen:{key}", 1, nx=True, px=int(window * 1000)))
+
 
 class ThrottlingMiddleware(BaseMiddleware):
-    def __init__(self, rate_limit: float = 1.0):
+    """Ограничение частоты сообщений и нажатий кнопок на пользователя.
+
+    Подключается outer-middleware на message и callback_query. Сверх лимита
+    апдейт отбрасывается, на нажатие кнопки отвечается callback.answer().
+    Повторное нажатие той же кнопки в течение duplicate_window секунд тоже
+    отбрасывается, чтобы двойной клик не отправлял в API две одинаковые записи.
+    Сообщения в состояниях FSM из exempt_states (ввод комментария к задаче)
+    не ограничиваются: отброшенный комментарий потерялся бы, а FSM ждала бы
+    его бесконечно. При недоступности хранилища счётчиков апдейты пропускаются.
+    """
+
+    def __init__(self, backend, duplicate_window: float = 1.0, exempt_states=()):
         super().__init__()
-        self.rate_limit = rate_limit
-        self.rate_limit_dict = {}
+        self.backend = backend
+        self.duplicate_window = duplicate_window
+        self.exempt_states = frozenset(exempt_states)
+        self.allowed = 0
+        self.throttled = 0
+        self.duplicates = 0
 
     async def __call__(self, handler, event, data):
-        if isinstance(event, Message):
-            user_id = event.from_user.id
-            if user_id in self.rate_limit_dict:
-                last_time = self.rate_limit_dict[user_id]
-                if asyncio.get_event_loop().time() - last_time < self.rate_limit:
-                    return  # Пропускаем сообщение, если лимит превышен
-            self.rate_limit_dict[user_id] = asyncio.get_event_loop().time()
-        return await handler(event, data)
\ No newline at end of file
+        user = getattr(event, 'from_user', None)
+        if user is None:
+            return await handler(event, data)
+        if isinstance(event, Message) and data.get('raw_state') in self.exempt_states:
+            self.allowed += 1
+            return await handler(event, data)
+
+        try:
+            allowed = await self.backend.allow(str(user.id))
+            duplicate = allowed and isinstance(event, CallbackQuery) and bool(event.data) and \
+                not await self.backend.first_seen(f"{user.id}:{event.data}", self.duplicate_window)
+        except Exception as e:
+            logger.warning("Ограничение частоты не проверено: %s", e)
+            allowed, duplicate = True, False
+
+        if not allowed:
+            self.throttled += 1
+            logger.info("Апдейт от %s отброшен ограничением частоты", user.id)
+            if isinstance(event, CallbackQuery):
+                await event.answer(LEXICON['throttled'])
+            return
+        if duplicate:
+            self.duplicates += 1
+            logger.info("Повторное нажатие %s от %s отброшено", event.data, user.id)
+            await event.answer()
+            return
+
+        self.allowed += 1
+        return await handler(event, data)
+
+    def stats(self) -> dict:
+        return {'allowed': self.allowed, 'throttled': self.throttled, 'duplicates': self.duplicates}
@@ -0,0 +1,14 @@
+from aiogram import BaseMiddleware
+
+from app.services.update_context import enter_update, exit_update
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Id апдейта в контексте обработки (update_id_var) на всё время его обработки"""
+
+    async def __call__(self, handler, event, data):
+        token = enter_update(event.update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            exit_update(token)
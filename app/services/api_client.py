@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from app.config import settings, API_METHODS, API_TIMEOUTS
+from app.services.metrics import BACKEND_RESPONSES, BACKEND_SECONDS
+
+
+class BackendClient:
+    """Единый клиент API 1С.
+
+    Все запросы идут через один пул keep-alive соединений, поэтому TCP/TLS
+    рукопожатие выполняется только при открытии нового соединения.
+    Таймаут выбирается по ключу API_METHODS, заголовок авторизации
+    задаётся здесь же.
+    """
+
+    def __init__(self, base_url: str, token: str, max_connections: int, max_keepalive_connections: int,
+                 keepalive_expiry: float, timeouts: dict, default_timeout: float):
+        self.base_url = base_url
+        self.token = token
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeouts = timeouts
+        self.default_timeout = default_timeout
+        self._client = None
+        self.requests = Counter()
+        self.errors = Counter()
+        self.connections_opened = 0
+        self.warmed = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.default_timeout,
+                limits=self.limits,
+                headers={'Authorization': f"Token {self.token}"},
+            )
+        return self._client
+
+    async def _trace(self, event_name: str, info: dict):
+        if event_name == 'connection.connect_tcp.complete':
+            self.connections_opened += 1
+
+    def url(self, endpoint: str, path: str = '') -> str:
+        return f"{self.base_url}{API_METHODS[endpoint]}{path}"
+
+    async def request(self, method: str, endpoint: str, path: str = '', **kwargs) -> httpx.Response:
+        """Запрос к API по ключу API_METHODS; path дописывается к адресу метода"""
+        self.requests[endpoint] += 1
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().request(
+                method,
+                self.url(endpoint, path),
+                timeout=self.timeouts.get(endpoint, self.default_timeout),
+                extensions={'trace': self._trace},
+                **kwargs,
+            )
+        except httpx.HTTPError as e:
+            self.errors[endpoint] += 1
+            BACKEND_RESPONSES.inc(endpoint, type(e).__name__)
+            raise
+        finally:
+            BACKEND_SECONDS.observe(time.perf_counter() - started, endpoint, method)
+        BACKEND_RESPONSES.inc(endpoint, response.status_code)
+        return response
+
+    async def get(self, endpoint: str, path: str = '', **kwargs) -> httpx.Response:
+        return await self.request('GET', endpoint, path, **kwargs)
+
+    async def post(self, endpoint: str, path: str = '', **kwargs) -> httpx.Response:
+        return await self.request('POST', endpoint, path, **kwargs)
+
+    async def put(self, endpoint: str, path: str = '', **kwargs) -> httpx.Response:
+        return await self.request('PUT', endpoint, path, **kwargs)
+
+    async def warm_up(self, connections: int) -> int:
+        """Открытие connections соединений пула до первых запросов пользователей.
+
+        Параллельные HEAD на base_url занимают разные соединения, после ответа
+        они остаются в пуле keep-alive. Код ответа не важен, ошибки не мешают
+        запуску; возвращает число полученных ответов.
+        """
+        client = self._get_client()
+        results = await asyncio.gather(*(client.head(self.base_url, extensions={'trace': self._trace})
+                                         for _ in range(connections)), return_exceptions=True)
+        answered = sum(not isinstance(result, Exception) for result in results)
+        self.warmed += answered
+        return answered
+
+    def stats(self) -> dict:
+        total = sum(self.requests.values())
+        return {
+            'requests': total,
+            'connections_opened': self.connections_opened,
+            'connections_reused': max(total + self.warmed - self.connections_opened, 0),
+            'warmed': self.warmed,
+            'errors': sum(self.errors.values()),
+            'by_endpoint': dict(self.requests),
+        }
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+api_client = BackendClient(
+    base_url=settings.api_base_url,
+    token=settings.api_token,
+    max_connections=settings.api_max_connections,
+    max_keepalive_connections=settings.api_max_keepalive_connections,
+    keepalive_expiry=settings.api_keepalive_expiry,
+    timeouts={**API_TIMEOUTS, **settings.api_timeouts},
+    default_timeout=settings.api_timeout,
+)
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class LoaderCancelled(Exception):
+    """Загрузка ключа отменена вместе с вызвавшей её корутиной; ожидающие повторяют загрузку"""
+
+
+class AsyncTTLCache:
+    """Ограниченный LRU-кэш с TTL в памяти процесса.
+
+    get_or_load объединяет параллельные загрузки одного ключа (single-flight):
+    пока первая загрузка не завершилась, остальные вызовы ждут её результат,
+    а не запускают свою. Если задан version (значение -> версия), put не
+    заменяет закэшированное значение более старым.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, version: Callable[[Any], Any] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self._data: OrderedDict = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def keys(self) -> list:
+        return list(self._data.keys())
+
+    def get(self, key, default=None):
+        item = self._lookup(key)
+        return default if item is None else item[1]
+
+    def _is_older(self, value, current) -> bool:
+        new_version, current_version = self.version(value), self.version(current)
+        return new_version is not None and current_version is not None and new_version < current_version
+
+    def put(self, key, value, ttl: float = None) -> bool:
+        """Запись значения; False - в кэше уже более новая версия"""
+        if self.version is not None:
+            item = self._lookup(key)
+            if item is not None and self._is_older(value, item[1]):
+                return False
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return True
+
+    def invalidate(self, key):
+        """Удаление ключа; незавершённая загрузка этого ключа уже не попадёт в кэш"""
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self._inflight.clear()
+
+    async def get_or_load(self, key, loader: Callable[[Any], Awaitable[Any]]):
+        """Значение из кэша или результат loader(key); None не кэшируется.
+
+        Если загружающий вызов отменён, ожидающие не получают CancelledError:
+        первый из них запускает загрузку заново.
+        """
+        while True:
+            item = self._lookup(key)
+            if item is not None:
+                self.hits += 1
+                return item[1]
+
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except LoaderCancelled:
+                continue
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader(key)
+        except asyncio.CancelledError:
+            # Ожидающие проснутся после finally и не найдут загрузку в _inflight
+            future.set_exception(LoaderCancelled(key))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # ожидающих может не быть, помечаем исключение как полученное
+            raise
+        else:
+            if value is not None and self._inflight.get(key) is future:
+                self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,102 @@
+import heapq
+from typing import Any, Dict, List, Optional
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import REJECTED, UNHANDLED, SkipHandler
+from aiogram.dispatcher.event.handler import CallbackType, HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters.callback_data import CallbackQueryFilter
+from aiogram.types import TelegramObject
+
+
+def handler_prefixes(handler: HandlerObject) -> tuple:
+    """Префиксы callback_data, без которых фильтры хэндлера заведомо не пройдут.
+
+    Берутся из CallbackRoute (атрибут prefixes) или фильтра фабрики
+    CallbackData (CallbackQueryFilter). Пустой кортеж - хэндлер проверяется
+    для любого callback.
+    """
+    for filter_object in handler.filters or ():
+        callback_filter = filter_object.callback
+        prefixes = getattr(callback_filter, 'prefixes', None)
+        if prefixes:
+            return tuple(prefixes)
+        if isinstance(callback_filter, CallbackQueryFilter):
+            factory = callback_filter.callback_data
+            return f"{factory.__prefix__}{factory.__separator__}",
+    return ()
+
+
+class CallbackDispatchObserver(TelegramEventObserver):
+    """callback_query с выбором хэндлеров по префиксу callback_data.
+
+    Обычный observer проверяет фильтры всех хэндлеров по очереди до первого
+    совпадения. Здесь хэндлеры при регистрации раскладываются по префиксам,
+    и для callback проверяются только хэндлеры его префикса и хэндлеры без
+    префикса (catch-all) - по словарю, за число различных длин префиксов.
+    Порядок регистрации и фильтры хэндлеров (состояние и т.п.) сохраняются.
+    """
+
+    def __init__(self, router: Router, event_name: str) -> None:
+        super().__init__(router=router, event_name=event_name)
+        self._routes: Dict[str, List[tuple]] = {}
+        self._fallback: List[tuple] = []
+        self._prefix_lengths: tuple = ()
+
+    def register(self, callback: CallbackType, *filters: CallbackType, flags: Optional[Dict[str, Any]] = None,
+                 **kwargs: Any) -> CallbackType:
+        super().register(callback, *filters, flags=flags, **kwargs)
+        entry = (len(self.handlers) - 1, self.handlers[-1])
+        prefixes = handler_prefixes(entry[1])
+        if not prefixes:
+            self._fallback.append(entry)
+        for prefix in prefixes:
+            self._routes.setdefault(prefix, []).append(entry)
+        self._prefix_lengths = tuple(sorted({len(prefix) for prefix in self._routes}, reverse=True))
+        return callback
+
+    def candidates(self, data: str) -> list:
+        """Хэндлеры, которые могут принять callback с данными data, в порядке регистрации"""
+        buckets = [self._fallback] if self._fallback else []
+        for length in self._prefix_lengths:
+            bucket = self._routes.get(data[:length])
+            if bucket is not None:
+                buckets.append(bucket)
+        if len(buckets) == 1:
+            return [handler for _, handler in buckets[0]]
+        handlers, last = [], None
+        for index, handler in heapq.merge(*buckets, key=lambda entry: entry[0]):
+            if index != last:
+                handlers.append(handler)
+                last = index
+        return handlers
+
+    async def trigger(self, event: TelegramObject, **kwargs: Any) -> Any:
+        result, data = await self._handler.check(event, **kwargs)
+        if not result:
+            return REJECTED
+        kwargs.update(data)
+
+        for handler in self.candidates(getattr(event, 'data', None) or ''):
+            result, data = await handler.check(event, **kwargs)
+            if result:
+                kwargs.update(data, handler=handler)
+                try:
+                    wrapped_inner = self.outer_middleware.wrap_middlewares(
+                        self._resolve_middlewares(),
+                        handler.call,
+                    )
+                    return await wrapped_inner(event, kwargs)
+                except SkipHandler:
+                    continue
+
+        return UNHANDLED
+
+
+class CallbackDispatchRouter(Router):
+    """Router, у которого callback_query выбирает хэндлеры по префиксу callback_data"""
+
+    def __init__(self, *, name: Optional[str] = None) -> None:
+        super().__init__(name=name)
+        self.callback_query = CallbackDispatchObserver(router=self, event_name='callback_query')
+        self.observers['callback_query'] = self.callback_query
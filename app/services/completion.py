@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import uuid
+
+import httpx
+
+from app.config import settings, API_METHODS, CENSUS
+from app.database.database import get_task_detail, clear_task_detail
+from app.services.api_client import api_client
+from app.services.outbox import outbox
+from app.services.redis_data import save_to_redis, get_on_redis, redis_clear
+
+logger = logging.getLogger(__name__)
+
+
+class StepError(Exception):
+    """Шаг не выполнен: ответ API с ошибкой или исчерпаны повторы"""
+
+
+def new_flow_id() -> str:
+    """id сценария выполнения/переадресации, хранится в данных FSM с начала сценария"""
+    return uuid.uuid4().hex
+
+
+class TaskWritePipeline:
+    """Записи в 1С по задаче, выполняемые по шагам.
+
+    Выполнение: комментарий исполнителя -> результат -> PUT задачи.
+    Переадресация: комментарий автора -> PUT задачи на нового исполнителя.
+
+    Прогресс хранится в Redis (completion:/forward:<номер задачи>:<сценарий>):
+    после каждого успешного шага записывается его id, поэтому повторная
+    попытка того же сценария продолжает с упавшего шага, а не создаёт
+    комментарий и результат заново. Выполненный шаг не повторяется, даже если
+    данные изменились (например, пользователь при повторе ввёл другой
+    комментарий): используется сохранённый id. Сценарий - flow_id из данных
+    FSM, без него - текущий исполнитель задачи, поэтому следующая переадресация
+    или выполнение той же задачи начинается с чистого прогресса. После
+    последнего шага прогресс удаляется. Каждый запрос несёт заголовок
+    Idempotency-Key (сценарий, шаг), сетевые ошибки и 5xx повторяются с
+    экспоненциальной паузой.
+    """
+
+    def __init__(self, attempts: int, retry_delay: float, state_ttl: int):
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.state_ttl = state_ttl
+        self.steps_done = 0
+        self.steps_skipped = 0
+        self.retries = 0
+
+    async def _request(self, method: str, endpoint: str, idempotency_key: str, **kwargs) -> httpx.Response:
+        for attempt in range(1, self.attempts + 1):
+            try:
+                response = await api_client.request(method, endpoint, headers={'Idempotency-Key': idempotency_key},
+                                                    **kwargs)
+                if response.status_code < 500:
+                    return response
+                error = f"статус {response.status_code}"
+            except httpx.TransportError as e:
+                error = repr(e)
+            if attempt < self.attempts:
+                self.retries += 1
+                logger.warning("%s %s (%s) - %s, повтор %s/%s",
+                               method, API_METHODS[endpoint], idempotency_key, error, attempt, self.attempts - 1)
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        raise StepError(error)
+
+    async def _step(self, progress: dict, key: str, name: str, method: str, endpoint: str, **kwargs):
+        """Выполнение шага, если он ещё не выполнен; возвращает id из ответа API"""
+        done = progress.get(name)
+        if done:
+            self.steps_skipped += 1
+            logger.info("Шаг %s по %s уже выполнен, id=%s", name, key, done['id'])
+            return done['id']
+
+        response = await self._request(method, endpoint, f"{key}:{name}", **kwargs)
+        if response.status_code != 201:
+            raise StepError(f"{API_METHODS[endpoint]} - статус {response.status_code}")
+        step_id = response.json().get('id') if name != 'task' else True
+        progress[name] = {'id': step_id}
+        await save_to_redis(key, progress, ttl=self.state_ttl)
+        self.steps_done += 1
+        logger.info("%s %s по %s - %s, id=%s", method, API_METHODS[endpoint], key, response.status_code, step_id)
+        return step_id
+
+    @staticmethod
+    async def _finish(key: str):
+        """Удаление прогресса после последнего шага; если Redis недоступен, ключ истечёт по state_ttl"""
+        try:
+            await redis_clear(key)
+        except Exception as e:
+            logger.warning("Прогресс %s не удалён: %s", key, e)
+
+    @staticmethod
+    def progress_key(kind: str, data: dict, task: dict) -> str:
+        flow = data.get('flow_id') or task['worker']['code']
+        return f"{kind}:{task['number']}:{flow}"
+
+    async def complete(self, result: dict) -> dict:
+        """Выполнение задачи по данным FSM; формат ответа {'status': bool, 'text': str}"""
+        number = result['task_number']
+        async_task = await get_task_detail(number)  # Получаем задачу из кэша
+        if async_task is None:
+            return {"status": False, 'text': "Задача не найдена"}
+
+        key = self.progress_key('completion', result, async_task)
+        progress = await get_on_redis(key) or {}
+        if progress.get('task'):
+            logger.info("Задача %s уже выполнена, повторный запрос пропущен", number)
+            return {"status": True, 'text': f"Задача {async_task['name']} выполнена"}
+
+        try:
+            comment = {"comment": result['worker_comment'], "worker": async_task['worker']['code']}
+            worker_comment_id = await self._step(progress, key, 'comment', 'POST', 'worker_comment', json=comment)
+            logger.info("Создан комментарий по id=%s", worker_comment_id)
+
+            control_date = result.get('control_date')
+            result_item = {
+                "type": result['task_type'],
+                "result": result['result'],
+                "contact_person": result['contact_person'],
+                "base": async_task['base']['number'],
+                "task_number": number,
+                "control_date": control_date.date() if control_date else None,
+            }
+            logger.info("Контрольная дата для результата %s - %s: %s", result_item, number, result_item['control_date'])
+            result_id = await self._step(progress, key, 'result', 'POST', 'result', data=result_item)
+
+            task = {
+                'number': async_task['number'],
+                'name': async_task['name'],
+                'date': async_task['date'],
+                'status': "Выполнено",
+                "deadline": async_task['deadline'],
+                "edit_date": async_task['edit_date'],
+                "edited": True,
+                'worker': async_task['worker']['code'],
+                'partner': async_task['partner']['code'],
+                'author': async_task['author']['code'],
+                'author_comment': async_task['author_comment']['id'],
+                'worker_comment': worker_comment_id,
+                'base': async_task['base']['number'],
+                'result': result_id,
+            }
+            await self._step(progress, key, 'task', 'PUT', 'tasks', data=task)
+            await self._finish(key)
+        except (StepError, httpx.HTTPError) as e:
+            logger.warning("Выполнение задачи %s остановлено: %s. Выполненные шаги: %s", number, e, list(progress))
+            return {"status": False, 'text': "Не удалось сохранить выполнение задачи в 1С. Отправьте комментарий "
+                                             "ещё раз - уже сохранённые данные повторно не отправятся"}
+
+        return {"status": True, 'text': f"Задача {task['name']} выполнена"}
+
+    async def forward(self, data: dict) -> dict:
+        """Переадресация задачи по данным FSM; формат ответа {'status': bool, 'text': str}"""
+        number = data['task_number']
+        task_data = await get_task_detail(number)
+        if task_data is None:
+            return {"status": False, 'text': "Задача не найдена"}
+
+        key = self.progress_key('forward', data, task_data)
+        progress = await get_on_redis(key) or {}
+        if progress.get('task'):
+            logger.info("Задача %s уже переадресована, повторный запрос пропущен", number)
+            return {"status": True, 'text': f"Задача {task_data['name']} переадресована"}
+
+        comment_text = data['comment']
+        if task_data['base'].get('group') == CENSUS:
+            census_url = task_data['author_comment']['comment'].split("_")[1]
+            comment_text = f"{comment_text}_{census_url}"
+
+        try:
+            comment = {"comment": comment_text, "author": task_data['worker']['code']}
+            comment_id = await self._step(progress, key, 'comment', 'POST', 'author_comment', json=comment)
+            task = {
+                'status': "Переадресована",
+                'edited': True,
+                'author_comment': int(comment_id),
+                'author': task_data['worker']['code'],
+                'worker': data['next_user_id'],
+                'worker_comment': settings.constant_comment_id,
+                'base': task_data['base']['number'],
+                'partner': task_data['partner']['code'],
+                'number': task_data['number'],
+                'name': task_data['name'],
+                'date': task_data['date'],
+                'deadline': task_data['deadline'],
+            }
+            await self._step(progress, key, 'task', 'PUT', 'tasks', data=task)
+            await self._finish(key)
+        except (StepError, httpx.HTTPError) as e:
+            logger.warning("Переадресация задачи %s остановлена: %s. Выполненные шаги: %s", number, e, list(progress))
+            return {"status": False, 'text': f"Не удалось переадресовать задачу {task_data['name']}"}
+
+        return {"status": True, 'text': f"Задача {task_data['name']} переадресована"}
+
+    def max_duration(self, endpoints: tuple) -> float:
+        """Худшее время записи по шагам endpoints: все попытки каждого шага до таймаута и паузы между ними"""
+        timeouts = [api_client.timeouts.get(endpoint, api_client.default_timeout) for endpoint in endpoints]
+        backoff = sum(self.retry_delay * 2 ** (attempt - 1) for attempt in range(1, self.attempts))
+        task_read = api_client.timeouts.get('all-tasks', api_client.default_timeout)  # get_task_detail
+        return task_read + sum(self.attempts * timeout + backoff for timeout in timeouts)
+
+    def stats(self) -> dict:
+        return {'steps_done': self.steps_done, 'steps_skipped': self.steps_skipped, 'retries': self.retries}
+
+
+task_writes = TaskWritePipeline(
+    attempts=settings.completion_step_attempts,
+    retry_delay=settings.completion_retry_delay,
+    state_ttl=settings.completion_state_ttl,
+)
+
+
+async def _deliver_complete(data: dict):
+    res = await task_writes.complete(data)
+    if not res['status']:
+        raise StepError(res['text'])
+    await clear_task_detail(data['task_number'], data.get('trade_id'))
+
+
+async def _deliver_forward(data: dict):
+    res = await task_writes.forward(data)
+    if not res['status']:
+        raise StepError(res['text'])
+    await clear_task_detail(data['task_number'], data.get('trade_id'))
+
+
+outbox.register('complete', _deliver_complete,
+                lambda data: f"Не удалось сохранить выполнение задачи {data.get('task_name', data['task_number'])} "
+                             f"в 1С. Выполните задачу ещё раз или позвоните в тех.поддержку",
+                task_writes.max_duration(('worker_comment', 'result', 'tasks')))
+outbox.register('forward', _deliver_forward,
+                lambda data: f"Не удалось переадресовать задачу {data.get('task_name', data['task_number'])}. "
+                             f"Переадресуйте задачу ещё раз или позвоните в тех.поддержку",
+                task_writes.max_duration(('author_comment', 'tasks')))
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from app.config import settings
+from app.services.redis_data import r
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredActions:
+    """Отложенные удаления сообщений вместо asyncio.sleep в хэндлерах.
+
+    Задания лежат в Redis в sorted set (score - время исполнения), поэтому
+    переживают перезапуск процесса. Фоновый цикл раз в poll_interval
+    забирает все наступившие задания одной транзакцией (ZRANGEBYSCORE +
+    ZREMRANGEBYSCORE), так что при нескольких воркерах каждое задание
+    выполняется один раз, и исполняет их параллельно.
+    """
+
+    KEY = 'deferred:actions'
+    DELETE = 'delete'
+
+    def __init__(self, poll_interval: float = 0.5):
+        self.poll_interval = poll_interval
+        self._task = None
+        self._local_tasks: set[asyncio.Task] = set()
+        self.executed = 0
+        self.failed = 0
+
+    async def schedule(self, action: str, chat_id: int, message_id: int, delay: float):
+        item = json.dumps({'action': action, 'chat_id': chat_id, 'message_id': message_id})
+        try:
+            await r.zadd(self.KEY, {item: time.time() + delay})
+        except Exception as e:
+            # Без Redis выполняем задание в фоне этого процесса
+            logger.warning("Отложенное действие не сохранено в Redis, выполняется в памяти: %s", e)
+            task = asyncio.create_task(self._execute_later(Bot.get_current(no_error=False), item, delay))
+            # Ссылка на задачу нужна, иначе event loop может удалить её сборщиком мусора до выполнения
+            self._local_tasks.add(task)
+            task.add_done_callback(self._local_tasks.discard)
+
+    async def schedule_delete(self, message: Message, delay: float):
+        await self.schedule(self.DELETE, message.chat.id, message.message_id, delay)
+
+    async def _take_due(self) -> list:
+        now = time.time()
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.zrangebyscore(self.KEY, '-inf', now)
+            pipe.zremrangebyscore(self.KEY, '-inf', now)
+            items, _ = await pipe.execute()
+        return items
+
+    async def _execute(self, bot: Bot, item: str):
+        try:
+            data = json.loads(item)
+            if data['action'] == self.DELETE:
+                await bot.delete_message(chat_id=data['chat_id'], message_id=data['message_id'])
+            self.executed += 1
+        except TelegramBadRequest as e:
+            logger.warning("Отложенное действие %s не выполнено: %s", item, e)
+        except Exception as e:
+            self.failed += 1
+            logger.error("Ошибка отложенного действия %s: %s", item, e)
+
+    async def _execute_later(self, bot: Bot, item: str, delay: float):
+        await asyncio.sleep(delay)
+        await self._execute(bot, item)
+
+    async def _run(self, bot: Bot):
+        while True:
+            try:
+                items = await self._take_due()
+                if items:
+                    await asyncio.gather(*(self._execute(bot, item) for item in items))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка цикла отложенных действий: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self, bot: Bot):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {'executed': self.executed, 'failed': self.failed}
+
+
+deferred_actions = DeferredActions(poll_interval=settings.deferred_poll_interval)
@@ -0,0 +1,78 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+from aiogram import Bot
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisEventIsolation, RedisStorage
+
+from app.config import settings
+from app.services.redis_data import r
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+def _object_hook(obj: dict):
+    if len(obj) == 1:
+        if '$dt' in obj:
+            return datetime.fromisoformat(obj['$dt'])
+        if '$d' in obj:
+            return date.fromisoformat(obj['$d'])
+    return obj
+
+
+def dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+def loads(value: str) -> Dict[str, Any]:
+    return json.loads(value, object_hook=_object_hook)
+
+
+class CompactRedisStorage(RedisStorage):
+    """RedisStorage с компактным JSON (без пробелов и \\u-экранирования кириллицы).
+
+    Даты сохраняются как {"$dt": iso} и восстанавливаются обратно в datetime,
+    поэтому control_date из календаря переживает переход между воркерами.
+    """
+
+    async def set_data(self, bot: Bot, key: StorageKey, data: Dict[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.redis.delete(redis_key)
+            return
+        await self.redis.set(redis_key, dumps(data), ex=self.data_ttl)
+
+    async def get_data(self, bot: Bot, key: StorageKey) -> Dict[str, Any]:
+        value = await self.redis.get(self.key_builder.build(key, "data"))
+        if value is None:
+            return {}
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return loads(value)
+
+    async def close(self) -> None:
+        # Клиент Redis общий для приложения и закрывается в close_redis()
+        pass
+
+
+def create_fsm_storage() -> tuple[BaseStorage, Optional[BaseEventIsolation]]:
+    """Хранилище FSM по settings.fsm_storage.
+
+    redis - состояние в Redis с TTL для брошенных сценариев и блокировкой
+    апдейтов одного пользователя между воркерами; memory - в памяти процесса,
+    только для одного воркера.
+    """
+    if settings.fsm_storage == 'memory':
+        return MemoryStorage(), None
+    key_builder = DefaultKeyBuilder(prefix='fsm')
+    storage = CompactRedisStorage(r, key_builder=key_builder,
+                                  state_ttl=settings.fsm_state_ttl, data_ttl=settings.fsm_data_ttl)
+    return storage, RedisEventIsolation(r, key_builder=key_builder)
@@ -1,7 +1,18 @@
 import logging
 import asyncio
+import atexit
+import json
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
 import httpx
 from app.config import settings
+from app.services.update_context import update_id_var
+
+TELEGRAM_API_URL = 'https://api.telegram.org'
 
 # Основной логгер модуля
 logger = logging.getLogger(__name__)
@@ -33,7 +44,7 @@ class TelegramLogsHandler(logging.Handler):
         """Асинхронная отправка сообщения в Telegram"""
         try:
             async with httpx.AsyncClient(timeout=10.0) as client:
-                url = f'https://api.telegram.org/bot{settings.logs_bot}/sendMessage'
+                url = f'{settings.telegram_api_url or TELEGRAM_API_URL}/bot{settings.logs_bot}/sendMessage'
                 data = {
                     'chat_id': chat_id,
                     'text': message,
@@ -58,34 +69,299 @@ class TelegramLogsHandler(logging.Handler):
 
 
 class SafeTelegramLogsHandler(logging.Handler):
-    """Безопасная версия обработчика логов для Telegram (синхронная)"""
-    
+    """Безопасная версия обработчика логов для Telegram.
+
+    emit не делает сетевых запросов: запись кладётся в ограниченную очередь,
+    а отправляет её фоновый поток. Если очередь заполнена, запись
+    отбрасывается (счётчик dropped), поток логирования не блокируется.
+
+    Одинаковые ошибки (логгер, место вызова, шаблон сообщения, тип исключения)
+    в пределах group_window секунд отправляются один раз и не занимают место
+    в очереди, по истечении окна приходит сводка "xN". Между сообщениями
+    выдерживается min_interval, на 429 поток ждёт retry_after из ответа Telegram.
+    """
+
+    def __init__(self, level=logging.NOTSET, queue_size: int = 1000, group_window: float = 60.0,
+                 min_interval: float = 1.0):
+        super().__init__(level)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.group_window = group_window
+        self.min_interval = min_interval
+        self.sent = 0
+        self.dropped = 0
+        self.grouped = 0
+        self._pending: dict[tuple, list] = {}
+        self._groups_lock = threading.Lock()
+        self._last_send = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(record: logging.LogRecord) -> tuple:
+        exc_type = getattr(record, 'exc_type', None)
+        if exc_type is None and record.exc_info and record.exc_info[0]:
+            exc_type = record.exc_info[0].__name__
+        return record.name, record.pathname, record.lineno, str(record.msg), exc_type
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name='telegram-logs', daemon=True)
+                    self._thread.start()
+
     def emit(self, record):
-        """Синхронная отправка логов с обработкой ошибок"""
+        """Постановка записи в очередь без ожидания; повтор уже отправленной ошибки только увеличивает счётчик"""
+        try:
+            self._ensure_worker()
+            fingerprint = self.fingerprint(record)
+            with self._groups_lock:
+                group = self._pending.get(fingerprint)
+                if group is not None:
+                    group[1] += 1
+                    self.grouped += 1
+                    return
+                self.queue.put_nowait((fingerprint, record))
+                self._pending[fingerprint] = [None, 0, time.monotonic()]
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _worker(self):
+        with httpx.Client(timeout=5.0) as client:
+            while not self._stop.is_set() or not self.queue.empty():
+                try:
+                    fingerprint, record = self.queue.get(timeout=0.5)
+                except queue.Empty:
+                    pass
+                else:
+                    self._process(client, fingerprint, record)
+                self._flush_groups(client)
+            self._flush_groups(client, force=True)
+
+    def _process(self, client: httpx.Client, fingerprint: tuple, record: logging.LogRecord):
         try:
-            update_id = settings.admin_id
             log_entry = self.format(record)
-            
-            if len(log_entry) > 4000:
-                log_entry = log_entry[:4000] + "... (обрезано)"
-            
-            with httpx.Client(timeout=5.0) as client:
-                url = f'https://api.telegram.org/bot{settings.logs_bot}/sendMessage'
-                data = {
-                    'chat_id': update_id,
-                    'text': log_entry,
-                    'parse_mode': 'HTML'
-                }
-                
-                response = client.post(url, data=data)
-                
-                if response.status_code != 200:
-                    internal_logger.error(
-                        "Ошибка отправки лога в Telegram: %s",
-                        response.status_code,
-                    )
-                    
-        except httpx.TimeoutException:
-            internal_logger.error("Таймаут при отправке лога в Telegram")
+            with self._groups_lock:
+                self._pending[fingerprint][0] = log_entry
         except Exception as e:
+            with self._groups_lock:
+                self._pending.pop(fingerprint, None)
             internal_logger.exception("Ошибка в TelegramLogsHandler: %s", e)
+            return
+        self._send(client, log_entry)
+
+    def _flush_groups(self, client: httpx.Client, force: bool = False):
+        now = time.monotonic()
+        expired = []
+        with self._groups_lock:
+            for fingerprint, (log_entry, repeats, started) in list(self._pending.items()):
+                # Группа закрывается только после отправки первой записи
+                if log_entry is None or not force and now - started < self.group_window:
+                    continue
+                del self._pending[fingerprint]
+                expired.append((log_entry, repeats, started))
+        for log_entry, repeats, started in expired:
+            if repeats:
+                self._send(client, f"<b>x{repeats}</b> повтор(ов) за {now - started:.0f} с:\n{log_entry}")
+
+    def _send(self, client: httpx.Client, log_entry: str):
+        if len(log_entry) > 4000:
+            log_entry = log_entry[:4000] + "... (обрезано)"
+        url = f'{settings.telegram_api_url or TELEGRAM_API_URL}/bot{settings.logs_bot}/sendMessage'
+        data = {
+            'chat_id': settings.admin_id,
+            'text': log_entry,
+            'parse_mode': 'HTML'
+        }
+        for _ in range(3):
+            wait = self._last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = client.post(url, data=data)
+            except httpx.TimeoutException:
+                internal_logger.error("Таймаут при отправке лога в Telegram")
+                return
+            except Exception as e:
+                internal_logger.exception("Ошибка в TelegramLogsHandler: %s", e)
+                return
+            finally:
+                self._last_send = time.monotonic()
+
+            if response.status_code == 200:
+                self.sent += 1
+                return
+            if response.status_code == 429:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+                time.sleep(retry_after)
+                continue
+            if response.status_code == 400 and 'parse_mode' in data:
+                # В тексте исключения могут быть символы, ломающие HTML-разметку
+                data.pop('parse_mode')
+                continue
+            internal_logger.error(
+                "Ошибка отправки лога в Telegram: %s",
+                response.status_code,
+            )
+            return
+
+    def close(self):
+        """Отправка накопленного перед завершением процесса"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10.0)
+        super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON: время, уровень, логгер, место вызова, id апдейта, сообщение"""
+
+    def format(self, record):
+        entry = {
+            'ts': f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'where': f"{record.filename}:{record.lineno}",
+            'msg': record.getMessage(),
+        }
+        update_id = getattr(record, 'update_id', None)
+        if update_id is not None:
+            entry['update_id'] = update_id
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class UpdateContextFilter(logging.Filter):
+    """Добавляет в запись id апдейта и отбирает долю INFO.
+
+    Выборка детерминирована по id апдейта: для попавшего в выборку апдейта
+    сохраняются все его записи. Записи вне апдейта (фоновые задачи)
+    отбираются случайно, WARNING и выше сохраняются всегда.
+    """
+
+    def __init__(self, info_sample_rate: float = 1.0):
+        super().__init__()
+        self.info_sample_rate = info_sample_rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        update_id = update_id_var.get()
+        record.update_id = update_id
+        if record.levelno != logging.INFO or self.info_sample_rate >= 1.0:
+            return True
+        if update_id is not None:
+            keep = (update_id * 2654435761) % 2 ** 32 < self.info_sample_rate * 2 ** 32
+        else:
+            keep = random.random() < self.info_sample_rate
+        if not keep:
+            self.sampled_out += 1
+        return keep
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Кладёт запись в очередь без ожидания.
+
+    Сообщение собирается из шаблона и аргументов (длинные обрезаются до
+    max_arg_length) и traceback переводится в текст ещё в вызывающем потоке:
+    аргументы - state FSM, задачи, апдейты - могут измениться к моменту, когда
+    запись дойдёт до потока LogListener. Файлы, консоль и Telegram работают в
+    потоке LogListener. При заполненной очереди запись отбрасывается (счётчик
+    dropped).
+    """
+
+    exc_formatter = logging.Formatter()
+
+    def __init__(self, log_queue: queue.Queue, targets: list, max_arg_length: int):
+        super().__init__(log_queue)
+        self.targets = tuple(targets)
+        self.max_arg_length = max_arg_length
+        self.dropped = 0
+
+    def _truncate(self, value):
+        if value is None or isinstance(value, (int, float)):
+            return value
+        text = str(value)
+        if len(text) <= self.max_arg_length:
+            return value
+        return f"{text[:self.max_arg_length]}... (обрезано {len(text) - self.max_arg_length})"
+
+    def prepare(self, record):
+        if isinstance(record.args, tuple):
+            record.args = tuple(self._truncate(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            # LogRecord разворачивает единственный аргумент-словарь в args
+            if '%(' in str(record.msg):
+                record.args = {key: self._truncate(value) for key, value in record.args.items()}
+            else:
+                record.args = (self._truncate(record.args),)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.exc_formatter.formatException(record.exc_info)
+            record.exc_type = record.exc_info[0].__name__ if record.exc_info[0] else None
+            record.exc_info = None
+        record.targets = self.targets
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogListener(QueueListener):
+    """Поток, разбирающий очередь логов: передаёт готовую запись обработчикам её логгера"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.queue_handlers: list[AsyncQueueHandler] = []
+        self.context_filter = None
+
+    def handle(self, record):
+        for handler in record.targets:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def stop(self):
+        """Остановка потока; повторный вызов (atexit после явной остановки) ничего не делает"""
+        if self._thread is not None:
+            super().stop()
+
+    def stats(self) -> dict:
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': sum(handler.dropped for handler in self.queue_handlers),
+            'sampled_out': self.context_filter.sampled_out if self.context_filter else 0,
+        }
+
+
+def install_queue_logging(logger_names, queue_size: int, max_arg_length: int,
+                          info_sample_rate: float = 1.0) -> LogListener:
+    """Перевод логгеров на общую очередь.
+
+    Обработчики каждого логгера из logger_names (после dictConfig) заменяются
+    одним AsyncQueueHandler, сами обработчики вызывает поток LogListener.
+    Event loop только собирает текст записи и добавляет её в очередь.
+    """
+    log_queue = queue.Queue(maxsize=queue_size)
+    listener = LogListener(log_queue)
+    listener.context_filter = UpdateContextFilter(info_sample_rate)
+    for name in logger_names:
+        target = logging.getLogger(name)
+        if not target.handlers:
+            continue
+        queue_handler = AsyncQueueHandler(log_queue, target.handlers, max_arg_length)
+        queue_handler.addFilter(listener.context_filter)
+        listener.queue_handlers.append(queue_handler)
+        target.handlers = [queue_handler]
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from app.config import settings
+from app.services.metrics import registry
+from app.services.update_context import task_update_id
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = registry.histogram('event_loop_lag_seconds', 'Задержка event loop относительно таймера',
+                                      buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+LOOP_STALLS = registry.counter('event_loop_stalls_total', 'Блокировки event loop дольше порога')
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LoopWatchdog:
+    """Измерение задержки event loop и поиск блокирующего кода.
+
+    Корутина в loop каждые interval секунд засыпает и замеряет, насколько
+    позже срока проснулась (lag). Отдельный поток следит за временем
+    последнего пробуждения: если loop не просыпался дольше threshold, поток
+    снимает стек потока loop (sys._current_frames) и пишет в лог вместе с
+    id апдейта текущей задачи. О каждой блокировке сообщается один раз,
+    после её окончания в лог попадает полная длительность.
+    """
+
+    def __init__(self, interval: float, threshold: float, stack_limit: int = 20, window: int = 1000):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self._lags = deque(maxlen=window)
+        self._beat = time.monotonic()
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop = None
+        self._loop_thread_id = None
+        self.stalls = 0
+        self.max_lag = 0.0
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self._beat = now
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def _capture(self) -> tuple:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame)[-self.stack_limit:]) if frame is not None else ''
+        task = asyncio.current_task(self._loop)
+        return stack, task_update_id(task) if task is not None else None, task.get_name() if task else None
+
+    def _watch(self):
+        stalled_since = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked >= self.threshold and stalled_since != beat:
+                stalled_since = beat
+                self.stalls += 1
+                LOOP_STALLS.inc()
+                stack, update_id, task_name = self._capture()
+                logger.warning("Event loop заблокирован %.0f мс, апдейт %s, задача %s. Стек:\n%s",
+                               blocked * 1000, update_id, task_name, stack)
+            elif stalled_since is not None and beat != stalled_since:
+                logger.warning("Event loop разблокирован через %.0f мс",
+                               (beat - stalled_since - self.interval) * 1000)
+                stalled_since = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def stats(self) -> dict:
+        lags = list(self._lags)
+        return {
+            'lag_p50': _percentile(lags, 0.5),
+            'lag_p99': _percentile(lags, 0.99),
+            'lag_max': self.max_lag,
+            'stalls': self.stalls,
+        }
+
+
+loop_watchdog = LoopWatchdog(interval=settings.loop_lag_interval, threshold=settings.loop_lag_threshold)
@@ -0,0 +1,161 @@
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+# Границы гистограмм времени, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+
+    def header(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        return self.header() + [f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+                                for labels, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами: observe - bisect и два сложения"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}  # метки -> [счётчики по границам..., +Inf, сумма]
+
+    def observe(self, value: float, *labels):
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self) -> list:
+        lines = self.header()
+        for labels, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Кроме собственных метрик экспортирует stats() компонентов (очередь
+    апдейтов, outbox, кэши и т.д.): числовые значения становятся gauge
+    bot_<компонент>_<ключ>, вложенные словари - той же метрикой с меткой key.
+    Значения считаются только при запросе /metrics.
+    """
+
+    def __init__(self, prefix: str = 'bot'):
+        self.prefix = prefix
+        self._metrics: list[_Metric] = []
+        self._stats: dict[str, Callable[[], dict]] = {}
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(f'{self.prefix}_{name}', documentation, tuple(labels)))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(f'{self.prefix}_{name}', documentation, tuple(labels)))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(f'{self.prefix}_{name}', documentation, tuple(labels), buckets))
+
+    def register_stats(self, component: str, stats: Callable[[], dict]):
+        self._stats[component] = stats
+
+    def _render_stats(self, component: str, stats: dict) -> list:
+        lines = []
+        for key, value in stats.items():
+            name = f'{self.prefix}_{component}_{key}'
+            if isinstance(value, dict):
+                values = [(item_key, item) for item_key, item in value.items()
+                          if isinstance(item, (int, float)) and not isinstance(item, bool)]
+                if values:
+                    lines.append(f'# TYPE {name} gauge')
+                    lines += [f'{name}{{key="{_escape(item_key)}"}} {_number(item)}' for item_key, item in values]
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines += [f'# TYPE {name} gauge', f'{name} {_number(value)}']
+        return lines
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for component, stats in self._stats.items():
+            try:
+                lines += self._render_stats(component, stats())
+            except Exception as e:
+                lines.append(f'# {component}: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+UPDATES_IN_FLIGHT = registry.gauge('updates_in_flight', 'Апдейты в обработке')
+UPDATE_SECONDS = registry.histogram('update_seconds', 'Время обработки апдейта', ['event'])
+HANDLER_SECONDS = registry.histogram('handler_seconds', 'Время работы хэндлера', ['router', 'handler'])
+HANDLER_ERRORS = registry.counter('handler_errors_total', 'Исключения в хэндлерах', ['router', 'handler'])
+BACKEND_SECONDS = registry.histogram('backend_request_seconds', 'Время запроса к API 1С', ['endpoint', 'method'])
+BACKEND_RESPONSES = registry.counter('backend_responses_total', 'Ответы API 1С', ['endpoint', 'status'])
+REDIS_SECONDS = registry.histogram('redis_command_seconds', 'Время команды Redis', ['command'])
+REDIS_LOOKUPS = registry.counter('redis_lookups_total', 'Чтения задач и справочников из Redis', ['result'])
+TELEGRAM_SECONDS = registry.histogram('telegram_request_seconds', 'Время запроса к Telegram Bot API', ['method'])
+TELEGRAM_RESPONSES = registry.counter('telegram_responses_total', 'Ответы Telegram Bot API', ['method', 'result'])
+STARTUP_SECONDS = registry.gauge('startup_seconds', 'Время запуска приложения по шагам', ['step'])
+TELEGRAM_RETRY_AFTER = registry.counter('telegram_retry_after_seconds_total',
+                                        'Суммарная пауза по RetryAfter', ['method'])
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError, ResponseError
+
+from app.config import settings
+from app.services.fsm_storage import dumps, loads
+from app.services.redis_data import r
+from app.services.redis_scripts import OUTBOX_PARK_SCRIPT, OUTBOX_REQUEUE_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+
+def _entry_order(entry_id) -> tuple:
+    ms, _, seq = str(entry_id).partition('-')
+    return int(ms), int(seq or 0)
+
+
+class Outbox:
+    """Очередь записей в 1С на Redis Stream.
+
+    Хэндлер записывает намерение (enqueue) и сразу отвечает пользователю,
+    запись в API выполняет фоновый потребитель группы GROUP. Запись
+    подтверждается (XACK) только после обработки, поэтому записи упавшего
+    воркера остаются в pending и через claim_idle секунд забираются другим
+    потребителем (XAUTOCLAIM).
+
+    Записи одного чата выполняются по порядку и только под арендой чата
+    (LOCK_PREFIX, продлевается каждые lease/3 секунд): запись, забранная у
+    медленного, но живого потребителя, повторно не выполняется. Неудачная
+    попытка откладывается вместе со следующими записями чата в список
+    PARKED_PREFIX<чат> с экспоненциальной паузой (время повтора - в sorted set
+    RETRY_KEY), новые записи чата до повтора встают в тот же список. После
+    max_attempts попыток пользователю отправляется сообщение об ошибке.
+    Обработчики должны быть идемпотентны: запись может быть доставлена
+    повторно.
+    """
+
+    STREAM = 'outbox:writes'
+    GROUP = 'outbox'
+    RETRY_KEY = 'outbox:retry'
+    PARKED_PREFIX = 'outbox:parked:'
+    LOCK_PREFIX = 'outbox:lock:'
+
+    def __init__(self, max_attempts: int, retry_delay: float, poll_interval: float, claim_idle: float,
+                 lease: float, batch_size: int = 20):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.claim_idle = claim_idle
+        self.lease = lease
+        self.batch_size = batch_size
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._handlers: dict[str, tuple[Callable[[dict], Awaitable], Callable[[dict], str]]] = {}
+        self._task = None
+        self._group_ready = False
+        self._park = r.register_script(OUTBOX_PARK_SCRIPT)
+        self._requeue = r.register_script(OUTBOX_REQUEUE_SCRIPT)
+        self.enqueued = 0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.busy = 0
+
+    def register(self, kind: str, handler: Callable[[dict], Awaitable], failure_text: Callable[[dict], str],
+                 max_duration: float = 0.0):
+        """handler(payload) выполняет запись и бросает исключение при ошибке.
+
+        max_duration - худшее время работы handler: claim_idle не меньше него,
+        чтобы запись медленного потребителя не забиралась без необходимости.
+        """
+        self._handlers[kind] = (handler, failure_text)
+        if max_duration > self.claim_idle:
+            logger.info("Outbox: claim_idle увеличен с %g до %g с по записи %s", self.claim_idle, max_duration, kind)
+            self.claim_idle = max_duration
+
+    async def enqueue(self, kind: str, chat_id: int, payload: dict) -> bool:
+        """Запись намерения в поток; False - Redis недоступен, запись нужно выполнить сразу"""
+        try:
+            await r.xadd(self.STREAM, {'kind': kind, 'chat_id': chat_id, 'attempt': 1, 'payload': dumps(payload)})
+        except Exception as e:
+            logger.warning("Запись %s для %s не сохранена в outbox: %s", kind, chat_id, e)
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _ensure_group(self):
+        try:
+            await r.xgroup_create(self.STREAM, self.GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    async def _requeue_due(self):
+        """Возврат в поток записей чатов, у которых наступило время повтора (атомарно, скриптом)"""
+        await self._requeue(keys=[self.STREAM, self.RETRY_KEY],
+                            args=[time.time(), self.PARKED_PREFIX, self.batch_size])
+
+    async def _park_entries(self, chat_id, entries: list, due: float = None) -> bool:
+        """Перенос записей в список отложенных записей чата; due=None - только если там уже есть записи"""
+        args = [self.GROUP, chat_id, '' if due is None else due]
+        for entry_id, fields in entries:
+            args += [entry_id, json.dumps({key: str(value) for key, value in fields.items()})]
+        parked = await self._park(keys=[self.STREAM, self.RETRY_KEY, f"{self.PARKED_PREFIX}{chat_id}"], args=args)
+        return bool(parked)
+
+    async def _read(self) -> list:
+        response = await r.xreadgroup(self.GROUP, self.consumer, {self.STREAM: '>'}, count=self.batch_size)
+        return response[0][1] if response else []
+
+    async def _claim(self) -> list:
+        response = await r.xautoclaim(self.STREAM, self.GROUP, self.consumer, int(self.claim_idle * 1000),
+                                      count=self.batch_size)
+        return [entry for entry in response[1] if entry[1]]
+
+    async def _exists(self, entry_id: str) -> bool:
+        return bool(await r.xrange(self.STREAM, entry_id, entry_id))
+
+    async def _deliver(self, bot: Bot, entry_id: str, fields: dict) -> bool:
+        """Выполнение записи; False - попытка не удалась и запись отложена для повтора"""
+        kind, chat_id, attempt = fields['kind'], int(fields['chat_id']), int(fields['attempt'])
+        handler, failure_text = self._handlers[kind]
+        payload = loads(fields['payload'])
+        try:
+            await handler(payload)
+            self.delivered += 1
+            logger.info("Запись %s для %s доставлена с попытки %s", kind, chat_id, attempt)
+        except Exception as e:
+            if attempt < self.max_attempts:
+                self.retried += 1
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning("Запись %s для %s не доставлена (%s), повтор %s/%s через %g с",
+                               kind, chat_id, e, attempt, self.max_attempts - 1, delay)
+                return False
+            self.failed += 1
+            logger.error("Запись %s для %s не доставлена после %s попыток: %s. "
+                         "Данные: %s", kind, chat_id, attempt, e, payload)
+            try:
+                await bot.send_message(chat_id, failure_text(payload))
+            except Exception as send_error:
+                logger.error("Не удалось сообщить %s об ошибке записи %s: %s", chat_id, kind, send_error)
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.xack(self.STREAM, self.GROUP, entry_id)
+            pipe.xdel(self.STREAM, entry_id)
+            await pipe.execute()
+        return True
+
+    async def _renew(self, lock: Lock, chat_id, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await lock.reacquire()
+            except LockError:
+                # Чат забрал другой потребитель - прекращаем, чтобы не выполнять записи вдвоём
+                logger.error("Аренда записей чата %s в outbox потеряна, обработка прервана", chat_id)
+                task.cancel()
+                return
+            except Exception as e:
+                logger.warning("Не удалось продлить аренду записей чата %s в outbox: %s", chat_id, e)
+
+    async def _deliver_chat(self, bot: Bot, chat_id, entries: list):
+        # Записи одного пользователя выполняем по порядку и только под арендой чата
+        lock = r.lock(f"{self.LOCK_PREFIX}{chat_id}", timeout=self.lease, blocking=False, thread_local=False)
+        if not await lock.acquire():
+            # Записи чата выполняет другой потребитель; эти останутся в pending и будут забраны повторно
+            self.busy += 1
+            return
+        renewal = asyncio.create_task(self._renew(lock, chat_id, asyncio.current_task()))
+        try:
+            if await self._park_entries(chat_id, entries):
+                return  # У чата есть отложенные записи - новые выполняются после них
+            for index, (entry_id, fields) in enumerate(entries):
+                if not await self._exists(entry_id):
+                    continue  # Уже выполнена потребителем, у которого запись была забрана
+                if not await self._deliver(bot, entry_id, fields):
+                    attempt = int(fields['attempt'])
+                    due = time.time() + self.retry_delay * 2 ** (attempt - 1)
+                    await self._park_entries(chat_id, [(entry_id, {**fields, 'attempt': attempt + 1}),
+                                                       *entries[index + 1:]], due)
+                    return
+        finally:
+            renewal.cancel()
+            try:
+                await lock.release()
+            except LockError:
+                pass
+
+    async def _run(self, bot: Bot):
+        last_claim = 0.0
+        while True:
+            try:
+                if not self._group_ready:
+                    await self._ensure_group()
+                await self._requeue_due()
+                entries = await self._read()
+                if time.monotonic() - last_claim >= self.claim_idle:
+                    last_claim = time.monotonic()
+                    entries += await self._claim()
+                if entries:
+                    by_chat = defaultdict(list)
+                    for entry_id, fields in sorted(entries, key=lambda entry: _entry_order(entry[0])):
+                        by_chat[fields.get('chat_id')].append((entry_id, fields))
+                    results = await asyncio.gather(*(self._deliver_chat(bot, chat_id, chat_entries)
+                                                     for chat_id, chat_entries in by_chat.items()),
+                                                   return_exceptions=True)
+                    for chat_id, result in zip(by_chat, results):
+                        if isinstance(result, BaseException):
+                            # Записи остаются в pending и будут забраны повторно через claim_idle
+                            logger.error("Ошибка обработки записей outbox чата %s: %r", chat_id, result)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._group_ready = False
+                logger.error("Ошибка цикла outbox: %s", e)
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self, bot: Bot):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def depth(self) -> int:
+        return await r.xlen(self.STREAM)
+
+    def stats(self) -> dict:
+        return {'enqueued': self.enqueued, 'delivered': self.delivered, 'retried': self.retried,
+                'failed': self.failed, 'busy': self.busy}
+
+
+outbox = Outbox(
+    max_attempts=settings.outbox_max_attempts,
+    retry_delay=settings.outbox_retry_delay,
+    poll_interval=settings.outbox_poll_interval,
+    claim_idle=settings.outbox_claim_idle,
+    lease=settings.outbox_lease,
+)
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import re
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Части callback_data, которые остаются как есть: короткие числа и служебные слова
+_KEEP_PART = re.compile(r'^(\d{1,4}|[a-z][a-z-]*)$')
+_CALLBACK_SPLIT = re.compile(r'([_:])')
+_SCRUB_FIELDS = {'text', 'caption', 'first_name', 'last_name', 'username', 'title', 'phone_number',
+                 'vcard', 'description'}
+_HASH_FIELDS = {'chat_instance', 'inline_message_id', 'file_id', 'file_unique_id'}
+
+
+class UpdateRecorder:
+    """Запись входящих апдейтов для последующего воспроизведения (benchmarks/replay.py).
+
+    Апдейты обезличиваются: id пользователей и чатов заменяются стабильным
+    HMAC от соли (один пользователь - один id во всех воркерах), текст,
+    имена и телефоны заменяются на 'x' той же длины (команды сохраняются),
+    в callback_data хэшируются все части, кроме коротких чисел и служебных
+    слов. Каждая строка файла - JSON {"t": unix-время, "u": апдейт}.
+    Строки копятся в памяти и дописываются в файл в отдельном потоке раз
+    в flush_interval секунд одной операцией записи, поэтому файл могут
+    разделять несколько воркеров.
+    """
+
+    def __init__(self, path: str, salt: str, flush_interval: float = 1.0, max_buffer: int = 1000):
+        self.path = path
+        self.salt = salt.encode()
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: list[str] = []
+        self._task = None
+        self.recorded = 0
+        self.dropped = 0
+
+    def _digest(self, value) -> str:
+        return hmac.new(self.salt, str(value).encode(), hashlib.sha256).hexdigest()
+
+    def _remap_id(self, value: int) -> int:
+        remapped = int(self._digest(value)[:12], 16) % 10 ** 12 + 1
+        return -remapped if value < 0 else remapped
+
+    def _token(self, value: str) -> str:
+        return f"x{self._digest(value)[:10]}"
+
+    def _callback_data(self, data: str) -> str:
+        parts = _CALLBACK_SPLIT.split(data)
+        return ''.join(part if part in ('_', ':') or _KEEP_PART.match(part) else self._token(part)
+                       for part in parts)
+
+    @staticmethod
+    def _scrub_text(text: str) -> str:
+        if text.startswith('/'):
+            command, _, rest = text.partition(' ')
+            return f"{command} {'x' * len(rest)}" if rest else command
+        return 'x' * len(text)
+
+    def anonymize(self, value, key: str = None):
+        if isinstance(value, dict):
+            return {item_key: self.anonymize(item, item_key) for item_key, item in value.items()}
+        if isinstance(value, list):
+            return [self.anonymize(item, key) for item in value]
+        if key in ('id', 'user_id', 'chat_id', 'sender_chat_id') and isinstance(value, int):
+            return self._remap_id(value)
+        if not isinstance(value, str):
+            return value
+        if key in ('data', 'callback_data'):
+            return self._callback_data(value)
+        if key in _SCRUB_FIELDS:
+            return self._scrub_text(value)
+        if key in _HASH_FIELDS or key == 'id':
+            return self._token(value)
+        return value
+
+    def record(self, update: dict):
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        try:
+            item = {'t': round(time.time(), 3), 'u': self.anonymize(update)}
+            self._buffer.append(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+        except Exception as e:
+            # Запись не должна мешать обработке апдейта
+            self.dropped += 1
+            logger.warning("Апдейт не записан: %s", e)
+            return
+        self.recorded += 1
+
+    def _write(self, lines: list):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            self.dropped += len(lines)
+            logger.error("Не удалось записать %s апдейтов в %s: %s", len(lines), self.path, e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {'recorded': self.recorded, 'dropped': self.dropped, 'buffered': len(self._buffer)}
+
+
+# None - запись апдейтов выключена
+update_recorder = UpdateRecorder(
+    path=settings.record_updates_path,
+    salt=settings.record_salt or settings.bot_token,
+) if settings.record_updates_path else None
@@ -1,32 +1,111 @@
-import redis
+import asyncio
+import json
+import time
 
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
 from redis.commands.json.path import Path
 
 from app.config import settings
+from app.services.metrics import REDIS_LOOKUPS, REDIS_SECONDS
+from app.services.redis_scripts import SAVE_VERSIONED_SCRIPT
 
-r = redis.Redis(
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - started, 'MULTI' if self.is_transaction else 'PIPELINE')
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """Клиент Redis, замеряющий время каждой команды и pipeline (метрика redis_command_seconds)"""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - started, str(args[0]).upper())
+
+    def pipeline(self, transaction: bool = True, shard_hint: str = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# Общий пул соединений для всего приложения: каждый вызов берёт соединение
+# из пула и не блокирует event loop на время обращения к Redis.
+pool = aioredis.ConnectionPool(
     host=settings.redis_host,
     port=settings.redis_port,
     username=settings.redis_username,
     password=settings.redis_password,
     decode_responses=True,
+    max_connections=settings.redis_max_connections,
 )
 
+r = InstrumentedRedis(connection_pool=pool)
 
-def save_to_redis(task_id, data):
+_save_versioned = r.register_script(SAVE_VERSIONED_SCRIPT)
 
-    if r.json().set(task_id, Path.root_path(), data):
-        r.expire(task_id, 180)
+
+async def save_to_redis(task_id, data, ttl: int = None):
+    """Сохранение задачи с TTL за один round trip (JSON.SET и EXPIRE в одном pipeline)"""
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.execute_command('JSON.SET', task_id, Path.root_path(), json.dumps(data))
+        pipe.expire(task_id, ttl or settings.redis_task_ttl)
+        saved, _ = await pipe.execute()
+    if saved:
         return True
 
 
-def get_on_redis(task_id):
-    return r.json().get(task_id)
+async def save_many_to_redis(tasks: dict, version_field: str = None):
+    """Сохранение нескольких задач за один round trip, возвращает количество сохранённых.
+
+    С version_field запись идёт атомарным скриптом: задача не перезаписывается,
+    если в Redis лежит версия новее (сравнение строк поля version_field).
+    """
+    if not tasks:
+        return 0
+    if version_field is not None:
+        args = [settings.redis_task_ttl, version_field]
+        for data in tasks.values():
+            args += [data.get(version_field) or '', json.dumps(data)]
+        return await _save_versioned(keys=list(tasks), args=args)
+    async with r.pipeline(transaction=False) as pipe:
+        for task_id, data in tasks.items():
+            pipe.execute_command('JSON.SET', task_id, Path.root_path(), json.dumps(data))
+            pipe.expire(task_id, settings.redis_task_ttl)
+        result = await pipe.execute()
+    return sum(1 for saved in result[::2] if saved)
+
+
+async def get_on_redis(task_id):
+    value = await r.json().get(task_id)
+    REDIS_LOOKUPS.inc('miss' if value is None else 'hit')
+    return value
+
+
+async def redis_clear(task_id):
+    await r.delete(task_id)
+
+
+async def redis_clear_many(task_ids: list):
+    if task_ids:
+        await r.delete(*task_ids)
+
+
+async def warm_up_redis(connections: int) -> int:
+    """Открытие соединений пула Redis при запуске: параллельные PING берут разные соединения"""
+    results = await asyncio.gather(*(r.ping() for _ in range(connections)), return_exceptions=True)
+    return sum(result is True for result in results)
 
 
-def redis_clear(task_id):
-    r.delete(task_id)
+async def close_redis():
+    """Закрытие клиента и пула соединений Redis"""
+    await r.aclose()
+    await pool.disconnect()
 
 
 if __name__ == '__main__':
-    r.delete('00000000002')
+    asyncio.run(redis_clear('00000000002'))
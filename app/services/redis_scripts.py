@@ -0,0 +1,69 @@
+"""Lua-скрипты Redis; вынесены отдельно от клиента, чтобы их текст можно было
+использовать без подключения к Redis (например, в заглушке для бенчмарков)"""
+
+# Запись JSON-документов, если их версия не старше сохранённой.
+# KEYS - ключи; ARGV[1] - TTL, ARGV[2] - поле версии, дальше пары (версия, JSON)
+# на каждый ключ. Пустая версия записывается всегда. Возвращает число записанных.
+SAVE_VERSIONED_SCRIPT = """
+local ttl = ARGV[1]
+local path = '$.' .. ARGV[2]
+local saved = 0
+for i, key in ipairs(KEYS) do
+    local version = ARGV[i * 2 + 1]
+    local current = redis.call('JSON.GET', key, path)
+    if current then
+        current = cjson.decode(current)[1]
+    end
+    if version == '' or type(current) ~= 'string' or version >= current then
+        redis.call('JSON.SET', key, '$', ARGV[i * 2 + 2])
+        redis.call('EXPIRE', key, ttl)
+        saved = saved + 1
+    end
+end
+return saved
+"""
+
+# Отложенный повтор записей outbox с сохранением порядка чата.
+# KEYS[1] - поток, KEYS[2] - sorted set чатов с отложенными записями (score - время
+# повтора), KEYS[3] - список отложенных записей чата; ARGV[1] - группа, ARGV[2] - чат,
+# ARGV[3] - время повтора или '' (откладывать, только если у чата уже есть отложенные),
+# дальше пары (id записи, поля записи в JSON). Записи переносятся в конец списка
+# чата и удаляются из потока. Возвращает 1, если записи отложены.
+OUTBOX_PARK_SCRIPT = """
+if ARGV[3] == '' then
+    if redis.call('EXISTS', KEYS[3]) == 0 then
+        return 0
+    end
+else
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+end
+for i = 4, #ARGV, 2 do
+    redis.call('RPUSH', KEYS[3], ARGV[i + 1])
+    redis.call('XACK', KEYS[1], ARGV[1], ARGV[i])
+    redis.call('XDEL', KEYS[1], ARGV[i])
+end
+return 1
+"""
+
+# Возврат в поток отложенных записей чатов, у которых наступило время повтора.
+# KEYS[1] - поток, KEYS[2] - sorted set чатов; ARGV[1] - текущее время, ARGV[2] -
+# префикс списков чатов, ARGV[3] - сколько чатов перенести. Записи чата добавляются
+# в поток по порядку и удаляются из списка в одном скрипте, поэтому не теряются при
+# сбое между шагами. Возвращает число перенесённых чатов.
+OUTBOX_REQUEUE_SCRIPT = """
+local chats = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, chat in ipairs(chats) do
+    local parked = ARGV[2] .. chat
+    for _, item in ipairs(redis.call('LRANGE', parked, 0, -1)) do
+        local fields = {}
+        for field, value in pairs(cjson.decode(item)) do
+            fields[#fields + 1] = field
+            fields[#fields + 1] = tostring(value)
+        end
+        redis.call('XADD', KEYS[1], '*', unpack(fields))
+    end
+    redis.call('DEL', parked)
+    redis.call('ZREM', KEYS[2], chat)
+end
+return #chats
+"""
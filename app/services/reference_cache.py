@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from app.services.cache import AsyncTTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCache:
+    """Кэш справочных данных API (результаты, контролёр и т.п.).
+
+    Данные отдаются из памяти и обновляются фоновой задачей раз в
+    refresh_interval. Если API не ответил за load_timeout или вернул ошибку,
+    остаётся последняя удачная копия (не дольше max_age).
+    """
+
+    def __init__(self, refresh_interval: float, load_timeout: float, max_age: float, maxsize: int = 1024):
+        self.refresh_interval = refresh_interval
+        self.load_timeout = load_timeout
+        self._cache = AsyncTTLCache(maxsize=maxsize, ttl=max_age)
+        self._loaders: dict[str, Callable[[Any], Awaitable[Any]]] = {}
+        self._task = None
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def register(self, name: str, loader: Callable[[Any], Awaitable[Any]]):
+        """Регистрация загрузчика справочника; загрузчик должен бросать исключение при ошибке API"""
+        self._loaders[name] = loader
+
+    async def _load(self, key):
+        name, arg = key
+        return await asyncio.wait_for(self._loaders[name](arg), self.load_timeout)
+
+    async def get(self, name: str, arg=None):
+        return await self._cache.get_or_load((name, arg), self._load)
+
+    def peek(self, name: str, arg=None):
+        """Значение из памяти без обращения к API"""
+        return self._cache.get((name, arg))
+
+    async def warm(self, keys: list) -> int:
+        """Параллельная загрузка списка (name, arg), возвращает количество загруженных"""
+        results = await asyncio.gather(*(self.get(name, arg) for name, arg in keys), return_exceptions=True)
+        for (name, arg), result in zip(keys, results):
+            if isinstance(result, BaseException):
+                logger.warning("Справочник %s(%s) не прогрет: %r", name, arg, result)
+        return sum(1 for result in results if not isinstance(result, BaseException))
+
+    async def refresh(self):
+        """Обновление всех загруженных справочников по очереди, чтобы не нагружать API пачкой запросов"""
+        for key in self._cache.keys():
+            try:
+                self._cache.put(key, await self._load(key))
+                self.refreshes += 1
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.warning("Справочник %s(%s) не обновлён, используется последняя копия: %r", *key, e)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), 'refreshes': self.refreshes, 'refresh_errors': self.refresh_errors}
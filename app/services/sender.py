@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from app.config import settings
+from app.services.metrics import TELEGRAM_RESPONSES, TELEGRAM_RETRY_AFTER, TELEGRAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket с резервированием: reserve() сразу списывает токен и возвращает, сколько ждать"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+
+class SendScheduler(BaseRequestMiddleware):
+    """Планировщик исходящих запросов к Telegram.
+
+    Подключается middleware сессии бота, поэтому через него проходят все
+    запросы с chat_id: глобальный и по-чатовый token bucket выдерживают
+    лимиты Telegram, на TelegramRetryAfter чат ставится на паузу и запрос
+    повторяется.
+
+    enqueue() позволяет хэндлеру поставить отправку в очередь и сразу
+    вернуть управление; сообщения одного чата уходят строго по порядку.
+    Вместо метода можно передать фабрику: метод собирается перед самой
+    отправкой, а не для всей пачки сразу. Ошибки отправки логируются
+    планировщиком по чатам.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float, max_retries: int = 3,
+                 max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._chat_buckets: OrderedDict = OrderedDict()
+        self._queues: dict = {}
+        self._workers: dict = {}
+        self.sent = 0
+        self.failed = 0
+        self.retry_afters = 0
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.pop(chat_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chat_buckets[chat_id] = bucket
+        while len(self._chat_buckets) > self.max_chats:
+            self._chat_buckets.popitem(last=False)
+        return bucket
+
+    @staticmethod
+    async def _request(make_request, bot: Bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            TELEGRAM_RESPONSES.inc(name, 'retry_after')
+            TELEGRAM_RETRY_AFTER.inc(name, amount=e.retry_after)
+            raise
+        except Exception as e:
+            TELEGRAM_RESPONSES.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, name)
+        TELEGRAM_RESPONSES.inc(name, 'ok')
+        return result
+
+    async def __call__(self, make_request, bot: Bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await self._request(make_request, bot, method)
+
+        for attempt in range(self.max_retries + 1):
+            bucket = self._chat_bucket(chat_id)
+            delay = max(self.global_bucket.reserve(), bucket.reserve())
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await self._request(make_request, bot, method)
+            except TelegramRetryAfter as e:
+                self.retry_afters += 1
+                bucket.paused_until = time.monotonic() + e.retry_after
+                logger.warning("Telegram RetryAfter %s с для чата %s (%s), попытка %s",
+                               e.retry_after, chat_id, type(method).__name__, attempt + 1)
+                if attempt == self.max_retries:
+                    raise
+
+    def enqueue(self, method, bot: Bot = None, chat_id=None) -> asyncio.Future:
+        """Постановка метода Telegram (или фабрики метода с chat_id) в очередь чата; возвращает future с результатом"""
+        if bot is None:
+            bot = Bot.get_current(no_error=False)
+        if chat_id is None:
+            chat_id = getattr(method, 'chat_id', None)
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(chat_id, deque()).append((bot, method, future))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._drain_chat(chat_id))
+        return future
+
+    async def _drain_chat(self, chat_id):
+        queue = self._queues[chat_id]
+        sent = failed = 0
+        try:
+            while queue:
+                bot, method, future = queue.popleft()
+                try:
+                    if callable(method):
+                        method = method()
+                    result = await bot(method)
+                except Exception as e:
+                    self.failed += 1
+                    failed += 1
+                    logger.error("Не удалось отправить %s в чат %s: %s", type(method).__name__, chat_id, e)
+                    if not future.done():
+                        future.set_exception(e)
+                        future.exception()
+                else:
+                    self.sent += 1
+                    sent += 1
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._workers.pop(chat_id, None)
+            self._queues.pop(chat_id, None)
+            if failed:
+                logger.warning("В чат %s не отправлено %s из %s сообщений очереди", chat_id, failed, sent + failed)
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def drain(self, timeout: float = None):
+        """Ожидание отправки всех поставленных в очередь сообщений"""
+        if self._workers:
+            await asyncio.wait(list(self._workers.values()), timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retry_afters': self.retry_afters,
+            'pending': self.pending(),
+        }
+
+
+send_scheduler = SendScheduler(
+    global_rate=settings.telegram_global_rate,
+    chat_rate=settings.telegram_chat_rate,
+    chat_burst=settings.telegram_chat_burst,
+    max_retries=settings.telegram_max_retries,
+)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from app.config import settings
+from app.database.database import warm_reference_cache
+from app.keyboards.main_menu import set_main_menu, sync_main_menu
+from app.services.api_client import api_client
+from app.services.metrics import STARTUP_SECONDS
+from app.services.redis_data import warm_up_redis
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+async def sync_webhook(bot: Bot, full: bool = False) -> bool:
+    """Установка webhook, только если адрес или allowed_updates в Telegram отличаются; True - webhook изменён"""
+    if not full:
+        info = await bot.get_webhook_info()
+        if info.url == settings.webhook_url and set(info.allowed_updates or ()) == set(ALLOWED_UPDATES):
+            logger.info("Webhook уже установлен, pending_update_count=%s", info.pending_update_count)
+            return False
+    await bot.set_webhook(settings.webhook_url, allowed_updates=ALLOWED_UPDATES)
+    logger.info("Webhook установлен успешно: %s", settings.webhook_url)
+    return True
+
+
+async def sync_webhook_with_retries(bot: Bot, full: bool = False) -> bool:
+    """sync_webhook с повторами: на RetryAfter ждём retry_after, на сетевые ошибки и 5xx - с удвоением паузы"""
+    attempts = settings.webhook_setup_attempts
+    for attempt in range(1, attempts + 1):
+        try:
+            return await sync_webhook(bot, full=full)
+        except TelegramRetryAfter as e:
+            error, delay = e, e.retry_after
+        except (TelegramNetworkError, TelegramServerError) as e:
+            error, delay = e, settings.webhook_setup_retry_delay * 2 ** (attempt - 1)
+        if attempt == attempts:
+            raise error
+        logger.warning("Webhook не установлен (%s), повтор %s/%s через %g с", error, attempt, attempts - 1, delay)
+        await asyncio.sleep(delay)
+
+
+async def warm_up_telegram(bot: Bot, connections: int) -> int:
+    """Открытие соединений сессии Telegram: параллельные getMe занимают разные соединения"""
+    results = await asyncio.gather(*(bot.get_me() for _ in range(connections)), return_exceptions=True)
+    return sum(not isinstance(result, Exception) for result in results)
+
+
+async def _step(name: str, coro, required: bool = False):
+    """Шаг запуска с замером времени (метрика startup_seconds); ошибка необязательного шага только логируется"""
+    started = time.perf_counter()
+    try:
+        return await coro
+    except Exception as e:
+        if required:
+            raise
+        logger.exception("Ошибка на шаге запуска %s: %s", name, e)
+    finally:
+        STARTUP_SECONDS.set(name, value=time.perf_counter() - started)
+
+
+async def prepare(bot: Bot) -> float:
+    """Запуск: webhook, меню, справочники и прогрев пулов соединений - параллельно.
+
+    В режиме startup_mode=diff webhook и меню сверяются с Telegram и меняются
+    только при отличии, поэтому перезапуск не сбрасывает webhook и обходится
+    без лишних запросов. Возвращает общее время запуска, секунды.
+    """
+    started = time.perf_counter()
+    full = settings.startup_mode == 'full'
+    await asyncio.gather(
+        _step('webhook', sync_webhook_with_retries(bot, full=full), required=True),
+        _step('main_menu', set_main_menu(bot) if full else sync_main_menu(bot)),
+        _step('reference_cache', warm_reference_cache()),
+        _step('api_pool', api_client.warm_up(settings.api_warm_connections)),
+        _step('redis_pool', warm_up_redis(settings.redis_warm_connections)),
+        _step('telegram_pool', warm_up_telegram(bot, settings.telegram_warm_connections)),
+    )
+    elapsed = time.perf_counter() - started
+    STARTUP_SECONDS.set('total', value=elapsed)
+    logger.info("Приложение запущено за %.3f с", elapsed)
+    return elapsed
@@ -0,0 +1,108 @@
+from typing import Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+from app.config import settings, TASK_GROUP, CENSUS
+from app.keyboards.trades_keyboards import create_new_tasks_inline_kb, create_new_tasks_inline_kb_census, \
+     create_types_done_inline_kb
+from app.lexicon.lexicon import TYPES
+from app.services.cache import AsyncTTLCache
+from app.services.utils import clear_date
+
+DEBIT_CARD = 'debit'
+CENSUS_CARD = 'census'
+FORWARD_CARD = 'forward'
+DONE_PROMPT = 'done'
+RESULT_PROMPT = 'result'
+
+_DETAILS = ("<b>Исполнить до:</b>\n{v.deadline}\n"
+            "<b>Автор:</b>\n{v.author}\n"
+            "<b>Контрагент:</b>\n{v.partner}\n"
+            "<b>Основание:</b>\n{v.base}\n"
+            "<b>Комментарий автора:</b>\n{v.comment}")
+
+TEMPLATES = {
+    DEBIT_CARD: "Задача от {v.date}\n\n'{v.group_name}'\n\n" + _DETAILS,
+    CENSUS_CARD: "Задача от {v.date}\n\nСенсус по адресу: '{v.name}'\n\n" + _DETAILS,
+    FORWARD_CARD: "Переадресовать задачу от {v.date}\n\n'{v.name}'\n\n" + _DETAILS,
+    DONE_PROMPT: 'Укажите какое действие было сделано к задаче от {v.date}\n\n"{v.name}"\n',
+    RESULT_PROMPT: "Выберите результат действия к задаче {v.name} от {v.date}\n\n",
+}
+
+
+class TaskView:
+    """Поля задачи, нужные карточкам, разобранные один раз: даты без T/Z, комментарий сенсуса без ссылки"""
+
+    __slots__ = ('number', 'version', 'name', 'date', 'deadline', 'author', 'partner', 'base', 'group',
+                 'group_name', 'comment')
+
+    def __init__(self, task: dict):
+        self.number = task['number']
+        self.version = task.get('edit_date')
+        self.name = task['name']
+        self.date = clear_date(task['date'])
+        self.deadline = clear_date(task['deadline'])
+        self.author = task['author']['name']
+        self.partner = task['partner']['name']
+        self.base = task['base']['name']
+        self.group = task['base']['group']
+        self.group_name = TASK_GROUP.get(self.group, '')
+        comment = task['author_comment']['comment']
+        # У сенсуса в комментарии автора после "_" идёт ссылка на анкету
+        self.comment = comment.split('_')[0] if self.group == CENSUS else comment
+
+
+class TaskCardRenderer:
+    """Текст и клавиатура карточки задачи по шаблону варианта.
+
+    Результат кэшируется по (номер задачи, вариант, версия задачи edit_date):
+    повторный показ той же версии, в том числе при листании сводки, не
+    собирает текст и клавиатуру заново, а изменение задачи в 1С меняет ключ.
+    Задача без edit_date не кэшируется: без версии изменение не заметить.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = AsyncTTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def view(self, task: dict) -> TaskView:
+        version = task.get('edit_date')
+        if version is None:
+            return TaskView(task)
+        key = (task['number'], 'view', version)
+        view = self._cache.get(key)
+        if view is None:
+            view = TaskView(task)
+            self._cache.put(key, view)
+        return view
+
+    @staticmethod
+    def _keyboard(task: dict, variant: str) -> Optional[InlineKeyboardMarkup]:
+        if variant == DEBIT_CARD:
+            return create_new_tasks_inline_kb(task)
+        if variant == CENSUS_CARD:
+            return create_new_tasks_inline_kb_census(task)
+        if variant == DONE_PROMPT:
+            return create_types_done_inline_kb(1, TYPES)
+        return None
+
+    def render(self, task: dict, variant: str) -> tuple:
+        """(текст, клавиатура или None) карточки варианта variant"""
+        version = task.get('edit_date')
+        key = (task['number'], variant, version)
+        card = self._cache.get(key) if version is not None else None
+        if card is not None:
+            self.hits += 1
+            return card
+        self.misses += 1
+        card = TEMPLATES[variant].format(v=self.view(task)), self._keyboard(task, variant)
+        if version is not None:
+            self._cache.put(key, card)
+        return card
+
+    def stats(self) -> dict:
+        return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+task_cards = TaskCardRenderer(maxsize=settings.task_card_cache_size, ttl=settings.task_card_cache_ttl)
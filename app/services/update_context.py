@@ -0,0 +1,37 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Optional
+
+# id апдейта, который обрабатывается в текущем контексте (для логов и диагностики)
+update_id_var: ContextVar[Optional[int]] = ContextVar('update_id', default=None)
+
+# Задача -> id апдейта; контекст чужой задачи недоступен из другого потока,
+# поэтому сторожевой поток event loop ищет апдейт по текущей задаче здесь
+_task_updates: dict = {}
+
+
+def enter_update(update_id: int):
+    """Привязка апдейта к текущей задаче и контексту; возвращает токен для exit_update"""
+    task = asyncio.current_task()
+    if task is not None:
+        _task_updates[task] = update_id
+    return update_id_var.set(update_id)
+
+
+def exit_update(token):
+    task = asyncio.current_task()
+    if task is not None:
+        _task_updates.pop(task, None)
+    update_id_var.reset(token)
+
+
+def task_update_id(task) -> Optional[int]:
+    return _task_updates.get(task)
+
+
+def bind_task(task: asyncio.Future):
+    """Привязка дочерней задачи к апдейту текущего контекста до её завершения"""
+    update_id = update_id_var.get()
+    if update_id is not None:
+        _task_updates[task] = update_id
+        task.add_done_callback(lambda done: _task_updates.pop(done, None))
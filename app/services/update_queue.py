@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_id(update: Update):
+    """Чат, к которому относится апдейт; для апдейтов без чата - id пользователя"""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    return None
+
+
+def _percentile(values: list, percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+class UpdateQueue:
+    """Очередь входящих апдейтов для режима webhook_mode=queue.
+
+    Webhook только кладёт апдейт в очередь и сразу отвечает Telegram.
+    У каждого чата своя очередь апдейтов, в очереди готовых (_ready) чат стоит
+    не больше одного раза, поэтому апдейты одного чата обрабатываются строго
+    по очереди и переходы FSM одного пользователя не гоняются между собой.
+    Чаты разбирает пул из workers воркеров: медленный чат (таймаут 1С,
+    RetryAfter) занимает один воркер и не задерживает остальные чаты.
+    """
+
+    def __init__(self, workers: int, maxsize: int, put_timeout: float, samples: int = 1024):
+        self.workers = workers
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self._chats: dict = {}  # чат -> deque апдейтов; чат есть, пока его апдейты не обработаны
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(maxsize)
+        self._size = 0
+        self._tasks = []
+        self._waits = deque(maxlen=samples)
+        self.enqueued = 0
+        self.processed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.max_wait = 0.0
+
+    async def put(self, update: Update) -> bool:
+        """Постановка апдейта в очередь; False - очередь переполнена, Telegram повторит доставку"""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.put_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Очередь апдейтов переполнена, апдейт %s отклонён", update.update_id)
+            return False
+        chat_id = update_chat_id(update)
+        key = chat_id if chat_id is not None else ('update', update.update_id)
+        updates = self._chats.get(key)
+        if updates is None:
+            updates = self._chats[key] = deque()
+            self._ready.put_nowait(key)
+        updates.append((time.monotonic(), update))
+        self._size += 1
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, dp: Dispatcher, bot: Bot):
+        while True:
+            key = await self._ready.get()
+            updates = self._chats[key]
+            enqueued_at, update = updates.popleft()
+            wait = time.monotonic() - enqueued_at
+            self._waits.append(wait)
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                await dp.feed_update(bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logger.exception("Ошибка при обработке апдейта %s: %s", update.update_id, e)
+            finally:
+                self._size -= 1
+                self._slots.release()
+                # Следующий апдейт чата - в конец очереди готовых, чтобы чаты чередовались
+                if updates:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chats[key]
+                self._ready.task_done()
+
+    def start(self, dp: Dispatcher, bot: Bot):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(dp, bot)) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = None):
+        """Дообработка очереди (не дольше timeout) и остановка воркеров"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь апдейтов не обработана до конца, осталось %s", self.depth())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        waits = list(self._waits)
+        return {
+            'depth': self.depth(),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'wait_p50': _percentile(waits, 50),
+            'wait_p99': _percentile(waits, 99),
+            'wait_max': self.max_wait,
+        }
+
+
+class InflightUpdates:
+    """Апдейты, обрабатываемые внутри запроса webhook (webhook_mode=sync).
+
+    При остановке процесса новые апдейты не принимаются (webhook отвечает 503,
+    Telegram повторит доставку следующему процессу), а начатые дообрабатываются.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.accepting = True
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @contextmanager
+    def track(self):
+        self.count += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.count -= 1
+            if not self.count:
+                self._idle.set()
+
+    async def drain(self, timeout: float = None) -> bool:
+        """Прекращение приёма и ожидание начатых апдейтов (не дольше timeout); False - не дождались"""
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Апдейты webhook не обработаны до конца, осталось %s", self.count)
+            return False
+        return True
+
+
+update_queue = UpdateQueue(
+    workers=settings.update_workers,
+    maxsize=settings.update_queue_size,
+    put_timeout=settings.update_put_timeout,
+)
+inflight_updates = InflightUpdates()
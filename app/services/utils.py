@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import jwt
@@ -5,6 +6,7 @@ import httpx
 # import re
 
 from app.config import settings
+from app.services.update_context import bind_task
 
 logger = logging.getLogger(__name__)
 
@@ -90,12 +92,12 @@ def del_ready_task(chat_id, message_id):
     r = httpx.get(
         f'https://api.telegram.org/bot{settings.bot_token}/deleteMessage?chat_id={chat_id}&message_id={message_id}')
     if r.json()['ok']:
-        logger.info(f"{chat_id}- {r.json()['result']} - "
-                    f"- {message_id} удалено сообщение - 201")
+        logger.info("%s- %s - "
+                    "- %s удалено сообщение - 201", chat_id, r.json()['result'], message_id)
         return True
     else:
-        logger.error(f"{chat_id} - {r.json()['description']}"
-                     f"- не удалено - 400")
+        logger.error("%s - %s"
+                     "- не удалено - 400", chat_id, r.json()['description'])
         return False
 
 
@@ -109,15 +111,33 @@ def update_task_message_id(message_id, task_number):
         f"{settings.api_base_url}task-message-update/", data=update_task)
 
     if r.status_code == 201:
-        logger.info(f"{task_number}- {r.json()['result']} - "
-                    f"- {message_id} обновлено - 201")
+        logger.info("%s- %s - "
+                    "- %s обновлено - 201", task_number, r.json()['result'], message_id)
         return True
     else:
-        logger.error(f"{task_number} - {r.json()}"
-                     f"- {message_id} не обновлено - {r.status_code}")
+        logger.error("%s - %s"
+                     "- %s не обновлено - %s", task_number, r.json(), message_id, r.status_code)
         return False
 
 
+async def run_concurrently(*aws):
+    """Параллельный запуск независимых запросов, результаты в порядке аргументов.
+
+    При первой ошибке остальные запросы отменяются (и дожидаются отмены),
+    исключение пробрасывается вызывающему как есть.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    for task in tasks:
+        bind_task(task)
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
 def token_generator(data):
     code = {'code': data['code']}
     secret, ALGORITHM = data['secret'].split('_')
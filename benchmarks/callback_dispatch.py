@@ -0,0 +1,80 @@
+"""Микробенчмарк: стоимость выбора хэндлера callback_query от числа хэндлеров.
+
+Запуск: python -m benchmarks.callback_dispatch [--handlers 5,20,50,100,200] [--callbacks 20000]
+
+В router регистрируется N хэндлеров с разными префиксами и catch-all в конце,
+затем observer.trigger вызывается с callback_data последнего хэндлера
+(худший случай для перебора) и с неизвестными данными (доходит до catch-all).
+Сравниваются прежняя схема (aiogram Router и Text(startswith=...)), Router с
+фильтрами CallbackRoute и CallbackDispatchRouter с индексом по префиксу.
+Хэндлеры пустые, поэтому время - чистая стоимость маршрутизации.
+"""
+import argparse
+import asyncio
+import time
+import types
+
+from aiogram import Router
+from aiogram.filters import Text
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, User
+
+from app.filters.filters import CallbackRoute
+from app.services.callback_dispatch import CallbackDispatchRouter
+
+
+async def handler(callback: CallbackQuery):
+    return True
+
+
+async def catch_all(callback: CallbackQuery):
+    return False
+
+
+def factory(index: int):
+    return types.new_class(f'Callback{index}', (CallbackData,), {'prefix': f'x{index}'},
+                           lambda namespace: namespace.update({'__annotations__': {'value': str}}))
+
+
+def build(scheme: str, count: int) -> tuple:
+    """Router с count хэндлерами и данные для попадания в последний из них"""
+    router = CallbackDispatchRouter() if scheme == 'dispatch' else Router()
+    for index in range(count):
+        if scheme == 'text':
+            router.callback_query.register(handler, Text(startswith=f'legacy{index}_'))
+        else:
+            router.callback_query.register(handler, CallbackRoute(factory(index), legacy=f'legacy{index}_'))
+    router.callback_query.register(catch_all)
+    last = f'legacy{count - 1}_123' if scheme == 'text' else factory(count - 1)(value='123').pack()
+    return router, last
+
+
+def callback_query(data: str) -> CallbackQuery:
+    return CallbackQuery(id='1', from_user=User(id=1, is_bot=False, first_name='x'), chat_instance='1', data=data)
+
+
+async def measure(router: Router, data: str, callbacks: int) -> float:
+    event = callback_query(data)
+    started = time.perf_counter()
+    for _ in range(callbacks):
+        await router.callback_query.trigger(event)
+    return (time.perf_counter() - started) / callbacks * 1e6
+
+
+async def main(args):
+    schemes = [('text', 'Router + Text'), ('route', 'Router + CallbackRoute'), ('dispatch', 'CallbackDispatchRouter')]
+    print(f"{'хэндлеров':>10} {'схема':>24} {'последний, мкс':>15} {'catch-all, мкс':>15}")
+    for count in args.handlers:
+        for scheme, title in schemes:
+            router, last = build(scheme, count)
+            hit = await measure(router, last, args.callbacks)
+            miss = await measure(router, 'unknown_data', args.callbacks)
+            print(f"{count:>10} {title:>24} {hit:>15.1f} {miss:>15.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--handlers', type=lambda value: [int(item) for item in value.split(',')],
+                        default=[5, 20, 50, 100, 200])
+    parser.add_argument('--callbacks', type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,19 @@
+"""Подготовка окружения для запуска бенчмарков без боевого .env"""
+import os
+
+DEFAULTS = {
+    'BOT_TOKEN': '123456:bench',
+    'LOGS_BOT_TOKEN': '123456:bench-logs',
+    'API_TOKEN': 'bench',
+    'DOMAIN': 'https://bench.local',
+    'API_BASE_URL': 'http://127.0.0.1:1/api/v1/',
+    'ADMIN_ID': '1',
+}
+
+
+def prepare_env(**overrides):
+    """Выставляет переменные окружения до импорта app.config"""
+    for key, value in DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
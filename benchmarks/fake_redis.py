@@ -0,0 +1,584 @@
+"""Локальная замена Redis для бенчмарков.
+
+Минимальный RESP2-сервер на asyncio: строки, JSON.* (значение хранится
+как текст), список, sorted set, stream с группами потребителей, TTL, MULTI/EXEC и pipeline. Задержка `latency` имитирует сетевой
+round trip и добавляется один раз на пачку команд, пришедших одним чтением,
+как у настоящего Redis при pipelining.
+
+Lua не исполняется: EVAL/EVALSHA поддерживают только скрипты, для которых
+в LUA_SCRIPTS зарегистрирована реализация на Python (по тексту скрипта).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import threading
+import time
+
+
+class _SimpleString(str):
+    pass
+
+
+class _Error(str):
+    pass
+
+
+OK = _SimpleString('OK')
+QUEUED = _SimpleString('QUEUED')
+
+
+def _lock_release(server, keys, args):
+    if server._get(keys[0]) != args[0]:
+        return 0
+    return server.cmd_del(keys[0])
+
+
+def _lock_reacquire(server, keys, args):
+    if server._get(keys[0]) != args[0]:
+        return 0
+    return server.cmd_pexpire(keys[0], args[1])
+
+
+def _outbox_park(server, keys, args):
+    group, chat, due = args[0], args[1], args[2]
+    if not due:
+        if not server._alive(keys[2]):
+            return 0
+    else:
+        server.cmd_zadd(keys[1], due, chat)
+    for entry_id, item in zip(args[3::2], args[4::2]):
+        server.cmd_rpush(keys[2], item)
+        server.cmd_xack(keys[0], group, entry_id)
+        server.cmd_xdel(keys[0], entry_id)
+    return 1
+
+
+def _outbox_requeue(server, keys, args):
+    chats = server.cmd_zrangebyscore(keys[1], b'-inf', args[0])[:int(args[2])]
+    for chat in chats:
+        parked = args[1] + chat
+        for item in server.cmd_lrange(parked, 0, -1):
+            fields = [part for field, value in json.loads(item).items()
+                      for part in (field.encode(), str(value).encode())]
+            server.cmd_xadd(keys[0], b'*', *fields)
+        server.cmd_del(parked)
+        server.cmd_zrem(keys[1], chat)
+    return len(chats)
+
+
+def _token_bucket(server, keys, args):
+    from app.middlewares.throttling import take_token
+
+    rate, burst, now, cost = (float(arg) for arg in args)
+    state = server._get(keys[0])
+    tokens, ts = state if state is not None else (burst, now)
+    allowed, tokens = take_token(tokens, ts, now, rate, burst, cost)
+    server._set(keys[0], (tokens, now), (burst - tokens) / rate + 1)
+    return int(allowed)
+
+
+def _save_versioned(server, keys, args):
+    ttl, field = float(args[0]), args[1].decode()
+    saved = 0
+    for i, key in enumerate(keys):
+        version, data = args[2 + i * 2].decode(), args[3 + i * 2]
+        current = server._get(key)
+        current = json.loads(current).get(field) if current is not None else None
+        if not version or not isinstance(current, str) or version >= current:
+            server._set(key, data, ttl)
+            saved += 1
+    return saved
+
+
+def _known_scripts() -> dict:
+    from redis.asyncio.lock import Lock
+    from app.middlewares.throttling import TOKEN_BUCKET_SCRIPT
+    from app.services.redis_scripts import SAVE_VERSIONED_SCRIPT, OUTBOX_PARK_SCRIPT, OUTBOX_REQUEUE_SCRIPT
+
+    return {
+        Lock.LUA_RELEASE_SCRIPT: _lock_release,
+        Lock.LUA_REACQUIRE_SCRIPT: _lock_reacquire,
+        OUTBOX_PARK_SCRIPT: _outbox_park,
+        OUTBOX_REQUEUE_SCRIPT: _outbox_requeue,
+        TOKEN_BUCKET_SCRIPT: _token_bucket,
+        SAVE_VERSIONED_SCRIPT: _save_versioned,
+    }
+
+
+# Текст Lua-скрипта -> функция (server, keys, args)
+LUA_SCRIPTS = {}
+
+
+def _encode(value) -> bytes:
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, _Error):
+        return b'-' + value.encode() + b'\r\n'
+    if isinstance(value, _SimpleString):
+        return b'+' + value.encode() + b'\r\n'
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, float):
+        value = repr(value)
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, (list, tuple)):
+        return b'*%d\r\n' % len(value) + b''.join(_encode(item) for item in value)
+    raise TypeError(f"Неподдерживаемый тип ответа: {type(value)}")
+
+
+def _parse(buffer: bytearray):
+    """Разбор одной команды из буфера, возвращает (args, consumed) или None"""
+    if not buffer:
+        return None
+    end = buffer.find(b'\r\n')
+    if end < 0:
+        return None
+    if buffer[:1] != b'*':
+        return [bytes(part) for part in buffer[:end].split()], end + 2
+    count = int(buffer[1:end])
+    pos = end + 2
+    args = []
+    for _ in range(count):
+        end = buffer.find(b'\r\n', pos)
+        if end < 0:
+            return None
+        length = int(buffer[pos + 1:end])
+        start = end + 2
+        if len(buffer) < start + length + 2:
+            return None
+        args.append(bytes(buffer[start:start + length]))
+        pos = start + length + 2
+    return args, pos
+
+
+def _stream_id(value: bytes) -> tuple:
+    ms, _, seq = value.partition(b'-')
+    return int(ms), int(seq or 0)
+
+
+class _Stream:
+    def __init__(self):
+        self.entries: dict[tuple, list] = {}
+        self.last_id = (0, 0)
+        self.groups: dict[bytes, dict] = {}
+
+    def next_id(self) -> tuple:
+        ms = int(time.time() * 1000)
+        return (ms, 0) if ms > self.last_id[0] else (self.last_id[0], self.last_id[1] + 1)
+
+    @staticmethod
+    def format_id(entry_id: tuple) -> bytes:
+        return b'%d-%d' % entry_id
+
+    def entry(self, entry_id: tuple) -> list:
+        return [self.format_id(entry_id), self.entries.get(entry_id)]
+
+
+class FakeRedisServer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: dict[bytes, object] = {}
+        self.expires: dict[bytes, float] = {}
+        self.commands = 0
+        self.scripts: dict[bytes, object] = {}
+        self.port = None
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    # --- хранилище ---
+
+    def _alive(self, key: bytes) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _get(self, key: bytes):
+        return self.data.get(key) if self._alive(key) else None
+
+    def _set(self, key: bytes, value, ttl: float = None):
+        self.data[key] = value
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl
+
+    # --- команды ---
+
+    def cmd_ping(self, *args):
+        return _SimpleString('PONG') if not args else args[0]
+
+    def cmd_get(self, key):
+        return self._get(key)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        ttl = None
+        if b'EX' in options:
+            ttl = float(options[options.index(b'EX') + 1])
+        if b'PX' in options:
+            ttl = float(options[options.index(b'PX') + 1]) / 1000
+        exists = self._alive(key)
+        if b'NX' in options and exists or b'XX' in options and not exists:
+            return None
+        self._set(key, value, ttl)
+        return OK
+
+    def cmd_setex(self, key, ttl, value):
+        self._set(key, value, float(ttl))
+        return OK
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    cmd_unlink = cmd_del
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    def cmd_expire(self, key, ttl):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + float(ttl)
+        return 1
+
+    def cmd_pexpire(self, key, ttl):
+        return self.cmd_expire(key, float(ttl) / 1000)
+
+    def cmd_ttl(self, key):
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else int(deadline - time.monotonic())
+
+    def cmd_incr(self, key):
+        value = int(self._get(key) or 0) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def cmd_json_set(self, key, path, value, *options):
+        return self.cmd_set(key, value, *options)
+
+    def cmd_json_get(self, key, *paths):
+        return self._get(key)
+
+    def _zset(self, key: bytes) -> dict:
+        zset = self._get(key)
+        if zset is None:
+            zset = {}
+            self._set(key, zset)
+        return zset
+
+    @staticmethod
+    def _score_range(zset: dict, low: bytes, high: bytes) -> list:
+        low, high = float(low), float(high)
+        return sorted((member for member, score in zset.items() if low <= score <= high),
+                      key=lambda member: (zset[member], member))
+
+    def cmd_zadd(self, key, *args):
+        zset = self._zset(key)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        zset = self._get(key) or {}
+        return sum(1 for member in members if zset.pop(member, None) is not None)
+
+    def cmd_zcard(self, key):
+        return len(self._get(key) or {})
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        return self._score_range(self._get(key) or {}, low, high)
+
+    def cmd_zremrangebyscore(self, key, low, high):
+        zset = self._get(key) or {}
+        members = self._score_range(zset, low, high)
+        for member in members:
+            del zset[member]
+        return len(members)
+
+    def cmd_rpush(self, key, *values):
+        items = self._get(key)
+        if items is None:
+            items = []
+            self._set(key, items)
+        items.extend(values)
+        return len(items)
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._get(key) or []
+        start, stop = int(start), int(stop)
+        return items[start:None if stop == -1 else stop + 1]
+
+    def cmd_llen(self, key):
+        return len(self._get(key) or [])
+
+    def _stream(self, key: bytes, create: bool = False):
+        stream = self._get(key)
+        if stream is None and create:
+            stream = _Stream()
+            self._set(key, stream)
+        return stream
+
+    def cmd_xadd(self, key, *args):
+        stream = self._stream(key, create=True)
+        if args[0].upper() == b'MAXLEN':
+            args = args[2:] if args[1] not in (b'~', b'=') else args[3:]
+        entry_id = stream.next_id() if args[0] == b'*' else _stream_id(args[0])
+        stream.entries[entry_id] = list(args[1:])
+        stream.last_id = entry_id
+        return stream.format_id(entry_id)
+
+    def cmd_xlen(self, key):
+        stream = self._stream(key)
+        return len(stream.entries) if stream else 0
+
+    def cmd_xrange(self, key, start, end, *options):
+        stream = self._stream(key)
+        if stream is None:
+            return []
+        low = (0, 0) if start == b'-' else _stream_id(start)
+        high = (float('inf'), 0) if end == b'+' else _stream_id(end)
+        return [stream.entry(entry_id) for entry_id in sorted(stream.entries) if low <= entry_id <= high]
+
+    def cmd_xdel(self, key, *ids):
+        stream = self._stream(key)
+        if stream is None:
+            return 0
+        return sum(1 for entry_id in ids if stream.entries.pop(_stream_id(entry_id), None) is not None)
+
+    def cmd_xgroup(self, subcommand, key, group, *args):
+        if subcommand.upper() != b'CREATE':
+            return _Error("ERR XGROUP subcommand is not supported by fake redis")
+        stream = self._stream(key, create=b'MKSTREAM' in (arg.upper() for arg in args))
+        if stream is None:
+            return _Error("ERR The XGROUP subcommand requires the key to exist")
+        if group in stream.groups:
+            return _Error("BUSYGROUP Consumer Group name already exists")
+        last = stream.last_id if args[0] == b'$' else _stream_id(args[0])
+        stream.groups[group] = {'last': last, 'pending': {}}
+        return OK
+
+    def _group(self, key: bytes, group: bytes):
+        stream = self._stream(key)
+        if stream is None or group not in stream.groups:
+            return None, None
+        return stream, stream.groups[group]
+
+    def cmd_xreadgroup(self, *args):
+        args = list(args)
+        group, consumer = args[1], args[2]
+        count = None
+        if b'COUNT' in (arg.upper() for arg in args):
+            index = [arg.upper() for arg in args].index(b'COUNT')
+            count = int(args[index + 1])
+        streams = args[[arg.upper() for arg in args].index(b'STREAMS') + 1:]
+        keys, ids = streams[:len(streams) // 2], streams[len(streams) // 2:]
+        result = []
+        for key, start in zip(keys, ids):
+            stream, state = self._group(key, group)
+            if stream is None:
+                return _Error(f"NOGROUP No such key '{key.decode()}' or consumer group '{group.decode()}'")
+            if start != b'>':
+                low = _stream_id(start)
+                selected = [entry_id for entry_id in state['pending'] if entry_id > low]
+            else:
+                selected = [entry_id for entry_id in sorted(stream.entries) if entry_id > state['last']]
+            selected = sorted(selected)[:count]
+            if not selected:
+                continue
+            now = time.monotonic()
+            for entry_id in selected:
+                state['pending'][entry_id] = (consumer, now)
+                state['last'] = max(state['last'], entry_id)
+            result.append([key, [stream.entry(entry_id) for entry_id in selected]])
+        return result or None
+
+    def cmd_xack(self, key, group, *ids):
+        stream, state = self._group(key, group)
+        if stream is None:
+            return 0
+        return sum(1 for entry_id in ids if state['pending'].pop(_stream_id(entry_id), None) is not None)
+
+    def cmd_xautoclaim(self, key, group, consumer, min_idle, start, *options):
+        stream, state = self._group(key, group)
+        if stream is None:
+            return _Error(f"NOGROUP No such key '{key.decode()}' or consumer group '{group.decode()}'")
+        count = int(options[1]) if options and options[0].upper() == b'COUNT' else 100
+        now = time.monotonic()
+        low = _stream_id(start)
+        claimed, deleted = [], []
+        for entry_id in sorted(state['pending']):
+            if entry_id < low or now - state['pending'][entry_id][1] < int(min_idle) / 1000:
+                continue
+            if len(claimed) + len(deleted) >= count:
+                return [stream.format_id(entry_id), claimed, deleted]
+            if entry_id in stream.entries:
+                state['pending'][entry_id] = (consumer, now)
+                claimed.append(stream.entry(entry_id))
+            else:
+                del state['pending'][entry_id]
+                deleted.append(stream.format_id(entry_id))
+        return [b'0-0', claimed, deleted]
+
+    def cmd_script(self, subcommand, *args):
+        if subcommand.upper() != b'LOAD':
+            return OK
+        script = args[0].decode()
+        implementation = {**_known_scripts(), **LUA_SCRIPTS}.get(script)
+        if implementation is None:
+            return _Error("ERR script is not supported by fake redis")
+        sha = hashlib.sha1(args[0]).hexdigest().encode()
+        self.scripts[sha] = implementation
+        return sha.decode()
+
+    def cmd_evalsha(self, sha, numkeys, *args):
+        implementation = self.scripts.get(sha)
+        if implementation is None:
+            return _Error("NOSCRIPT No matching script. Please use EVAL.")
+        numkeys = int(numkeys)
+        return implementation(self, list(args[:numkeys]), list(args[numkeys:]))
+
+    def cmd_eval(self, script, numkeys, *args):
+        loaded = self.cmd_script(b'LOAD', script)
+        if isinstance(loaded, _Error):
+            return loaded
+        return self.cmd_evalsha(loaded.encode(), numkeys, *args)
+
+    def cmd_flushall(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return OK
+
+    def cmd_auth(self, *args):
+        return OK
+
+    cmd_select = cmd_client = cmd_watch = cmd_unwatch = cmd_auth
+
+    def execute(self, args: list):
+        self.commands += 1
+        name = args[0].decode().lower().replace('.', '_')
+        handler = getattr(self, f'cmd_{name}', None)
+        if handler is None:
+            return _Error(f"ERR unknown command '{args[0].decode()}'")
+        try:
+            return handler(*args[1:])
+        except (TypeError, ValueError, IndexError) as e:
+            return _Error(f"ERR {e}")
+
+    # --- сеть ---
+
+    async def _handle(self, reader, writer):
+        buffer = bytearray()
+        transaction = None
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                buffer += chunk
+                replies = []
+                while (parsed := _parse(buffer)) is not None:
+                    args, consumed = parsed
+                    del buffer[:consumed]
+                    name = args[0].upper()
+                    if name == b'MULTI':
+                        transaction = []
+                        replies.append(OK)
+                    elif name == b'EXEC' and transaction is not None:
+                        replies.append([self.execute(queued) for queued in transaction])
+                        transaction = None
+                    elif name == b'DISCARD':
+                        transaction = None
+                        replies.append(OK)
+                    elif transaction is not None:
+                        transaction.append(args)
+                        replies.append(QUEUED)
+                    else:
+                        replies.append(self.execute(args))
+                if replies:
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    writer.write(b''.join(_encode(reply) for reply in replies))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def start_in_thread(self, host: str = '127.0.0.1', port: int = 0):
+        """Запуск сервера в отдельном потоке со своим event loop"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start(host, port))
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name='fake-redis', daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop_thread(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+
+def _serve(latency: float, host: str, port: int, ports):
+    async def serve():
+        server = await FakeRedisServer(latency=latency).start(host, port)
+        ports.put(server.port)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_in_process(latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+    """Запуск заглушки в отдельном процессе, чтобы она не делила GIL с измеряемым кодом.
+
+    Возвращает (process, port); остановка — process.terminate().
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(latency, host, port, ports), daemon=True)
+    process.start()
+    return process, ports.get()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Заглушка Redis для бенчмарков')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    _serve(args.latency, args.host, args.port, multiprocessing.SimpleQueue())
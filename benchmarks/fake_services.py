@@ -0,0 +1,232 @@
+"""Заглушки Telegram Bot API и API 1С для нагрузочных тестов.
+
+Одно FastAPI-приложение отвечает на запросы бота к Telegram
+(`/bot<token>/<method>`, подключается через TELEGRAM_API_URL) и к API 1С
+(`/api/v1/...`, подключается через API_BASE_URL). Данные генерируются из
+chat_id и номера задачи, поэтому любой синтетический пользователь
+«зарегистрирован» и имеет задачи. Задержка и доля ошибок задаются отдельно
+для API 1С (ответ 503) и Telegram (ответ 429 с retry_after). Счётчики запросов,
+ошибок и выполненных задач отдаются по `/_stats`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+import socket
+import time
+import zlib
+from collections import Counter
+from urllib.parse import parse_qs
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+API_PREFIX = '/api/v1/'
+TASKS_PER_WORKER = 3
+GROUPS = ('000000001', '000000002')
+
+SUPERVISOR = {
+    'code': 'S0001', 'name': 'Супервайзер', 'chat_id': '2',
+    'head': {'code': 'H0001', 'name': 'Руководитель', 'chat_id': '3'},
+}
+CONTROLLER = {'code': 'C0001', 'name': 'Контролёр', 'chat_id': '4', 'controller': True}
+RESULTS = [
+    {'code': 1, 'name': 'Оплата обещана', 'control_data': True},
+    {'code': 2, 'name': 'Оплачено', 'control_data': False},
+    {'code': 3, 'name': 'Отказ от оплаты', 'control_data': False},
+]
+
+
+def worker(chat_id) -> dict:
+    return {'code': f'W{chat_id}', 'name': f'Торговый {chat_id}', 'chat_id': str(chat_id), 'phone': str(chat_id),
+            'department': 'D0001', 'secret': 'bench-secret_HS256', 'partner': None, 'supervisor': SUPERVISOR}
+
+
+def task_number(chat_id, index: int) -> str:
+    return f'T{chat_id}x{index}'
+
+
+def task(number: str) -> dict:
+    """Задача по номеру; номера не формата task_number (например, из записанного трафика) тоже допустимы"""
+    chat_id, _, index = number[1:].partition('x')
+    if not (number.startswith('T') and chat_id.isdigit() and index.isdigit()):
+        chat_id, index = '0', str(zlib.crc32(number.encode()))
+    return {
+        'number': number,
+        'name': f'Задача {number}',
+        'date': '2026-10-01T09:00:00Z',
+        'deadline': '2026-10-31T18:00:00Z',
+        'edit_date': '2026-10-01T09:00:00Z',
+        'status': 'Новая',
+        'edited': False,
+        'worker': worker(chat_id),
+        'author': {'code': 'A0001', 'name': 'Автор'},
+        'partner': {'code': 'P0001', 'name': 'Контрагент',
+                    'workers': [{'code': 'PW1', 'name': 'Бухгалтер', 'positions': 'Бухгалтер'}]},
+        'author_comment': {'id': 1, 'comment': 'Погасить задолженность'},
+        'worker_comment': {'id': 2, 'comment': ''},
+        'base': {'number': 'B0001', 'name': 'Задолженность', 'group': GROUPS[int(index) % len(GROUPS)]},
+        'result': None,
+    }
+
+
+def message(chat_id, message_id: int, text: str = '') -> dict:
+    return {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': int(chat_id), 'type': 'private'},
+        'from': {'id': 1, 'is_bot': True, 'first_name': 'bot'},
+        'text': text,
+    }
+
+
+async def _payload(request: Request) -> dict:
+    body = await request.body()
+    if request.headers.get('content-type', '').startswith('application/json'):
+        return json.loads(body or b'{}')
+    return {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+
+
+def create_app(latency: float = 0.0, error_rate: float = 0.0, telegram_latency: float = None,
+               telegram_error_rate: float = 0.0, seed: int = None) -> FastAPI:
+    """latency, error_rate - задержка (секунды) и доля ошибок ответов API 1С;
+    telegram_latency, telegram_error_rate - то же для Telegram (по умолчанию задержка как у API)"""
+    app = FastAPI()
+    stats = Counter()
+    ids = itertools.count(1000)
+    rng = random.Random(seed)
+    telegram_latency = latency if telegram_latency is None else telegram_latency
+    # Состояние бота в Telegram: webhook и меню переживают перезапуск приложения
+    webhook = {'url': '', 'allowed_updates': []}
+    commands = []
+
+    async def delay(seconds: float):
+        if seconds:
+            await asyncio.sleep(seconds)
+
+    @app.post('/bot{token}/{method}')
+    async def telegram(token: str, method: str, request: Request):
+        await delay(telegram_latency)
+        data = await _payload(request)
+        stats[f'telegram.{method}'] += 1
+        if telegram_error_rate and rng.random() < telegram_error_rate:
+            stats['telegram.errors'] += 1
+            return JSONResponse({'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                 'parameters': {'retry_after': 1}}, status_code=429)
+        if method in ('sendMessage', 'editMessageText'):
+            result = message(data.get('chat_id', 0), int(data.get('message_id') or next(ids)), data.get('text', ''))
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bench_bot'}
+        elif method == 'getWebhookInfo':
+            result = {**webhook, 'has_custom_certificate': False, 'pending_update_count': 0}
+        elif method in ('setWebhook', 'deleteWebhook'):
+            allowed_updates = data.get('allowed_updates') or '[]'
+            webhook.update(url=data.get('url', ''), allowed_updates=json.loads(allowed_updates)
+                           if isinstance(allowed_updates, str) else allowed_updates)
+            result = True
+        elif method == 'getMyCommands':
+            result = commands
+        elif method == 'setMyCommands':
+            value = data.get('commands') or '[]'
+            commands[:] = json.loads(value) if isinstance(value, str) else value
+            result = True
+        else:
+            result = True
+        return {'ok': True, 'result': result}
+
+    @app.api_route(API_PREFIX + '{path:path}', methods=['GET', 'POST', 'PUT'])
+    async def backend(path: str, request: Request):
+        await delay(latency)
+        parts = [part for part in path.split('/') if part]
+        endpoint = parts[0]
+        params = request.query_params
+        stats[f'api.{request.method}.{endpoint}'] += 1
+        if error_rate and rng.random() < error_rate:
+            stats['api.errors'] += 1
+            return JSONResponse({'detail': 'Service Unavailable'}, status_code=503)
+
+        if request.method == 'GET':
+            if endpoint == 'worker_f':
+                if params.get('controller'):
+                    return [CONTROLLER]
+                return [worker(params.get('chat_id') or params.get('phone'))]
+            if endpoint == 'workers' and len(parts) > 1:
+                return worker(parts[1][1:])
+            if endpoint == 'tasks_f':
+                chat_id = params.get('worker', 'W0')[1:]
+                tasks = [task(task_number(chat_id, index)) for index in range(TASKS_PER_WORKER)]
+                group = params.get('base__group')
+                return [item for item in tasks if group is None or item['base']['group'] == group]
+            if endpoint == 'all-tasks' and len(parts) > 1:
+                return task(parts[1])
+            if endpoint == 'result-data_f':
+                return RESULTS
+            if endpoint == 'result-data' and len(parts) > 1:
+                return next((result for result in RESULTS if str(result['code']) == parts[1]), {})
+            if endpoint == 'partner-worker_f':
+                return task('T0x0')['partner']['workers']
+            return JSONResponse({'detail': 'Not found'}, status_code=404)
+
+        data = await _payload(request)
+        if endpoint == 'tasks' and data.get('status') == 'Выполнено':
+            stats['completed'] += 1
+        if endpoint == 'tasks' and data.get('status') == 'Переадресована':
+            stats['forwarded'] += 1
+        return JSONResponse({'id': next(ids)}, status_code=201)
+
+    @app.get('/_stats')
+    async def get_stats():
+        return dict(stats)
+
+    @app.post('/_reset')
+    async def reset():
+        stats.clear()
+        return {}
+
+    return app
+
+
+def free_port(host: str = '127.0.0.1') -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def _serve(host: str, port: int, options: dict):
+    import uvicorn
+
+    uvicorn.run(create_app(**options), host=host, port=port, log_level='warning', access_log=False)
+
+
+def start_in_process(latency: float = 0.0, host: str = '127.0.0.1', port: int = 0, **options):
+    """Запуск заглушек в отдельном процессе; options - параметры create_app. Возвращает (process, base_url)"""
+    import httpx
+
+    port = port or free_port(host)
+    process = multiprocessing.Process(target=_serve, args=(host, port, {'latency': latency, **options}),
+                                      daemon=True)
+    process.start()
+    base_url = f'http://{host}:{port}'
+    for _ in range(100):
+        try:
+            httpx.get(f'{base_url}/_stats')
+            break
+        except httpx.TransportError:
+            time.sleep(0.1)
+    return process, base_url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Заглушки Telegram Bot API и API 1С')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', type=float, default=None)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    _serve(args.host, args.port, {'latency': args.latency, 'error_rate': args.error_rate,
+                                  'telegram_latency': args.telegram_latency,
+                                  'telegram_error_rate': args.telegram_error_rate})
@@ -0,0 +1,152 @@
+"""Нагрузочный тест: полный сценарий выполнения задачи с задержками и ошибками заглушек.
+
+Запуск: python -m benchmarks.load_flows [--users 2000] [--concurrency 100] [--workers 1]
+                                        [--latency 0.02] [--error-rate 0.0]
+                                        [--telegram-latency 0.01] [--telegram-error-rate 0.0]
+                                        [--mode sync]
+
+Бот запускается как `uvicorn app.main:app` против заглушек Redis, Telegram и
+API 1С. Каждый синтетический пользователь проходит сценарий
+/debit_task -> ok -> contact -> person -> result (с контрольной датой) ->
+календарь -> комментарий, шаги одного пользователя идут последовательно.
+Выводится пропускная способность и p50/p95/p99 времени ответа webhook по
+каждому шагу, а также число задач, записанных в API 1С (при включённом
+outbox запись идёт в фоне, скрипт ждёт её до --settle секунд).
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+from aiogram3_calendar.calendar_types import SimpleCalendarAction, SimpleCalendarCallback
+
+from app.keyboards.callbacks import ContactPerson, ContactType, ResultType, TaskDone
+from benchmarks import fake_redis, fake_services
+from benchmarks.env import DEFAULTS
+from benchmarks.multi_worker import ROOT, callback_update, message_update, percentile, start_bot, wait_completed, \
+    wait_ready
+
+RESULT_WITH_CONTROL_DATE = next(result['code'] for result in fake_services.RESULTS if result['control_data'])
+DEBIT_TASK_INDEX = 1  # задача с группой «Кредитный Контроль» у каждого пользователя заглушки
+
+
+def calendar_day(date: datetime.date) -> str:
+    return SimpleCalendarCallback(act=SimpleCalendarAction.DAY, year=date.year, month=date.month,
+                                  day=date.day).pack()
+
+
+def debit_flow(chat_id: int) -> list:
+    """(шаг, апдейт) сценария выполнения задачи с контрольной датой"""
+    control_date = datetime.date.today() + datetime.timedelta(days=7)
+    return [
+        ('debit_task', message_update(chat_id, '/debit_task')),
+        ('ok', callback_update(chat_id, TaskDone(number=fake_services.task_number(chat_id, DEBIT_TASK_INDEX)).pack())),
+        ('contact', callback_update(chat_id, ContactType(type='phone').pack())),
+        ('person', callback_update(chat_id, ContactPerson(code='PW1').pack())),
+        ('result', callback_update(chat_id, ResultType(code=RESULT_WITH_CONTROL_DATE).pack())),
+        ('calendar', callback_update(chat_id, calendar_day(control_date))),
+        ('comment', message_update(chat_id, 'Оплата обещана до контрольной даты')),
+    ]
+
+
+async def run_load(client: httpx.AsyncClient, webhook_url: str, users: range, concurrency: int) -> dict:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def user(chat_id: int):
+        async with semaphore:
+            for step, update in debit_flow(chat_id):
+                started = time.perf_counter()
+                try:
+                    response = await client.post(webhook_url, json=update)
+                    ok = response.status_code == 200 and response.json().get('status') == 'ok'
+                except httpx.HTTPError:
+                    ok = False
+                latencies[step].append(time.perf_counter() - started)
+                if not ok:
+                    errors[step] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(chat_id) for chat_id in users))
+    return {'elapsed': time.perf_counter() - started, 'latencies': latencies, 'errors': errors}
+
+
+def report(result: dict, stats: dict, users: int):
+    latencies, errors = result['latencies'], result['errors']
+    updates = sum(len(values) for values in latencies.values())
+    print(f"{'шаг':>11} {'апдейтов':>9} {'p50, мс':>8} {'p95, мс':>8} {'p99, мс':>8} {'ошибок':>7}")
+    for step, values in latencies.items():
+        print(f"{step:>11} {len(values):>9} {percentile(values, 0.5) * 1000:>8.1f} "
+              f"{percentile(values, 0.95) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>8.1f} "
+              f"{errors.get(step, 0):>7}")
+    print(f"Апдейтов {updates} за {result['elapsed']:.1f} с - {updates / result['elapsed']:.0f} апдейт/с, "
+          f"сценариев {users / result['elapsed']:.1f}/с")
+    print(f"Выполнено задач в API 1С: {stats.get('completed', 0)}/{users}, ошибок заглушки API "
+          f"{stats.get('api.errors', 0)}, Telegram {stats.get('telegram.errors', 0)}")
+    calls = {key: value for key, value in sorted(stats.items()) if key.startswith(('api.', 'telegram.'))}
+    print('Вызовы заглушек:', ', '.join(f'{key}={value}' for key, value in calls.items()))
+
+
+async def main(args):
+    redis_process, redis_port = fake_redis.start_in_process(latency=args.redis_latency)
+    services_process, services_url = fake_services.start_in_process(
+        latency=args.latency, error_rate=args.error_rate, telegram_latency=args.telegram_latency,
+        telegram_error_rate=args.telegram_error_rate, seed=args.seed)
+    env = {
+        **os.environ, **DEFAULTS,
+        'PYTHONPATH': ROOT,
+        'REDIS_HOST': '127.0.0.1',
+        'REDIS_PORT': str(redis_port),
+        'API_BASE_URL': f'{services_url}{fake_services.API_PREFIX}',
+        'TELEGRAM_API_URL': services_url,
+        'WEBHOOK_MODE': args.mode,
+        'TELEGRAM_GLOBAL_RATE': '100000',
+        'TELEGRAM_CHAT_RATE': '1000',
+        'TELEGRAM_CHAT_BURST': '1000',
+        'THROTTLE_RATE': '1000',
+        'THROTTLE_BURST': '1000',
+        'THROTTLE_DUPLICATE_WINDOW': '0',
+    }
+    port = fake_services.free_port()
+    bot_url = f'http://127.0.0.1:{port}'
+    print(f"Пользователей {args.users}, параллельно {args.concurrency}, воркеров {args.workers}, режим {args.mode}, "
+          f"CPU {os.cpu_count()}")
+    print(f"API 1С: задержка {args.latency * 1000:.1f} мс, ошибок {args.error_rate:.1%}; Telegram: задержка "
+          f"{(args.latency if args.telegram_latency is None else args.telegram_latency) * 1000:.1f} мс, "
+          f"ошибок {args.telegram_error_rate:.1%}")
+    bot_process = start_bot(args.workers, port, env, tempfile.mkdtemp(prefix='bench-bot-'))
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+            await wait_ready(client, f'{bot_url}/health')
+            await client.post(f'{services_url}/_reset')
+            users = range(200000, 200000 + args.users)
+            result = await run_load(client, bot_url + f"/{DEFAULTS['BOT_TOKEN']}", users, args.concurrency)
+            stats = await wait_completed(client, services_url, args.users, args.settle)
+        report(result, stats, args.users)
+    finally:
+        bot_process.terminate()
+        bot_process.wait()
+        services_process.terminate()
+        redis_process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка API 1С, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 503 от API 1С')
+    parser.add_argument('--telegram-latency', type=float, default=None, help='задержка Telegram, секунды')
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0, help='доля ответов 429 от Telegram')
+    parser.add_argument('--redis-latency', type=float, default=0.0005)
+    parser.add_argument('--mode', choices=['sync', 'queue'], default='sync')
+    parser.add_argument('--settle', type=float, default=30.0, help='ожидание фоновой записи в API 1С, секунды')
+    parser.add_argument('--seed', type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,184 @@
+"""Нагрузочный тест: пропускная способность бота в зависимости от числа воркеров uvicorn.
+
+Запуск: python -m benchmarks.multi_worker [--workers 1,2,4] [--users 200] [--concurrency 50]
+                                          [--latency 0.005] [--storage redis] [--settle 30]
+
+Бот запускается как `uvicorn app.main:app --workers N` против заглушек Redis,
+Telegram и API 1С. Каждый синтетический пользователь проходит сценарий
+выполнения задачи (ok -> contact -> person -> result -> комментарий), шаги
+одного пользователя идут последовательно, но попадают к разным воркерам,
+так что без общего хранилища FSM сценарий не доходит до конца.
+Выполненные задачи считает заглушка API; при включённом outbox запись идёт в
+фоне, и скрипт ждёт её до --settle секунд, прежде чем остановить бота.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import fake_redis, fake_services
+from benchmarks.env import DEFAULTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+update_ids = itertools.count(1)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def callback_update(chat_id: int, data: str) -> dict:
+    update_id = next(update_ids)
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': fake_services.message(chat_id, update_id, 'карточка'),
+        },
+    }
+
+
+def message_update(chat_id: int, text: str) -> dict:
+    update_id = next(update_ids)
+    message = fake_services.message(chat_id, update_id, text)
+    message['from'] = {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'}
+    return {'update_id': update_id, 'message': message}
+
+
+def done_flow(chat_id: int) -> list:
+    """Апдейты сценария выполнения задачи без контрольной даты"""
+    return [
+        callback_update(chat_id, f"ok_{fake_services.task_number(chat_id, 0)}"),
+        callback_update(chat_id, 'contact_phone'),
+        callback_update(chat_id, 'person_PW1'),
+        callback_update(chat_id, 'result_2'),
+        message_update(chat_id, 'Оплата поступила'),
+    ]
+
+
+def start_bot(workers: int, port: int, env: dict, cwd: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f'Бот не запустился за {timeout} с')
+
+
+async def wait_completed(client: httpx.AsyncClient, services_url: str, expected: int, timeout: float) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        stats = (await client.get(f'{services_url}/_stats')).json()
+        if stats.get('completed', 0) >= expected or time.monotonic() >= deadline:
+            return stats
+        await asyncio.sleep(0.5)
+
+
+async def run_load(client: httpx.AsyncClient, webhook_url: str, users: range, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def user(chat_id: int):
+        nonlocal errors
+        async with semaphore:
+            for update in done_flow(chat_id):
+                started = time.perf_counter()
+                response = await client.post(webhook_url, json=update)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200 or response.json().get('status') != 'ok':
+                    errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(chat_id) for chat_id in users))
+    elapsed = time.perf_counter() - started
+    return {
+        'elapsed': elapsed,
+        'updates': len(latencies),
+        'errors': errors,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+async def main(args):
+    redis_process, redis_port = fake_redis.start_in_process(latency=args.latency)
+    services_process, services_url = fake_services.start_in_process(latency=args.latency)
+    cwd = tempfile.mkdtemp(prefix='bench-bot-')
+    env = {
+        **os.environ, **DEFAULTS,
+        'PYTHONPATH': ROOT,
+        'REDIS_HOST': '127.0.0.1',
+        'REDIS_PORT': str(redis_port),
+        'API_BASE_URL': f'{services_url}{fake_services.API_PREFIX}',
+        'TELEGRAM_API_URL': services_url,
+        'FSM_STORAGE': args.storage,
+        'WEBHOOK_MODE': 'sync',
+        'TELEGRAM_GLOBAL_RATE': '100000',
+        'TELEGRAM_CHAT_RATE': '1000',
+        'TELEGRAM_CHAT_BURST': '1000',
+        'THROTTLE_RATE': '1000',
+    }
+    webhook_path = f"/{DEFAULTS['BOT_TOKEN']}"
+    first_user = 100000
+    print(f'Пользователей {args.users}, параллельно {args.concurrency}, задержка заглушек {args.latency * 1000:.1f} мс, '
+          f'FSM {args.storage}, CPU {os.cpu_count()}')
+    print(f"{'воркеров':>9} {'апдейт/с':>9} {'p50, мс':>8} {'p99, мс':>8} {'выполнено':>10} {'ошибок':>7}")
+    try:
+        async with httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            for workers in args.workers:
+                port = fake_services.free_port()
+                bot_url = f'http://127.0.0.1:{port}'
+                bot_process = start_bot(workers, port, env, cwd)
+                try:
+                    await wait_ready(client, f'{bot_url}/health')
+                    await client.post(f'{services_url}/_reset')
+                    users = range(first_user, first_user + args.users)
+                    first_user += args.users
+                    result = await run_load(client, bot_url + webhook_path, users, args.concurrency)
+                    # С outbox запись в API 1С идёт в фоне: ждём её до остановки бота
+                    stats = await wait_completed(client, services_url, args.users, args.settle)
+                    completed = stats.get('completed', 0)
+                finally:
+                    bot_process.terminate()
+                    bot_process.wait()
+                print(f"{workers:>9} {result['updates'] / result['elapsed']:>9.0f} {result['p50'] * 1000:>8.1f} "
+                      f"{result['p99'] * 1000:>8.1f} {f'{completed}/{args.users}':>10} {result['errors']:>7}")
+    finally:
+        services_process.terminate()
+        redis_process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=lambda value: [int(x) for x in value.split(',')], default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--storage', choices=['redis', 'memory'], default='redis')
+    parser.add_argument('--settle', type=float, default=30.0, help='ожидание фоновой записи в API 1С, секунды')
+    asyncio.run(main(parser.parse_args()))
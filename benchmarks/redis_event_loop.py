@@ -0,0 +1,124 @@
+"""Бенчмарк: синхронный redis.Redis против асинхронного слоя app.services.redis_data.
+
+Запуск: python -m benchmarks.redis_event_loop [--updates 2000] [--concurrency 50] [--latency 0.001]
+
+Каждый «webhook» повторяет обращения get_task_detail к Redis (промах, запись,
+два чтения). Параллельно работает зонд, который засыпает на 5 мс и меряет,
+насколько позже он просыпается, — это и есть задержка event loop.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.env import prepare_env
+from benchmarks.fake_redis import start_in_process
+
+PROBE_INTERVAL = 0.005
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class LegacyRedis:
+    """Прежняя реализация redis_data на синхронном клиенте"""
+
+    def __init__(self, port: int):
+        import redis
+        from redis.commands.json.path import Path
+
+        self.path = Path.root_path()
+        self.r = redis.Redis(host='127.0.0.1', port=port, decode_responses=True)
+
+    async def save_to_redis(self, task_id, data):
+        if self.r.json().set(task_id, self.path, data):
+            self.r.expire(task_id, 180)
+            return True
+
+    async def get_on_redis(self, task_id):
+        return self.r.json().get(task_id)
+
+
+class AsyncRedis:
+    def __init__(self):
+        from app.services import redis_data
+
+        self.save_to_redis = redis_data.save_to_redis
+        self.get_on_redis = redis_data.get_on_redis
+
+
+async def fake_webhook(layer, number: str):
+    if await layer.get_on_redis(number) is None:
+        await layer.save_to_redis(number, {'number': number, 'name': 'Задача', 'base': {'group': '000000002'}})
+    await layer.get_on_redis(number)
+    await layer.get_on_redis(number)
+
+
+async def lag_probe(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run(layer, updates: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: list = []
+    stop = asyncio.Event()
+
+    async def one(i: int):
+        async with semaphore:
+            await fake_webhook(layer, f"bench-{i % 200:05d}")
+
+    probe = asyncio.create_task(lag_probe(samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(updates)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    return {
+        'throughput': updates / elapsed,
+        'lag_p50': percentile(samples, 0.5) * 1000,
+        'lag_p99': percentile(samples, 0.99) * 1000,
+        'lag_max': max(samples, default=0.0) * 1000,
+        'lag_mean': statistics.fmean(samples) * 1000 if samples else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.001, help='RTT заглушки Redis, секунды')
+    args = parser.parse_args()
+
+    process, port = start_in_process(latency=args.latency)
+    prepare_env(REDIS_HOST='127.0.0.1', REDIS_PORT=port)
+
+    results = {}
+    legacy = LegacyRedis(port)
+    results['sync redis.Redis'] = asyncio.run(run(legacy, args.updates, args.concurrency))
+    legacy.r.flushall()
+
+    async def run_async():
+        from app.services.redis_data import close_redis
+        try:
+            return await run(AsyncRedis(), args.updates, args.concurrency)
+        finally:
+            await close_redis()
+
+    results['redis.asyncio + pool'] = asyncio.run(run_async())
+    process.terminate()
+
+    print(f"updates={args.updates} concurrency={args.concurrency} redis_rtt={args.latency * 1000:.1f}ms")
+    print(f"{'слой':<24}{'webhook/s':>12}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for name, row in results.items():
+        print(f"{name:<24}{row['throughput']:>12.1f}{row['lag_p50']:>12.2f}{row['lag_p99']:>12.2f}{row['lag_max']:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Воспроизведение записанных апдейтов (RECORD_UPDATES_PATH) против заглушек.
+
+Запуск: python -m benchmarks.replay updates.jsonl [--speed 1] [--limit 0] [--latency 0.02]
+                                   [--settle 30] [--output report.json]
+
+Апдейты подаются в dp.feed_webhook_update с исходными интервалами, ускоренными
+в --speed раз (--speed 0 - без пауз, не более --concurrency одновременно).
+Апдейты одного чата, как и в очереди апдейтов бота, обрабатываются строго по
+очереди: следующий ждёт завершения предыдущего, иначе сценарии FSM ломаются.
+Ошибкой считается и исключение, и запись уровня ERROR в логе за время апдейта
+(хэндлеры и глобальный обработчик ошибок исключения не пробрасывают). После
+подачи апдейтов скрипт ждёт фоновые записи outbox до --settle секунд.
+Бот работает в этом процессе со своим lifespan, Redis, Telegram и API 1С
+заменены заглушками. Выводится распределение времени обработки по видам
+апдейтов (команда или префикс callback_data) и число обращений к API 1С,
+Telegram и Redis; с --output тот же отчёт пишется в JSON для сравнения
+прогонов между релизами.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks import fake_services
+from benchmarks.env import prepare_env
+from benchmarks.fake_redis import FakeRedisServer
+from benchmarks.multi_worker import percentile
+
+
+def load(path: str, limit: int = 0) -> list:
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                items.append(json.loads(line))
+                if limit and len(items) >= limit:
+                    break
+    items.sort(key=lambda item: item['t'])
+    return items
+
+
+def update_kind(update: dict) -> str:
+    if 'callback_query' in update:
+        return 'callback:' + re.split(r'[_:]', update['callback_query'].get('data') or '', maxsplit=1)[0]
+    message = update.get('message') or {}
+    text = message.get('text') or ''
+    return text.split()[0] if text.startswith('/') else 'message'
+
+
+def update_chat(update: dict):
+    """Чат апдейта (как update_chat_id очереди апдейтов) по JSON апдейта"""
+    if 'message' in update:
+        return update['message']['chat']['id']
+    callback = update.get('callback_query')
+    if callback is not None:
+        message = callback.get('message')
+        return message['chat']['id'] if message else callback['from']['id']
+    return None
+
+
+class ErrorCounter(logging.Handler):
+    """Счётчик записей ERROR и выше: ошибки хэндлеров, которые не доходят до feed_webhook_update"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def stop_logging():
+    """Остановка потока логов и отправка накопленного, пока заглушка Telegram ещё работает"""
+    from app.config import log_listener
+    if log_listener is not None:
+        log_listener.stop()
+    logging.shutdown()
+
+
+def summary(values: list) -> dict:
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.5) * 1000,
+        'p95': percentile(values, 0.95) * 1000,
+        'p99': percentile(values, 0.99) * 1000,
+        'max': max(values, default=0.0) * 1000,
+    }
+
+
+async def wait_outbox(timeout: float):
+    """Ожидание, пока потребитель outbox не выполнит все записи, в том числе отложенные для повтора"""
+    from app.services.outbox import outbox
+    from app.services.redis_data import r
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not await outbox.depth() and not await r.zcard(outbox.RETRY_KEY):
+            return
+        await asyncio.sleep(0.1)
+
+
+async def replay(items: list, speed: float, concurrency: int, settle: float = 0.0) -> dict:
+    from app.bot import bot, dp
+    from app.main import app, lifespan
+
+    latencies = defaultdict(list)
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    chat_tails: dict = {}  # чат -> задача последнего поданного апдейта чата
+    error_counter = ErrorCounter()
+    logging.getLogger().addHandler(error_counter)
+
+    async def feed(index: int, item: dict, previous: asyncio.Task = None):
+        nonlocal errors
+        update = {**item['u'], 'update_id': index + 1}
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await dp.feed_webhook_update(bot=bot, update=update)
+            except Exception:
+                errors += 1
+            latencies[update_kind(update)].append(time.perf_counter() - started)
+
+    async with lifespan(app):
+        tasks = []
+        started = time.perf_counter()
+        first = items[0]['t'] if items else 0.0
+        for index, item in enumerate(items):
+            if speed:
+                delay = (item['t'] - first) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            chat_id = update_chat(item['u'])
+            task = asyncio.create_task(feed(index, item, chat_tails.get(chat_id)))
+            if chat_id is not None:
+                chat_tails[chat_id] = task
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        await wait_outbox(settle)
+    logging.getLogger().removeHandler(error_counter)
+    return {'elapsed': elapsed, 'latencies': latencies, 'errors': errors, 'error_logs': error_counter.count}
+
+
+async def main(args):
+    items = load(args.path, args.limit)
+    redis_server = FakeRedisServer(latency=args.redis_latency)
+    redis_server.start_in_thread()
+    services_process, services_url = fake_services.start_in_process(
+        latency=args.latency, telegram_latency=args.telegram_latency)
+    prepare_env(
+        REDIS_HOST='127.0.0.1',
+        REDIS_PORT=redis_server.port,
+        API_BASE_URL=f'{services_url}{fake_services.API_PREFIX}',
+        TELEGRAM_API_URL=services_url,
+        RECORD_UPDATES_PATH='',
+        TELEGRAM_GLOBAL_RATE=100000,
+        TELEGRAM_CHAT_RATE=1000,
+        TELEGRAM_CHAT_BURST=1000,
+        THROTTLE_RATE=1000,
+        THROTTLE_BURST=1000,
+    )
+    try:
+        result = await replay(items, args.speed, args.concurrency, args.settle)
+        async with httpx.AsyncClient() as client:
+            calls = (await client.get(f'{services_url}/_stats')).json()
+    finally:
+        stop_logging()
+        services_process.terminate()
+        redis_server.stop_thread()
+
+    latencies = result['latencies']
+    report = {
+        'updates': len(items),
+        'speed': args.speed,
+        'elapsed': result['elapsed'],
+        'errors': result['errors'],
+        'error_logs': result['error_logs'],
+        'total': summary([value for values in latencies.values() for value in values]),
+        'kinds': {kind: summary(values) for kind, values in sorted(latencies.items())},
+        'calls': {key: value for key, value in sorted(calls.items()) if key.startswith(('api.', 'telegram.'))},
+        'redis_commands': redis_server.commands,
+    }
+
+    print(f"Апдейтов {report['updates']} за {report['elapsed']:.1f} с (скорость x{args.speed or 'max'}), "
+          f"исключений {report['errors']}, ошибок в логе {report['error_logs']}")
+    print(f"{'вид':>24} {'апдейтов':>9} {'p50, мс':>8} {'p95, мс':>8} {'p99, мс':>8} {'max, мс':>8}")
+    for kind, row in [*report['kinds'].items(), ('всего', report['total'])]:
+        print(f"{kind:>24} {row['count']:>9} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} "
+              f"{row['max']:>8.1f}")
+    print('Вызовы заглушек:', ', '.join(f'{key}={value}' for key, value in report['calls'].items()))
+    print(f"Команд Redis: {report['redis_commands']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='файл, записанный при RECORD_UPDATES_PATH')
+    parser.add_argument('--speed', type=float, default=1.0, help='ускорение; 0 - без пауз')
+    parser.add_argument('--limit', type=int, default=0, help='воспроизвести первые N апдейтов')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка API 1С, секунды')
+    parser.add_argument('--telegram-latency', type=float, default=None, help='задержка Telegram, секунды')
+    parser.add_argument('--redis-latency', type=float, default=0.0005)
+    parser.add_argument('--settle', type=float, default=30.0, help='ожидание фоновой записи в API 1С, секунды')
+    parser.add_argument('--output', help='JSON-отчёт для сравнения прогонов')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,34 @@
+"""Окружение тестов: переменные без боевого .env и заглушка Redis поднимаются до импорта app"""
+import asyncio
+
+import pytest
+
+from benchmarks.env import prepare_env
+from benchmarks.fake_redis import FakeRedisServer
+
+redis_server = FakeRedisServer().start_in_thread()
+prepare_env(REDIS_HOST='127.0.0.1', REDIS_PORT=redis_server.port)
+
+
+@pytest.fixture
+def fake_redis():
+    """Пустая заглушка Redis на время теста"""
+    redis_server.data.clear()
+    redis_server.expires.clear()
+    yield redis_server
+    redis_server.data.clear()
+    redis_server.expires.clear()
+
+
+@pytest.fixture
+def run():
+    """Запуск корутины в новом event loop; соединения пула Redis закрываются вместе с ним"""
+    from app.services.redis_data import pool
+
+    async def wrapper(coro):
+        try:
+            return await coro
+        finally:
+            await pool.disconnect()
+
+    return lambda coro: asyncio.run(wrapper(coro))
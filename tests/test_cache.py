@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app.services.cache import AsyncTTLCache
+
+
+def test_concurrent_loads_are_coalesced(run):
+    cache = AsyncTTLCache()
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {'number': key}
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load('1', loader) for _ in range(5)))
+
+    assert run(scenario()) == [{'number': '1'}] * 5
+    assert calls == ['1']
+    assert cache.stats() == {'size': 1, 'hits': 0, 'misses': 1, 'coalesced': 4}
+
+
+def test_followers_reload_when_leader_is_cancelled(run):
+    cache = AsyncTTLCache()
+    calls = []
+
+    async def loader(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_load('1', loader))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get_or_load('1', loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert run(scenario()) == [2, 2, 2]
+    assert calls == ['1', '1']
+
+
+def test_followers_get_leader_error_and_nothing_is_cached(run):
+    cache = AsyncTTLCache()
+
+    async def loader(key):
+        await asyncio.sleep(0.01)
+        raise ValueError(key)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load('1', loader) for _ in range(3)), return_exceptions=True)
+
+    results = run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(cache) == 0
+
+
+def test_none_is_not_cached(run):
+    cache = AsyncTTLCache()
+
+    async def loader(key):
+        return None
+
+    assert run(cache.get_or_load('1', loader)) is None
+    assert len(cache) == 0
+
+
+def test_put_keeps_newer_version():
+    cache = AsyncTTLCache(version=lambda value: value['edit_date'])
+    assert cache.put('1', {'edit_date': '2023-02-01'})
+    assert not cache.put('1', {'edit_date': '2023-01-01'})
+    assert cache.get('1') == {'edit_date': '2023-02-01'}
+
+
+def test_invalidate_drops_inflight_result(run):
+    cache = AsyncTTLCache()
+
+    async def loader(key):
+        await asyncio.sleep(0.01)
+        return 'stale'
+
+    async def scenario():
+        task = asyncio.create_task(cache.get_or_load('1', loader))
+        await asyncio.sleep(0)
+        cache.invalidate('1')
+        return await task
+
+    assert run(scenario()) == 'stale'
+    assert cache.get('1') is None
+
+
+def test_expired_value_is_reloaded():
+    cache = AsyncTTLCache(ttl=0)
+    cache.put('1', 'value')
+    assert cache.get('1') is None
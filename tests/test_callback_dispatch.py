@@ -0,0 +1,73 @@
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import CallbackQuery
+
+from app.filters.filters import CallbackRoute
+from app.keyboards.callbacks import DigestPage, ResultType, TaskDone, TaskForward
+from app.services.callback_dispatch import CallbackDispatchRouter
+
+USER = {'id': 5, 'is_bot': False, 'first_name': 'user'}
+
+
+def make_callback(data: str) -> CallbackQuery:
+    return CallbackQuery(id='1', chat_instance='1', data=data, **{'from': USER})
+
+
+def test_route_parses_new_and_legacy_format(run):
+    route = CallbackRoute(TaskDone, legacy='ok_')
+
+    assert run(route(make_callback(TaskDone(number='000000101').pack()))) == \
+        {'callback_data': TaskDone(number='000000101')}
+    assert run(route(make_callback('ok_000000101'))) == {'callback_data': TaskDone(number='000000101')}
+    assert run(route(make_callback('first_forward_000000101'))) is False
+    assert run(route(make_callback(TaskForward(number='1').pack()))) is False
+
+
+def test_route_rejects_broken_data_and_applies_rule(run):
+    route = CallbackRoute(DigestPage, legacy='digest_')
+    assert run(route(make_callback('digest_000000002_3'))) == \
+        {'callback_data': DigestPage(group='000000002', page=3)}
+    assert run(route(make_callback('digest_000000002_x'))) is False
+    assert run(route(make_callback('g:000000002'))) is False
+
+    control = CallbackRoute(ResultType, legacy='result_', rule=lambda data: data.code == '2')
+    assert run(control(make_callback('result_2'))) == {'callback_data': ResultType(code='2')}
+    assert run(control(make_callback(ResultType(code='3').pack()))) is False
+
+
+def make_router() -> CallbackDispatchRouter:
+    router = CallbackDispatchRouter()
+
+    @router.callback_query(CallbackRoute(TaskDone, legacy='ok_'))
+    async def done(callback, callback_data):
+        return f"done {callback_data.number}"
+
+    @router.callback_query(lambda callback: callback.data == 'skip')
+    async def catch_all(callback):
+        return 'catch-all'
+
+    @router.callback_query(CallbackRoute(TaskForward, legacy='first_forward_'))
+    async def forward(callback, callback_data):
+        return f"forward {callback_data.number}"
+
+    return router
+
+
+def test_candidates_keep_registration_order_with_fallback():
+    router = make_router()
+
+    def names(data: str) -> list:
+        return [handler.callback.__name__ for handler in router.callback_query.candidates(data)]
+
+    assert names('d:1') == ['done', 'catch_all']
+    assert names('f:1') == ['catch_all', 'forward']
+    assert names('first_forward_1') == ['catch_all', 'forward']
+    assert names('x') == ['catch_all']
+
+
+def test_trigger_calls_matching_handler(run):
+    router = make_router()
+
+    assert run(router.callback_query.trigger(make_callback('ok_101'))) == 'done 101'
+    assert run(router.callback_query.trigger(make_callback('f:202'))) == 'forward 202'
+    assert run(router.callback_query.trigger(make_callback('skip'))) == 'catch-all'
+    assert run(router.callback_query.trigger(make_callback('unknown'))) is UNHANDLED
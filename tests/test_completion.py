@@ -0,0 +1,138 @@
+import httpx
+import pytest
+
+from app.services import completion
+from app.services.completion import TaskWritePipeline
+from app.services.redis_data import get_on_redis
+
+TASK = {
+    'number': '000000101', 'name': 'Задача 101', 'date': '2023-05-01T00:00:00', 'deadline': '2023-05-10T00:00:00',
+    'edit_date': '2023-05-02T00:00:00', 'worker': {'code': 'W1'}, 'partner': {'code': 'P1'},
+    'author': {'code': 'A1'}, 'author_comment': {'id': 3, 'comment': 'Проверить оплату'},
+    'base': {'number': 'B1', 'group': '000000002'},
+}
+RESULT = {
+    'task_number': '000000101', 'worker_comment': 'Оплата поступила', 'task_type': '1', 'result': '2',
+    'contact_person': 'PW1', 'control_date': None,
+}
+
+
+class FakeApi:
+    """Ответы API по ключу API_METHODS; элемент очереди - статус или исключение"""
+
+    def __init__(self, failures: dict = None):
+        self.failures = {endpoint: list(statuses) for endpoint, statuses in (failures or {}).items()}
+        self.calls = []
+
+    async def request(self, method, endpoint, headers=None, **kwargs):
+        self.calls.append((method, endpoint, headers['Idempotency-Key']))
+        queued = self.failures.get(endpoint)
+        status = queued.pop(0) if queued else 201
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status, json={'id': len(self.calls)})
+
+
+@pytest.fixture
+def api(monkeypatch, fake_redis):
+    task = dict(TASK)
+
+    async def get_task_detail(number):
+        return task if number == task['number'] else None
+
+    def install(failures: dict = None) -> FakeApi:
+        fake = FakeApi(failures)
+        monkeypatch.setattr(completion.api_client, 'request', fake.request)
+        monkeypatch.setattr(completion, 'get_task_detail', get_task_detail)
+        fake.task = task
+        return fake
+
+    return install
+
+
+def test_complete_posts_each_step_with_idempotency_key(run, api):
+    fake = api()
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0, state_ttl=60)
+
+    assert run(pipeline.complete(RESULT)) == {'status': True, 'text': 'Задача Задача 101 выполнена'}
+    assert fake.calls == [
+        ('POST', 'worker_comment', 'completion:000000101:W1:comment'),
+        ('POST', 'result', 'completion:000000101:W1:result'),
+        ('PUT', 'tasks', 'completion:000000101:W1:task'),
+    ]
+    assert run(get_on_redis('completion:000000101:W1')) is None
+
+
+def test_retry_continues_from_failed_step(run, api):
+    fake = api({'result': [400]})
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0, state_ttl=60)
+
+    assert not run(pipeline.complete(RESULT))['status']
+    changed = {**RESULT, 'worker_comment': 'Другой комментарий'}
+    assert run(pipeline.complete(changed))['status']
+    assert [endpoint for method, endpoint, key in fake.calls] == ['worker_comment', 'result', 'result', 'tasks']
+    assert pipeline.stats()['steps_skipped'] == 1
+
+
+def test_server_and_network_errors_are_retried_with_same_key(run, api):
+    fake = api({'worker_comment': [httpx.ConnectError('reset'), 502]})
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0, state_ttl=60)
+
+    assert run(pipeline.complete(RESULT))['status']
+    assert fake.calls[:3] == [('POST', 'worker_comment', 'completion:000000101:W1:comment')] * 3
+    assert pipeline.stats()['retries'] == 2
+
+
+def test_step_fails_after_all_attempts(run, api):
+    fake = api({'author_comment': [503, 503]})
+    pipeline = TaskWritePipeline(attempts=2, retry_delay=0, state_ttl=60)
+
+    res = run(pipeline.forward({'task_number': TASK['number'], 'comment': 'Передаю', 'next_user_id': 'W2'}))
+    assert not res['status']
+    assert len(fake.calls) == 2
+
+
+def test_unknown_task_is_not_written(run, api):
+    fake = api()
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0, state_ttl=60)
+
+    assert run(pipeline.complete({**RESULT, 'task_number': '404'})) == {'status': False, 'text': "Задача не найдена"}
+    assert fake.calls == []
+
+
+def test_next_forward_of_same_task_is_written(run, api):
+    fake = api()
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0, state_ttl=60)
+
+    first = {'task_number': TASK['number'], 'comment': 'Передаю', 'next_user_id': 'W2', 'flow_id': 'a'}
+    assert run(pipeline.forward(first))['status']
+    fake.task['worker'] = {'code': 'W2'}
+    second = {'task_number': TASK['number'], 'comment': 'Дальше', 'next_user_id': 'W3', 'flow_id': 'b'}
+    assert run(pipeline.forward(second))['status']
+
+    assert [key for method, endpoint, key in fake.calls] == [
+        'forward:000000101:a:comment', 'forward:000000101:a:task',
+        'forward:000000101:b:comment', 'forward:000000101:b:task',
+    ]
+    assert pipeline.stats()['steps_skipped'] == 0
+
+
+def test_next_completion_by_other_worker_is_written(run, api):
+    fake = api()
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0, state_ttl=60)
+
+    assert run(pipeline.complete(RESULT))['status']
+    fake.task['worker'] = {'code': 'W2'}
+    assert run(pipeline.complete({**RESULT, 'worker_comment': 'Повторно'}))['status']
+
+    assert len(fake.calls) == 6
+    assert fake.calls[3] == ('POST', 'worker_comment', 'completion:000000101:W2:comment')
+
+
+def test_max_duration_covers_attempts_and_backoff(monkeypatch):
+    monkeypatch.setattr(completion.api_client, 'timeouts', {'all-tasks': 10.0, 'tasks': 5.0})
+    monkeypatch.setattr(completion.api_client, 'default_timeout', 30.0)
+    pipeline = TaskWritePipeline(attempts=3, retry_delay=0.5, state_ttl=60)
+
+    # all-tasks + (3 попытки по таймауту + паузы 0.5 и 1.0) на каждый шаг
+    assert pipeline.max_duration(('author_comment', 'tasks')) == 10.0 + (90.0 + 1.5) + (15.0 + 1.5)
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Message
+
+from app.database import database
+from app.database.database import get_forward_supervisor_controller
+from app.handlers import done_handlers
+from app.keyboards.callbacks import TaskDone
+from app.services.utils import run_concurrently
+
+USER = {'id': 5, 'is_bot': False, 'first_name': 'user'}
+CHAT = {'id': 5, 'type': 'private'}
+
+
+class Sibling:
+    """Долгий запрос, который должен быть отменён при ошибке соседнего"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def __call__(self, *args, **kwargs):
+        self.started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def fail_after(sibling: Sibling, error: Exception):
+    await sibling.started.wait()
+    raise error
+
+
+def test_first_error_cancels_siblings_and_is_raised(run):
+    async def scenario():
+        sibling = Sibling()
+        with pytest.raises(ValueError):
+            await run_concurrently(sibling(), fail_after(sibling, ValueError('API')))
+        return sibling.cancelled
+
+    assert run(scenario())
+
+
+def test_results_keep_argument_order(run):
+    async def value(result, delay):
+        await asyncio.sleep(delay)
+        return result
+
+    assert run(run_concurrently(value('a', 0.02), value('b', 0))) == ['a', 'b']
+
+
+def test_forward_recipients_failure_returns_status_false(run, monkeypatch):
+    sibling = Sibling()
+
+    async def controller(name, arg=None):
+        await fail_after(sibling, ConnectionError('1С недоступна'))
+
+    monkeypatch.setattr(database.reference_cache, 'get', controller)
+    monkeypatch.setattr(database, 'get_workers_number', sibling)
+
+    worker = {'code': 'W1', 'partner': 'P1', 'supervisor': {'head': {}}}
+    assert run(get_forward_supervisor_controller(worker, 'A1')) == {'status': False, 'result': []}
+    assert sibling.cancelled
+
+
+def test_done_press_failure_is_answered_and_state_cleared(run, monkeypatch):
+    answers = []
+    sibling = Sibling()
+
+    async def answer(self, text=None, **kwargs):
+        answers.append(text)
+
+    async def get_task_detail(number):
+        await sibling.started.wait()
+        raise ConnectionError('1С недоступна')
+
+    class SlowStorage(MemoryStorage):
+        async def set_state(self, bot, key, state=None):
+            if state is not None:
+                await sibling()
+            await super().set_state(bot, key, state)
+
+    monkeypatch.setattr(Message, 'answer', answer)
+    monkeypatch.setattr(done_handlers, 'get_task_detail', get_task_detail)
+    storage = SlowStorage()
+    bot = Bot('123456:test')
+    state = FSMContext(bot, storage, StorageKey(bot_id=bot.id, chat_id=5, user_id=5))
+    message = Message(message_id=1, date=0, chat=CHAT, text='карточка', **{'from': USER})
+    callback = CallbackQuery(id='1', chat_instance='1', data='d:101', message=message, **{'from': USER})
+
+    async def scenario():
+        await done_handlers.process_forward_press(callback, TaskDone(number='101'), state)
+        return await state.get_state(), await state.get_data()
+
+    assert run(scenario()) == (None, {})
+    assert sibling.cancelled
+    assert answers == ["Произошла ошибка. Попробуйте позже."]
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import DeleteMessage
+
+from app.services.deferred import DeferredActions
+
+
+class FakeBot:
+    def __init__(self, missing: set = ()):
+        self.deleted = []
+        self.missing = set(missing)
+
+    async def delete_message(self, chat_id, message_id):
+        if message_id in self.missing:
+            raise TelegramBadRequest(DeleteMessage(chat_id=chat_id, message_id=message_id), 'message not found')
+        self.deleted.append((chat_id, message_id))
+        return True
+
+
+def test_only_due_actions_are_taken_in_due_order(run, fake_redis):
+    deferred = DeferredActions()
+
+    async def scenario():
+        await deferred.schedule(deferred.DELETE, 1, 30, delay=-1)
+        await deferred.schedule(deferred.DELETE, 1, 10, delay=-3)
+        await deferred.schedule(deferred.DELETE, 1, 20, delay=-2)
+        await deferred.schedule(deferred.DELETE, 1, 40, delay=60)
+        first, second = await asyncio.gather(deferred._take_due(), deferred._take_due())
+        return first + second
+
+    items = run(scenario())
+    assert [json.loads(item)['message_id'] for item in items] == [10, 20, 30]
+
+
+def test_run_executes_each_action_once(run, fake_redis):
+    deferred = DeferredActions(poll_interval=0.01)
+    bot = FakeBot(missing={2})
+
+    async def scenario():
+        await deferred.schedule(deferred.DELETE, 7, 1, delay=0)
+        await deferred.schedule(deferred.DELETE, 7, 2, delay=0)
+        await deferred.schedule(deferred.DELETE, 7, 3, delay=0.05)
+        deferred.start(bot)
+        await asyncio.sleep(0.15)
+        await deferred.stop()
+
+    run(scenario())
+    assert sorted(bot.deleted) == [(7, 1), (7, 3)]
+    assert deferred.stats() == {'executed': 2, 'failed': 0}
@@ -0,0 +1,85 @@
+import httpx
+import jwt
+import pytest
+
+from app.database import database
+from app.database.database import census_token_cache, get_census_token, get_worker_identity, identity_cache, \
+    put_register
+
+
+class FakeWorkersApi:
+    """workers_f/workers заглушки API: работники с телефоном и chat_id, счётчик запросов по chat_id"""
+
+    def __init__(self):
+        self.workers = [{'code': 'W1', 'phone': '79990000001', 'chat_id': '100', 'secret': 'key_HS256'},
+                        {'code': 'W2', 'phone': '79990000002', 'chat_id': '200', 'secret': 'key_HS256'}]
+        self.lookups = []
+
+    async def get(self, endpoint, path='', params=None, **kwargs):
+        if 'chat_id' in params:
+            self.lookups.append(params['chat_id'])
+            found = [worker for worker in self.workers if worker['chat_id'] == str(params['chat_id'])]
+        else:
+            found = [worker for worker in self.workers if worker['phone'] == params['phone']]
+        return httpx.Response(200, json=[dict(worker) for worker in found], request=httpx.Request('GET', endpoint))
+
+    async def put(self, endpoint, path='', json=None, **kwargs):
+        for changed in json:
+            for worker in self.workers:
+                if worker['code'] == changed['code']:
+                    worker.update(changed)
+                elif worker['chat_id'] == changed['chat_id']:
+                    worker['chat_id'] = None
+        return httpx.Response(201, json=json, request=httpx.Request('PUT', endpoint))
+
+
+@pytest.fixture
+def api(monkeypatch):
+    fake = FakeWorkersApi()
+    monkeypatch.setattr(database.api_client, 'get', fake.get)
+    monkeypatch.setattr(database.api_client, 'put', fake.put)
+    identity_cache.clear()
+    census_token_cache.clear()
+    yield fake
+    identity_cache.clear()
+    census_token_cache.clear()
+
+
+def token_code(token: str) -> str:
+    return jwt.decode(token, 'key', algorithms=['HS256'])['code']
+
+
+def test_identity_is_cached_by_chat_id(run, api):
+    async def scenario():
+        return [await get_worker_identity(100), await get_worker_identity('100'), await get_census_token(100)]
+
+    first, second, token = run(scenario())
+    assert first['code'] == second['code'] == 'W1'
+    assert token_code(token) == 'W1'
+    assert api.lookups == ['100']
+
+
+def test_unregistered_user_is_not_cached(run, api):
+    async def scenario():
+        return [await get_worker_identity(300), await get_census_token(300)]
+
+    assert run(scenario()) == [None, None]
+    assert api.lookups == ['300', '300']
+
+
+def test_registration_drops_new_and_previous_chat_ids(run, api):
+    """Телефон W1 регистрируется из чата 200, где раньше был W2: оба chat_id загружаются заново"""
+    async def identities(*chat_ids):
+        return [((await get_worker_identity(chat_id)) or {}).get('code') for chat_id in chat_ids] + \
+            [token_code(token) if (token := await get_census_token(chat_id)) else None for chat_id in chat_ids]
+
+    async def scenario():
+        before = await identities(100, 200)
+        registered = await put_register('+7-999-000-00-01', '200')
+        return before, registered, await identities(100, 200)
+
+    before, registered, after = run(scenario())
+    assert before == ['W1', 'W2', 'W1', 'W2']
+    assert registered['status']
+    assert after == [None, 'W1', None, 'W1']
+    assert api.lookups == ['100', '200', '100', '200', '100']
@@ -0,0 +1,200 @@
+import json
+import logging
+import queue
+import threading
+
+import httpx
+
+from app.services.log_handlers import AsyncQueueHandler, JsonFormatter, SafeTelegramLogsHandler, \
+    UpdateContextFilter, install_queue_logging
+from app.services.update_context import update_id_var
+
+
+def make_record(msg: str = "Ошибка %s", args=('x',), lineno: int = 10) -> logging.LogRecord:
+    return logging.LogRecord('bot', logging.ERROR, __file__, lineno, msg, args, None)
+
+
+def make_telegram_handler(**kwargs) -> tuple[SafeTelegramLogsHandler, list]:
+    handler = SafeTelegramLogsHandler(**{'min_interval': 0.0, **kwargs})
+    sent = []
+    handler._send = lambda client, log_entry: sent.append(log_entry)
+    return handler, sent
+
+
+def test_repeated_error_is_sent_once_with_summary():
+    handler, sent = make_telegram_handler(group_window=60.0)
+    for arg in ('a', 'b', 'c'):
+        handler.emit(make_record(args=(arg,)))
+    handler.close()
+
+    assert sent[0] == 'Ошибка a'
+    assert sent[1].startswith('<b>x2</b> повтор(ов)')
+    assert sent[1].endswith('Ошибка a')
+    assert len(sent) == 2
+    assert handler.grouped == 2
+
+
+def test_different_call_sites_are_not_grouped():
+    handler, sent = make_telegram_handler()
+    handler.emit(make_record(lineno=10))
+    handler.emit(make_record(lineno=20))
+    handler.close()
+
+    assert sent == ['Ошибка x', 'Ошибка x']
+    assert handler.grouped == 0
+
+
+def test_record_is_dropped_when_queue_is_full():
+    handler = SafeTelegramLogsHandler(queue_size=1, min_interval=0.0)
+    entered, release = threading.Event(), threading.Event()
+    sent = []
+
+    def send(client, log_entry):
+        entered.set()
+        release.wait(5)
+        sent.append(log_entry)
+
+    handler._send = send
+    handler.emit(make_record(lineno=1))
+    assert entered.wait(5)
+    handler.emit(make_record(lineno=2))
+    handler.emit(make_record(lineno=3))
+    release.set()
+    handler.close()
+
+    assert handler.dropped == 1
+    assert len(sent) == 2
+
+
+def test_send_waits_retry_after_and_drops_broken_html():
+    requests = []
+    responses = [
+        httpx.Response(429, json={'ok': False, 'parameters': {'retry_after': 0}}),
+        httpx.Response(400, json={'ok': False}),
+        httpx.Response(200, json={'ok': True}),
+    ]
+
+    def transport(request):
+        requests.append(request.content.decode())
+        return responses.pop(0)
+
+    handler = SafeTelegramLogsHandler(min_interval=0.0)
+    with httpx.Client(transport=httpx.MockTransport(transport)) as client:
+        handler._send(client, '<b>Ошибка</b>')
+
+    assert handler.sent == 1
+    assert len(requests) == 3
+    assert 'parse_mode' in requests[1]
+    assert 'parse_mode' not in requests[2]
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.records = []
+        self.handled = threading.Event()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.handled.set()
+
+
+def queued_logger(name: str, max_arg_length: int = 20, queue_size: int = 10) -> tuple[logging.Logger, queue.Queue]:
+    log_queue = queue.Queue(maxsize=queue_size)
+    target = logging.getLogger(name)
+    target.propagate = False
+    target.setLevel(logging.INFO)
+    target.handlers = [AsyncQueueHandler(log_queue, [], max_arg_length)]
+    return target, log_queue
+
+
+def test_message_is_snapshotted_at_call_time():
+    target, log_queue = queued_logger('tests.snapshot')
+    state = {'a': 1}
+    target.info("state %s", state)
+    state['a'] = 2
+
+    record = log_queue.get_nowait()
+    assert record.msg == "state {'a': 1}"
+    assert record.args is None
+
+
+def test_long_arguments_are_truncated():
+    target, log_queue = queued_logger('tests.truncate', max_arg_length=5)
+    target.info("%s %r %d", 'x' * 12, 'short', 123456789)
+    target.info("%(data)s", {'data': 'y' * 8})
+
+    assert log_queue.get_nowait().msg == "xxxxx... (обрезано 7) 'short' 123456789"
+    assert log_queue.get_nowait().msg == "yyyyy... (обрезано 3)"
+
+
+def test_traceback_is_rendered_before_queueing():
+    target, log_queue = queued_logger('tests.exc')
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        target.exception("Ошибка")
+
+    record = log_queue.get_nowait()
+    assert record.exc_info is None
+    assert record.exc_type == 'ValueError'
+    assert 'ValueError: boom' in record.exc_text
+
+
+def test_record_is_dropped_when_log_queue_is_full():
+    target, log_queue = queued_logger('tests.full', queue_size=1)
+    target.info("first")
+    target.info("second")
+
+    assert log_queue.qsize() == 1
+    assert target.handlers[0].dropped == 1
+
+
+def test_sampling_keeps_whole_update_and_all_warnings():
+    context_filter = UpdateContextFilter(info_sample_rate=0.5)
+    info = logging.LogRecord('bot', logging.INFO, __file__, 1, 'info', None, None)
+    warning = logging.LogRecord('bot', logging.WARNING, __file__, 1, 'warning', None, None)
+
+    kept = {}
+    for update_id in range(200):
+        token = update_id_var.set(update_id)
+        try:
+            decisions = {context_filter.filter(info) for _ in range(3)}
+            assert context_filter.filter(warning)
+        finally:
+            update_id_var.reset(token)
+        assert len(decisions) == 1
+        kept[update_id] = decisions.pop()
+    assert 50 < sum(kept.values()) < 150
+    assert context_filter.sampled_out == 3 * (200 - sum(kept.values()))
+
+
+def test_json_formatter_adds_update_id_and_traceback():
+    record = logging.LogRecord('bot', logging.ERROR, __file__, 7, 'Ошибка %s', ('x',), None)
+    record.update_id = 42
+    record.exc_text = 'Traceback ...'
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['msg'] == 'Ошибка x'
+    assert entry['update_id'] == 42
+    assert entry['exc'] == 'Traceback ...'
+    assert entry['where'].endswith(':7')
+
+
+def test_listener_passes_records_to_logger_handlers_by_level():
+    target = logging.getLogger('tests.pipeline')
+    target.propagate = False
+    target.setLevel(logging.INFO)
+    info_handler, error_handler = CollectingHandler(), CollectingHandler(logging.ERROR)
+    target.handlers = [info_handler, error_handler]
+
+    listener = install_queue_logging(['tests.pipeline'], queue_size=10, max_arg_length=100)
+    try:
+        target.info("info %s", 1)
+        target.error("error %s", 2)
+    finally:
+        listener.stop()
+
+    assert [record.getMessage() for record in info_handler.records] == ['info 1', 'error 2']
+    assert [record.getMessage() for record in error_handler.records] == ['error 2']
+    assert listener.stats() == {'queued': 0, 'dropped': 0, 'sampled_out': 0}
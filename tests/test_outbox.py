@@ -0,0 +1,127 @@
+import asyncio
+
+from app.services.outbox import Outbox
+from app.services.redis_data import r
+
+
+class FakeBot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text):
+        self.messages.append((chat_id, text))
+
+
+def make_outbox(**kwargs) -> Outbox:
+    options = {'max_attempts': 3, 'retry_delay': 0.02, 'poll_interval': 0.01, 'claim_idle': 60, 'lease': 3}
+    return Outbox(**{**options, **kwargs})
+
+
+def register(outbox: Outbox, calls: list, fail: dict = None):
+    """Обработчик 'note' записывает payload['n'] в calls; fail - сколько раз подряд падать на каждом n"""
+    fail = dict(fail or {})
+
+    async def handler(payload):
+        calls.append(payload['n'])
+        if fail.get(payload['n']):
+            fail[payload['n']] -= 1
+            raise RuntimeError(payload['n'])
+
+    outbox.register('note', handler, lambda payload: f"Не записано {payload['n']}")
+
+
+async def run_until(outbox: Outbox, bot, done, timeout: float = 3.0):
+    outbox.start(bot)
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        await outbox.stop()
+
+
+def test_entries_are_delivered_in_order_and_acknowledged(run, fake_redis):
+    outbox, calls = make_outbox(), []
+    register(outbox, calls)
+
+    async def scenario():
+        for n in ('a', 'b', 'c'):
+            assert await outbox.enqueue('note', 5, {'n': n})
+        await run_until(outbox, FakeBot(), lambda: len(calls) == 3)
+        return await outbox.depth()
+
+    assert run(scenario()) == 0
+    assert calls == ['a', 'b', 'c']
+    assert outbox.stats()['delivered'] == 3
+
+
+def test_failed_entry_is_retried_before_next_entries_of_chat(run, fake_redis):
+    outbox, calls = make_outbox(retry_delay=0.2), []
+    register(outbox, calls, fail={'a': 1})
+
+    async def scenario():
+        for n in ('a', 'b'):
+            await outbox.enqueue('note', 5, {'n': n})
+        await outbox.enqueue('note', 6, {'n': 'other'})
+        outbox.start(FakeBot())
+        while not outbox.retried:
+            await asyncio.sleep(0.01)
+        # Пока a и b отложены, новая запись чата встаёт за ними
+        await outbox.enqueue('note', 5, {'n': 'c'})
+        await run_until(outbox, FakeBot(), lambda: outbox.delivered == 4)
+
+    run(scenario())
+    assert [n for n in calls if n != 'other'] == ['a', 'a', 'b', 'c']
+    assert outbox.stats()['retried'] == 1
+
+
+def test_user_is_notified_after_max_attempts(run, fake_redis):
+    outbox, calls, bot = make_outbox(max_attempts=2), [], FakeBot()
+    register(outbox, calls, fail={'a': 5})
+
+    async def scenario():
+        await outbox.enqueue('note', 5, {'n': 'a'})
+        await run_until(outbox, bot, lambda: outbox.failed == 1)
+        return await outbox.depth()
+
+    assert run(scenario()) == 0
+    assert calls == ['a', 'a']
+    assert bot.messages == [(5, "Не записано a")]
+
+
+def test_entry_of_dead_consumer_is_claimed(run, fake_redis):
+    dead, alive, calls = make_outbox(), make_outbox(claim_idle=0.05), []
+    alive.consumer = 'alive'
+    register(alive, calls)
+
+    async def scenario():
+        await dead._ensure_group()
+        await dead.enqueue('note', 5, {'n': 'a'})
+        assert len(await dead._read()) == 1  # прочитал и упал, не подтвердив
+        await asyncio.sleep(0.06)
+        await run_until(alive, FakeBot(), lambda: alive.delivered == 1)
+        return await alive.depth()
+
+    assert run(scenario()) == 0
+    assert calls == ['a']
+
+
+def test_chat_leased_by_other_consumer_is_not_delivered(run, fake_redis):
+    outbox, calls = make_outbox(), []
+    register(outbox, calls)
+
+    async def scenario():
+        await r.set(f"{outbox.LOCK_PREFIX}5", 'other', px=200)
+        await outbox.enqueue('note', 5, {'n': 'a'})
+        await run_until(outbox, FakeBot(), lambda: outbox.busy > 0)
+        return await outbox.depth()
+
+    assert run(scenario()) == 1
+    assert calls == []
+
+
+def test_claim_idle_is_raised_to_max_duration():
+    outbox = make_outbox(claim_idle=60)
+    outbox.register('slow', None, None, max_duration=95.5)
+    outbox.register('fast', None, None, max_duration=10)
+    assert outbox.claim_idle == 95.5
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.services.reference_cache import ReferenceCache
+
+
+def make_cache(**kwargs) -> ReferenceCache:
+    return ReferenceCache(**{'refresh_interval': 0.01, 'load_timeout': 0.05, 'max_age': 60, **kwargs})
+
+
+def test_get_loads_once_and_serves_from_memory(run):
+    cache = make_cache()
+    calls = []
+
+    async def results(group):
+        calls.append(group)
+        return [{'code': '1', 'group': group}]
+
+    cache.register('results', results)
+
+    async def scenario():
+        first = await cache.get('results', 'A')
+        second = await cache.get('results', 'A')
+        return first, second
+
+    first, second = run(scenario())
+    assert first is second
+    assert calls == ['A']
+    assert cache.peek('results', 'A') == first
+    assert cache.peek('results', 'B') is None
+
+
+def test_refresh_keeps_last_copy_on_error(run):
+    cache = make_cache()
+    answers = [['v1'], RuntimeError('API недоступен'), ['v3']]
+
+    async def loader(arg):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    cache.register('controller', loader)
+
+    async def scenario():
+        await cache.get('controller')
+        await cache.refresh()
+        failed = cache.peek('controller')
+        await cache.refresh()
+        return failed, cache.peek('controller')
+
+    assert run(scenario()) == (['v1'], ['v3'])
+    assert cache.stats()['refreshes'] == 1
+    assert cache.stats()['refresh_errors'] == 1
+
+
+def test_slow_loader_times_out(run):
+    cache = make_cache(load_timeout=0.01)
+
+    async def loader(arg):
+        await asyncio.sleep(1)
+
+    cache.register('slow', loader)
+    with pytest.raises(asyncio.TimeoutError):
+        run(cache.get('slow'))
+
+
+def test_warm_counts_loaded_and_background_refresh_runs(run):
+    cache = make_cache()
+    version = 0
+
+    async def loader(arg):
+        nonlocal version
+        if arg == 'bad':
+            raise RuntimeError(arg)
+        version += 1
+        return version
+
+    cache.register('results', loader)
+
+    async def scenario():
+        loaded = await cache.warm([('results', 'A'), ('results', 'bad')])
+        cache.start()
+        await asyncio.sleep(0.05)
+        await cache.stop()
+        return loaded
+
+    assert run(scenario()) == 1
+    assert cache.peek('results', 'A') > 1
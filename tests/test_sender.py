@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from app.services import sender
+from app.services.sender import SendScheduler, TokenBucket
+
+
+class FakeBot:
+    """Вызов метода без сети: ответ - текст сообщения, ошибки - по тексту"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def __call__(self, method):
+        await asyncio.sleep(0.001)
+        if method.text == 'bad':
+            raise TelegramBadRequest(method, 'chat not found')
+        self.sent.append((method.chat_id, method.text))
+        return method.text
+
+
+def make_scheduler(**kwargs) -> SendScheduler:
+    return SendScheduler(**{'global_rate': 1000.0, 'chat_rate': 1000.0, 'chat_burst': 1000.0, **kwargs})
+
+
+def test_token_bucket_refills_with_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sender.time, 'monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=2.0, capacity=2.0)
+
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.5]
+    now[0] += 1.5
+    assert bucket.reserve() == 0.0
+    bucket.paused_until = now[0] + 3.0
+    assert bucket.reserve() == 3.0
+
+
+def test_enqueued_messages_keep_chat_order(run):
+    scheduler, bot = make_scheduler(), FakeBot()
+
+    async def scenario():
+        futures = [scheduler.enqueue(SendMessage(chat_id=chat_id, text=str(index)), bot=bot)
+                   for index in range(3) for chat_id in (1, 2)]
+        return await asyncio.gather(*futures)
+
+    assert run(scenario()) == ['0', '0', '1', '1', '2', '2']
+    assert [text for chat_id, text in bot.sent if chat_id == 1] == ['0', '1', '2']
+    assert scheduler.stats() == {'sent': 6, 'failed': 0, 'retry_afters': 0, 'pending': 0}
+
+
+def test_factory_is_called_right_before_sending(run):
+    scheduler, bot, built = make_scheduler(), FakeBot(), []
+
+    def factory(text):
+        def build():
+            built.append((text, len(bot.sent)))
+            return SendMessage(chat_id=1, text=text)
+        return build
+
+    async def scenario():
+        for text in ('a', 'b', 'c'):
+            scheduler.enqueue(factory(text), bot=bot, chat_id=1)
+        assert built == []
+        await scheduler.drain(timeout=1)
+
+    run(scenario())
+    assert built == [('a', 0), ('b', 1), ('c', 2)]
+
+
+def test_failed_message_does_not_stop_chat_queue(run, caplog):
+    scheduler, bot = make_scheduler(), FakeBot()
+
+    async def scenario():
+        futures = [scheduler.enqueue(SendMessage(chat_id=1, text=text), bot=bot) for text in ('a', 'bad', 'b')]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    first, failed, last = run(scenario())
+    assert (first, last) == ('a', 'b')
+    assert isinstance(failed, TelegramBadRequest)
+    assert scheduler.stats()['failed'] == 1
+    assert "В чат 1 не отправлено 1 из 3 сообщений очереди" in caplog.text
+
+
+def test_retry_after_pauses_chat_and_repeats_request(run):
+    scheduler = make_scheduler(max_retries=2)
+    method = SendMessage(chat_id=1, text='a')
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(asyncio.get_running_loop().time())
+        if len(calls) == 1:
+            raise TelegramRetryAfter(method, 'Too Many Requests', retry_after=0.05)
+        return True
+
+    assert run(scheduler(make_request, None, method)) is True
+    assert calls[1] - calls[0] >= 0.05
+    assert scheduler.stats()['retry_afters'] == 1
+
+
+def test_retry_after_is_raised_after_max_retries(run):
+    scheduler = make_scheduler(max_retries=1)
+    method = SendMessage(chat_id=1, text='a')
+
+    async def make_request(bot, method):
+        raise TelegramRetryAfter(method, 'Too Many Requests', retry_after=0)
+
+    with pytest.raises(TelegramRetryAfter):
+        run(scheduler(make_request, None, method))
+    assert scheduler.stats()['retry_afters'] == 2
+
+
+def test_methods_without_chat_are_not_limited(run):
+    scheduler = make_scheduler(global_rate=0.001, chat_rate=0.001, chat_burst=1.0)
+    scheduler.global_bucket.tokens = 0
+
+    async def make_request(bot, method):
+        return 'me'
+
+    assert run(asyncio.wait_for(scheduler(make_request, None, GetMe()), 0.5)) == 'me'
@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SetWebhook
+from aiogram.types import BotCommand
+
+from app.config import settings
+from app.keyboards.main_menu import sync_main_menu
+from app.lexicon.lexicon import LEXICON_COMMANDS
+from app.services import startup
+from app.services.startup import ALLOWED_UPDATES, sync_webhook, sync_webhook_with_retries
+
+
+class StubBot:
+    """Bot без сети: текущие webhook и меню в Telegram, вызовы set_* и ошибки set_webhook по очереди"""
+
+    def __init__(self, url: str = '', allowed_updates=None, commands=(), errors=()):
+        self.url = url
+        self.allowed_updates = allowed_updates
+        self.commands = list(commands)
+        self.errors = list(errors)
+        self.calls = []
+
+    async def get_webhook_info(self):
+        self.calls.append('getWebhookInfo')
+        return SimpleNamespace(url=self.url, allowed_updates=self.allowed_updates, pending_update_count=0)
+
+    async def set_webhook(self, url, allowed_updates=None):
+        self.calls.append('setWebhook')
+        if self.errors:
+            raise self.errors.pop(0)
+        self.url, self.allowed_updates = url, allowed_updates
+        return True
+
+    async def get_my_commands(self):
+        return self.commands
+
+    async def set_my_commands(self, commands):
+        self.calls.append('setMyCommands')
+        self.commands = commands
+        return True
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(startup.asyncio, 'sleep', sleep)
+    monkeypatch.setattr(settings, 'webhook_setup_attempts', 3)
+    monkeypatch.setattr(settings, 'webhook_setup_retry_delay', 1.0)
+    return sleeps
+
+
+def retry_after(seconds: int) -> TelegramRetryAfter:
+    return TelegramRetryAfter(SetWebhook(url=settings.webhook_url), 'Too Many Requests', retry_after=seconds)
+
+
+def network_error() -> TelegramNetworkError:
+    return TelegramNetworkError(SetWebhook(url=settings.webhook_url), 'Connection reset')
+
+
+def test_matching_webhook_is_not_set_again(run):
+    bot = StubBot(url=settings.webhook_url, allowed_updates=list(reversed(ALLOWED_UPDATES)))
+
+    assert run(sync_webhook(bot)) is False
+    assert bot.calls == ['getWebhookInfo']
+
+
+@pytest.mark.parametrize('url, allowed_updates', [('https://old.local/hook', ALLOWED_UPDATES),
+                                                  (settings.webhook_url, ['message'])])
+def test_different_webhook_is_set_once(run, url, allowed_updates):
+    bot = StubBot(url=url, allowed_updates=allowed_updates)
+
+    assert run(sync_webhook(bot)) is True
+    assert bot.calls == ['getWebhookInfo', 'setWebhook']
+    assert (bot.url, bot.allowed_updates) == (settings.webhook_url, ALLOWED_UPDATES)
+
+
+def test_full_mode_sets_webhook_without_check(run):
+    bot = StubBot(url=settings.webhook_url, allowed_updates=ALLOWED_UPDATES)
+
+    assert run(sync_webhook(bot, full=True)) is True
+    assert bot.calls == ['setWebhook']
+
+
+def test_menu_is_set_only_when_commands_differ(run):
+    current = [BotCommand(command=command.lstrip('/'), description=description)
+               for command, description in LEXICON_COMMANDS.items()]
+    same, changed = StubBot(commands=current), StubBot(commands=current[:-1])
+
+    assert run(sync_main_menu(same)) is False
+    assert run(sync_main_menu(changed)) is True
+    assert same.calls == []
+    assert changed.calls == ['setMyCommands']
+
+
+def test_webhook_is_retried_after_retry_after(run, sleeps):
+    bot = StubBot(errors=[retry_after(7)])
+
+    assert run(sync_webhook_with_retries(bot)) is True
+    assert sleeps == [7]
+    assert bot.calls.count('setWebhook') == 2
+
+
+def test_network_errors_are_retried_with_backoff(run, sleeps):
+    bot = StubBot(errors=[network_error(), network_error()])
+
+    assert run(sync_webhook_with_retries(bot)) is True
+    assert sleeps == [1.0, 2.0]
+
+
+def test_startup_fails_after_last_attempt(run, sleeps):
+    bot = StubBot(errors=[network_error(), retry_after(1), network_error()])
+
+    with pytest.raises(TelegramNetworkError):
+        run(sync_webhook_with_retries(bot))
+    assert sleeps == [1.0, 1]
+    assert bot.calls.count('setWebhook') == 3
+
+
+def test_other_errors_are_not_retried(run, sleeps):
+    bot = StubBot(errors=[ValueError('bad url')])
+
+    with pytest.raises(ValueError):
+        run(sync_webhook_with_retries(bot))
+    assert sleeps == []
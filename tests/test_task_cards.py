@@ -0,0 +1,58 @@
+from app.config import CENSUS, DEBIT
+from app.services.task_cards import CENSUS_CARD, DEBIT_CARD, FORWARD_CARD, TaskCardRenderer
+
+
+def make_task(edit_date='2023-05-02T10:00:00Z', comment='Проверить оплату', group=DEBIT) -> dict:
+    return {
+        'number': '000000101', 'name': 'ООО Ромашка', 'date': '2023-05-01T09:00:00Z',
+        'deadline': '2023-05-10T18:00:00Z', 'edit_date': edit_date,
+        'author': {'code': 'A1', 'name': 'Иванов'}, 'partner': {'code': 'P1', 'name': 'Ромашка'},
+        'base': {'number': 'B1', 'name': 'Договор 1', 'group': group},
+        'author_comment': {'id': 3, 'comment': comment},
+    }
+
+
+def test_debit_card_text_and_buttons():
+    text, keyboard = TaskCardRenderer(maxsize=10, ttl=60).render(make_task(), DEBIT_CARD)
+
+    assert text.startswith("Задача от 2023-05-01 09:00:00\n\n'Кредитный Контроль'\n\n")
+    assert "<b>Исполнить до:</b>\n2023-05-10 18:00:00\n" in text
+    assert text.endswith("<b>Комментарий автора:</b>\nПроверить оплату")
+    buttons = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+    assert buttons == ['d:000000101', 'f:000000101']
+
+
+def test_census_card_hides_link_in_comment():
+    task = make_task(comment='Обойти точку_https://census.local/form', group=CENSUS)
+    text, keyboard = TaskCardRenderer(maxsize=10, ttl=60).render(task, CENSUS_CARD)
+
+    assert "Сенсус по адресу: 'ООО Ромашка'" in text
+    assert text.endswith("Обойти точку")
+    assert keyboard.inline_keyboard[0][0].url == 'https://census.local/form'
+
+
+def test_same_version_is_served_from_cache():
+    renderer = TaskCardRenderer(maxsize=10, ttl=60)
+    first = renderer.render(make_task(), DEBIT_CARD)
+
+    assert renderer.render(make_task(), DEBIT_CARD) is first
+    assert renderer.render(make_task(), FORWARD_CARD)[1] is None
+    assert renderer.stats() == {'size': 3, 'hits': 1, 'misses': 2}
+
+
+def test_new_edit_date_renders_changed_task():
+    renderer = TaskCardRenderer(maxsize=10, ttl=60)
+    renderer.render(make_task(), DEBIT_CARD)
+    text, _ = renderer.render(make_task(edit_date='2023-05-03T10:00:00Z', comment='Новый комментарий'), DEBIT_CARD)
+
+    assert text.endswith("Новый комментарий")
+    assert renderer.stats()['misses'] == 2
+
+
+def test_task_without_edit_date_is_not_cached():
+    renderer = TaskCardRenderer(maxsize=10, ttl=60)
+    renderer.render(make_task(edit_date=None), DEBIT_CARD)
+    text, _ = renderer.render(make_task(edit_date=None, comment='Изменён без версии'), DEBIT_CARD)
+
+    assert text.endswith("Изменён без версии")
+    assert renderer.stats() == {'size': 0, 'hits': 0, 'misses': 2}
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from aiogram.types import CallbackQuery, Message
+
+from app.forms.user_form import DoneTaskForm
+from app.middlewares import throttling
+from app.middlewares.throttling import MemoryThrottleBackend, RedisThrottleBackend, ThrottlingMiddleware, take_token
+from app.services.redis_data import r
+
+USER = {'id': 5, 'is_bot': False, 'first_name': 'user'}
+CHAT = {'id': 5, 'type': 'private'}
+
+
+def make_message(text: str = 'x') -> Message:
+    return Message(message_id=1, date=0, chat=CHAT, text=text, **{'from': USER})
+
+
+def make_callback(data: str) -> CallbackQuery:
+    return CallbackQuery(id='1', chat_instance='1', data=data, **{'from': USER})
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    answers = []
+
+    async def answer(self, text=None, **kwargs):
+        answers.append(text)
+
+    monkeypatch.setattr(CallbackQuery, 'answer', answer)
+    return answers
+
+
+async def handle(event, data):
+    return 'handled'
+
+
+def test_take_token_refills_with_rate_up_to_burst():
+    assert take_token(0.0, ts=0.0, now=0.5, rate=2.0, burst=3.0) == (True, 0.0)
+    assert take_token(0.0, ts=0.0, now=0.25, rate=2.0, burst=3.0) == (False, 0.5)
+    assert take_token(1.0, ts=0.0, now=100.0, rate=2.0, burst=3.0) == (True, 2.0)
+
+
+def test_memory_backend_allows_burst_then_refills(run, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(throttling.time, 'monotonic', lambda: now[0])
+    backend = MemoryThrottleBackend(rate=1.0, burst=2.0)
+
+    async def take(count):
+        return [await backend.allow('5') for _ in range(count)]
+
+    assert run(take(3)) == [True, True, False]
+    now[0] += 1.0
+    assert run(take(2)) == [True, False]
+
+
+def test_memory_backend_keeps_at_most_max_keys(run):
+    backend = MemoryThrottleBackend(rate=1.0, burst=2.0, max_keys=3)
+
+    async def scenario():
+        for user_id in range(10):
+            await backend.allow(str(user_id))
+            await backend.first_seen(f"{user_id}:ok", window=60)
+
+    run(scenario())
+    assert list(backend._buckets) == ['7', '8', '9']
+    assert len(backend._recent) == 3
+
+
+def test_throttled_callback_is_answered_and_dropped(run, answers):
+    middleware = ThrottlingMiddleware(MemoryThrottleBackend(rate=0.001, burst=1.0), duplicate_window=0)
+
+    async def scenario():
+        return [await middleware(handle, make_callback(f'd:{number}'), {}) for number in range(2)]
+
+    assert run(scenario()) == ['handled', None]
+    assert answers == [throttling.LEXICON['throttled']]
+    assert middleware.stats() == {'allowed': 1, 'throttled': 1, 'duplicates': 0}
+
+
+def test_comment_in_exempt_state_is_not_throttled(run):
+    state = DoneTaskForm.worker_comment.state
+    middleware = ThrottlingMiddleware(MemoryThrottleBackend(rate=0.001, burst=1.0), exempt_states=(state,))
+
+    async def scenario():
+        return [
+            await middleware(handle, make_message(), {'raw_state': None}),
+            await middleware(handle, make_message(), {'raw_state': None}),
+            await middleware(handle, make_message('комментарий'), {'raw_state': state}),
+        ]
+
+    assert run(scenario()) == ['handled', None, 'handled']
+
+
+def test_redis_backend_drops_duplicate_click(run, fake_redis, answers):
+    middleware = ThrottlingMiddleware(RedisThrottleBackend(r, rate=10.0, burst=10.0), duplicate_window=1.0)
+
+    async def scenario():
+        results = [await middleware(handle, make_callback(data), {}) for data in ('d:1', 'd:1', 'd:2')]
+        await asyncio.sleep(0)
+        return results
+
+    assert run(scenario()) == ['handled', None, 'handled']
+    assert answers == [None]
+    assert middleware.stats()['duplicates'] == 1
+
+
+def test_storage_error_lets_update_through(run):
+    class BrokenBackend:
+        async def allow(self, key):
+            raise ConnectionError('redis')
+
+    middleware = ThrottlingMiddleware(BrokenBackend())
+    assert run(middleware(handle, make_message(), {})) == 'handled'
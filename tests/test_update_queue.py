@@ -0,0 +1,93 @@
+import asyncio
+
+from aiogram.types import Update
+
+from app.services.update_queue import UpdateQueue
+
+
+def make_update(update_id: int, chat_id: int, text: str = 'x') -> Update:
+    return Update(update_id=update_id, message={
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'user'},
+    })
+
+
+class FakeDispatcher:
+    def __init__(self, delays: dict = None, fail: set = ()):
+        self.delays = delays or {}
+        self.fail = set(fail)
+        self.done = []
+        self.active = {}
+
+    async def feed_update(self, bot, update: Update):
+        chat_id = update.message.chat.id
+        assert not self.active.get(chat_id), "апдейты одного чата обрабатываются параллельно"
+        self.active[chat_id] = True
+        try:
+            await asyncio.sleep(self.delays.get(chat_id, 0))
+            if update.update_id in self.fail:
+                raise RuntimeError(update.update_id)
+            self.done.append(update.update_id)
+        finally:
+            self.active[chat_id] = False
+
+
+def test_chat_updates_are_processed_in_order_one_at_a_time(run):
+    queue = UpdateQueue(workers=4, maxsize=100, put_timeout=0.1)
+    dp = FakeDispatcher(delays={1: 0.01})
+
+    async def scenario():
+        queue.start(dp, bot=None)
+        for update_id in range(1, 6):
+            await queue.put(make_update(update_id, chat_id=1))
+        await queue.stop(timeout=5)
+
+    run(scenario())
+    assert dp.done == [1, 2, 3, 4, 5]
+    assert queue.stats()['processed'] == 5
+    assert queue.depth() == 0
+
+
+def test_slow_chat_does_not_delay_other_chats(run):
+    queue = UpdateQueue(workers=2, maxsize=100, put_timeout=0.1)
+    dp = FakeDispatcher(delays={1: 0.2})
+
+    async def scenario():
+        queue.start(dp, bot=None)
+        await queue.put(make_update(1, chat_id=1))
+        await queue.put(make_update(2, chat_id=1))
+        for update_id in range(3, 9):
+            await queue.put(make_update(update_id, chat_id=update_id))
+        await asyncio.sleep(0.1)
+        fast_done = list(dp.done)
+        await queue.stop(timeout=5)
+        return fast_done
+
+    assert run(scenario()) == [3, 4, 5, 6, 7, 8]
+    assert dp.done[-2:] == [1, 2]
+
+
+def test_full_queue_rejects_update(run):
+    queue = UpdateQueue(workers=1, maxsize=2, put_timeout=0.01)
+
+    async def scenario():
+        return [await queue.put(make_update(update_id, chat_id=1)) for update_id in range(1, 4)]
+
+    assert run(scenario()) == [True, True, False]
+    assert queue.stats()['rejected'] == 1
+
+
+def test_handler_error_does_not_stop_chat(run):
+    queue = UpdateQueue(workers=1, maxsize=10, put_timeout=0.1)
+    dp = FakeDispatcher(fail={1})
+
+    async def scenario():
+        queue.start(dp, bot=None)
+        await queue.put(make_update(1, chat_id=1))
+        await queue.put(make_update(2, chat_id=1))
+        await queue.stop(timeout=5)
+
+    run(scenario())
+    assert dp.done == [2]
+    assert queue.stats()['errors'] == 1